@@ -0,0 +1,126 @@
+(function () {
+    var PAGE_SIZE = 50;
+
+    var log = {
+        url: null,
+        next: null,
+        done: true,
+        loading: false,
+        observer: null
+    };
+
+    function formatPlayer(name, outfit) {
+        if (!name) {
+            return "";
+        }
+        return outfit ? "[" + outfit + "] " + name : name;
+    }
+
+    function createRow(event) {
+        var cells;
+        if (event.event === "Capture") {
+            cells = [event.outfit ? "[" + event.outfit + "]" : "", event.facility || "", "", ""];
+        } else {
+            cells = [
+                formatPlayer(event.attacker, event.attacker_outfit),
+                formatPlayer(event.victim, event.victim_outfit),
+                event.weapon || "",
+                event.event === "Kill" ? (event.attacker_vehicle || "") : (event.vehicle || "")
+            ];
+        }
+        cells.unshift(new Date(event.timestamp * 1000).toLocaleTimeString(), event.event);
+
+        var row = document.createElement("tr");
+        cells.forEach(function (text) {
+            var cell = document.createElement("td");
+            cell.textContent = text;
+            row.appendChild(cell);
+        });
+        return row;
+    }
+
+    function isNearBottom() {
+        var scroll = document.getElementById("event_log_scroll");
+        var sentinel = document.getElementById("event_log_sentinel");
+        return scroll && sentinel &&
+            sentinel.getBoundingClientRect().top <= scroll.getBoundingClientRect().bottom + 200;
+    }
+
+    function load() {
+        if (log.loading || log.done || !log.url) {
+            return;
+        }
+
+        var url = log.url;
+        log.loading = true;
+        fetch(url + (url.indexOf("?") < 0 ? "?" : "&") + "limit=" + PAGE_SIZE + (log.next ? "&after=" + encodeURIComponent(log.next) : ""))
+            .then(function (response) {
+                return response.json();
+            })
+            .then(function (page) {
+                if (url !== log.url) {
+                    // the match changed while this page was loading
+                    return;
+                }
+
+                var rows = document.getElementById("event_log_rows");
+                page.events.forEach(function (event) {
+                    rows.appendChild(createRow(event));
+                });
+
+                log.next = page.next;
+                log.done = !page.next;
+                log.loading = false;
+
+                // the sentinel only triggers when it scrolls into view, keep going until the view is filled
+                if (isNearBottom()) {
+                    load();
+                }
+            })
+            .catch(function () {
+                if (url === log.url) {
+                    log.loading = false;
+                }
+            });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        event_log: {
+            start: function (match_state, active_item) {
+                var url = null;
+                if (active_item && match_state && match_state.world_id && match_state.zone_id) {
+                    url = "/events/" + match_state.world_id + "/" + match_state.zone_id;
+                    if (match_state.window) {
+                        url += "?start=" + match_state.window[0] * 60;
+                    }
+                }
+
+                if (url === log.url) {
+                    return window.dash_clientside.no_update;
+                }
+
+                log.url = url;
+                log.next = null;
+                log.done = !url;
+                log.loading = false;
+
+                var rows = document.getElementById("event_log_rows");
+                if (rows) {
+                    rows.innerHTML = "";
+                }
+
+                if (url && !log.observer && window.IntersectionObserver) {
+                    log.observer = new IntersectionObserver(function (entries) {
+                        if (entries.some(function (entry) { return entry.isIntersecting; })) {
+                            load();
+                        }
+                    }, {root: document.getElementById("event_log_scroll"), rootMargin: "200px"});
+                    log.observer.observe(document.getElementById("event_log_sentinel"));
+                }
+
+                load();
+                return url;
+            }
+        }
+    });
+})();
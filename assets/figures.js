@@ -0,0 +1,51 @@
+(function () {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        figures: {
+            // builds the same figure as px.bar(orientation="h", barmode="relative") from a create_bar_payload() payload
+            bar: function (payload) {
+                if (!payload) {
+                    return {data: [], layout: {}};
+                }
+
+                var traces = payload.color_categories.map(function (category) {
+                    return {
+                        type: "bar",
+                        orientation: "h",
+                        name: category,
+                        legendgroup: category,
+                        alignmentgroup: "True",
+                        offsetgroup: category,
+                        marker: {color: payload.color_map[category]},
+                        hovertemplate: payload.labels.color + "=" + category + "<br>" +
+                            payload.labels.x + "=%{x}<br>" + payload.labels.y + "=%{y}<extra></extra>",
+                        x: [],
+                        y: []
+                    };
+                });
+
+                for (var i = 0; i < payload.x.length; i++) {
+                    var trace = traces[payload.color[i]];
+                    trace.x.push(payload.x[i]);
+                    trace.y.push(payload.y_categories[payload.y[i]]);
+                }
+
+                return {
+                    data: traces,
+                    layout: {
+                        title: {text: payload.title},
+                        barmode: "relative",
+                        height: 800,
+                        legend: {title: {text: payload.labels.color}, tracegroupgap: 0},
+                        xaxis: {title: {text: payload.labels.x}},
+                        // top down, like plotly express does for categorical y axes
+                        yaxis: {
+                            title: {text: payload.labels.y},
+                            categoryorder: "array",
+                            categoryarray: payload.y_categories.slice().reverse()
+                        }
+                    }
+                };
+            }
+        }
+    });
+})();
@@ -0,0 +1,95 @@
+(function () {
+    var SERIES_LABELS = {
+        "kills": "Kills",
+        "vehicles_lost": "Vehicles Lost",
+        "captures": "Captures"
+    };
+
+    var state = {
+        source: null,
+        url: null,
+        totals: {},
+        version: 0,
+        rendered: -1
+    };
+
+    function merge(series) {
+        Object.keys(series).forEach(function (name) {
+            var totals = state.totals[name] = state.totals[name] || {};
+            Object.keys(series[name]).forEach(function (outfit) {
+                totals[outfit] = (totals[outfit] || 0) + series[name][outfit];
+            });
+        });
+        state.version += 1;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        live: {
+            subscribe: function (match_state) {
+                var url = match_state && match_state.world_id && match_state.zone_id ?
+                    "/live/" + match_state.world_id + "/" + match_state.zone_id : null;
+                if (url === state.url) {
+                    return url;
+                }
+
+                if (state.source) {
+                    state.source.close();
+                }
+
+                state.source = null;
+                state.url = url;
+                state.totals = {};
+                state.version += 1;
+
+                if (url) {
+                    var source = new EventSource(url);
+                    source.addEventListener("snapshot", function (e) {
+                        state.totals = {};
+                        merge(JSON.parse(e.data).series);
+                    });
+                    source.addEventListener("delta", function (e) {
+                        merge(JSON.parse(e.data).series);
+                    });
+                    state.source = source;
+                }
+
+                return url;
+            },
+
+            render: function (n_intervals, url) {
+                if (state.rendered === state.version) {
+                    return window.dash_clientside.no_update;
+                }
+
+                state.rendered = state.version;
+
+                var outfits = {};
+                Object.keys(state.totals).forEach(function (name) {
+                    Object.keys(state.totals[name]).forEach(function (outfit) {
+                        outfits[outfit] = true;
+                    });
+                });
+                outfits = Object.keys(outfits).sort();
+
+                var data = Object.keys(SERIES_LABELS).map(function (name) {
+                    var totals = state.totals[name] || {};
+                    return {
+                        type: "bar",
+                        name: SERIES_LABELS[name],
+                        x: outfits,
+                        y: outfits.map(function (outfit) { return totals[outfit] || 0; })
+                    };
+                });
+
+                return {
+                    data: data,
+                    layout: {
+                        title: url ? "Live Match Totals" : "",
+                        barmode: "group",
+                        height: 300
+                    }
+                };
+            }
+        }
+    });
+})();
@@ -0,0 +1,48 @@
+(function () {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        state: {
+            // folds the dropdowns and the time window into match_state, only updating it when something actually changed
+            update: function (world_id, zone_id, character_ids, time_window, min_minute, max_minute, state) {
+                var next = {
+                    world_id: world_id || null,
+                    zone_id: zone_id || null,
+                    character_ids: character_ids || [],
+                    window: null
+                };
+
+                // the whole match is no window at all, which keeps the whole match queries and their caches
+                var same_match = state && state.world_id === next.world_id && state.zone_id === next.zone_id;
+                if (same_match && time_window && (time_window[0] > min_minute || time_window[1] < max_minute)) {
+                    next.window = time_window;
+                }
+
+                if (same_match &&
+                    JSON.stringify(state.character_ids || []) === JSON.stringify(next.character_ids) &&
+                    JSON.stringify(state.window || null) === JSON.stringify(next.window)) {
+                    return window.dash_clientside.no_update;
+                }
+
+                return next;
+            },
+
+            url: function (state) {
+                var params = [];
+                if (state && state.world_id) {
+                    params.push("world_id=" + state.world_id);
+                }
+                if (state && state.zone_id) {
+                    params.push("match_id=" + state.zone_id);
+                }
+                if (state && state.character_ids && state.character_ids.length) {
+                    params.push("character_ids=" + state.character_ids.join(","));
+                }
+                if (state && state.window) {
+                    params.push("from=" + state.window[0]);
+                    params.push("to=" + state.window[1]);
+                }
+
+                return "?" + params.join("&");
+            }
+        }
+    });
+})();
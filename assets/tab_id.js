@@ -0,0 +1,15 @@
+(function () {
+    // one id per page load, sent with every callback request so that supersedable panels of
+    // different tabs of the same browser don't cancel each other, see cancellation.get_tab_id
+    var tab_id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    var fetch = window.fetch;
+
+    window.fetch = function (input, init) {
+        var url = typeof input === "string" ? input : (input && input.url) || "";
+        if (url.indexOf("_dash-update-component") !== -1) {
+            init = Object.assign({}, init);
+            init.headers = Object.assign({}, init.headers, {"X-Tab-Id": tab_id});
+        }
+        return fetch.call(this, input, init);
+    };
+})();
@@ -0,0 +1,61 @@
+import logging
+import time
+
+import cache
+import schema
+
+
+logger = logging.getLogger(__name__)
+
+
+class MatchAggregates:
+    """Makes sure the catalog entry and rollups of a match are current before they are read.
+
+    The ingester maintains them as it loads events, finished matches whose events were loaded by something else are
+    rebuilt the first time they are read. Running ones keep serving their last built aggregates until maintain
+    rebuilds them in the background, rather than rebuilding the whole match on every read.
+    """
+
+    def __init__(self, db, service, match_versions, timeout=None):
+        self.db = db
+        self.service = service
+        self.match_versions = match_versions
+        self.timeout = timeout
+        self.checked = cache.TTLCache(max_size=4096)
+
+    def ensure(self, world_id, zone_id):
+        """Returns whether the match had to be rebuilt."""
+
+        last_timestamp, finished = self.match_versions.get(world_id, zone_id)
+        key = (str(world_id), str(zone_id), last_timestamp)
+        if not last_timestamp or not finished or self.checked.get(key):
+            return False
+
+        rebuilt = False
+        catalog = self.service.get_match_catalog(world_id, zone_id)
+        if not catalog or catalog["last_timestamp"] < last_timestamp:
+            logger.info("rebuilding aggregates of match %s/%s" % (world_id, zone_id))
+            rebuilt = schema.rebuild_match_aggregates(self.db, world_id, zone_id, timeout=self.timeout)
+            if not rebuilt:
+                # another process is rebuilding it, checked again on the next read
+                return False
+
+        self.checked.set(key, True)
+        return rebuilt
+
+
+def maintain(db, interval, timeout=None):
+    """Keeps backfilling the aggregates of every match, e.g. for the season view, until the process exits.
+
+    The tables and indexes are created by ingest.py, matches are only backfilled once they exist.
+    """
+
+    while True:
+        try:
+            rebuilt = schema.backfill_aggregates(db, timeout=timeout)
+            if rebuilt:
+                logger.info("backfilled aggregates of %d matches" % rebuilt)
+        except Exception:
+            logger.exception("could not backfill the aggregates")
+
+        time.sleep(interval)
@@ -0,0 +1,147 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", code], env=env, cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def wait_for_response(url, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.02)
+
+    return False
+
+
+def measure_first_response(port, timeout):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    start = time.perf_counter()
+    code = "import bootstrap, uvicorn; uvicorn.run(bootstrap.create_server(), host='127.0.0.1', port=%d, log_level='warning')" % port
+    process = subprocess.Popen([sys.executable, "-W", "ignore", "-c", code], env=env, cwd=SRC_DIR)
+    try:
+        if not wait_for_response("http://127.0.0.1:%d/healthz" % port, timeout):
+            raise RuntimeError("server did not respond within %ds" % timeout)
+        first_health = time.perf_counter() - start
+
+        if not wait_for_response("http://127.0.0.1:%d/" % port, timeout):
+            raise RuntimeError("dash index did not respond within %ds" % timeout)
+        first_page = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    return first_health, first_page
+
+
+def print_stats(label, values):
+    print("%-28s median %7.1fms  min %7.1fms  max %7.1fms" % (label, statistics.median(values) * 1000, min(values) * 1000, max(values) * 1000))
+
+
+def startup(args):
+    import_times = []
+    health_times = []
+    page_times = []
+    for i in range(args.runs):
+        import_times.append(run_python("import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"))
+        first_health, first_page = measure_first_response(args.port, args.timeout)
+        health_times.append(first_health)
+        page_times.append(first_page)
+
+    print_stats("import main", import_times)
+    print_stats("first /healthz response", health_times)
+    print_stats("first page response", page_times)
+
+
+def build_callback_response(num_timestamps, num_series):
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    from dash import dcc, html, dash_table
+
+    # shaped like the loadouts panels: one area per loadout over the match, plus a weapon table
+    columns = ["Loadout %d [OUTFIT]" % i for i in range(num_series)]
+    df = pd.DataFrame(np.random.randint(0, 50, size=(num_timestamps, num_series)), columns=columns)
+    df["date"] = pd.to_datetime(1700000000 + np.arange(num_timestamps) * 5, unit="s")
+    fig = px.area(df, x="date", y=columns)
+
+    table_rows = pd.DataFrame({
+        "weapon": ["Weapon %d" % i for i in range(500)],
+        "kills": np.random.randint(0, 100, size=500),
+    }).to_dict("records")
+
+    return {
+        "multi": True,
+        "response": {
+            "infantry_loadouts": {"children": [dcc.Graph(figure=fig, config={"sendData": True}), html.Br()]},
+            "infantry_kills": {"children": [dash_table.DataTable(data=table_rows), html.Br()]},
+        },
+    }
+
+
+def time_encoder(encode, value, runs):
+    times = []
+    payload = None
+    for i in range(runs):
+        start = time.perf_counter()
+        payload = encode(value)
+        times.append(time.perf_counter() - start)
+
+    return times, len(payload.encode("utf8"))
+
+
+def json_encoding(args):
+    from plotly.io.json import to_json_plotly
+
+    import serialization
+
+    response = build_callback_response(args.timestamps, args.series)
+    encoders = {
+        "plotly json engine": lambda value: to_json_plotly(value, engine="json"),
+        "plotly orjson engine": lambda value: to_json_plotly(value, engine="orjson"),
+        "serialization.to_json_orjson": serialization.to_json_orjson,
+    }
+
+    for label, encode in encoders.items():
+        times, size = time_encoder(encode, response, args.runs)
+        print("%-30s median %7.1fms  min %7.1fms  payload %8.1fkB" % (label, statistics.median(times) * 1000, min(times) * 1000, size / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the PS2 Outfit Wars Stats app")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    startup_parser = subparsers.add_parser("startup", help="import time and time to first response of a fresh process")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--port", type=int, default=18080)
+    startup_parser.add_argument("--timeout", type=int, default=60)
+    startup_parser.set_defaults(func=startup)
+
+    json_parser = subparsers.add_parser("json", help="encode time and payload size of a large callback response")
+    json_parser.add_argument("--runs", type=int, default=10)
+    json_parser.add_argument("--timestamps", type=int, default=2000)
+    json_parser.add_argument("--series", type=int, default=24)
+    json_parser.set_defaults(func=json_encoding)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
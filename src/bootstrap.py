@@ -1,13 +1,57 @@
+import threading
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from uvicorn.middleware.wsgi import WSGIMiddleware
 
+import aggregates
+import config
+import event_log
+import leaderboard
+import live
 import main
+import metrics
 
 
-if __name__ == "__main__":
+def create_server():
     server = FastAPI()
 
+    # routes must be registered before the dash app is mounted at "/" or they will be shadowed by it
+    server.include_router(live.create_router(live.LiveFeed(main.service)))
+    server.include_router(event_log.create_router(main.service))
+    server.include_router(leaderboard.create_router(main.service, main.match_aggregates))
+
+    @server.on_event("startup")
+    def start_aggregate_backfill():
+        # fills the match_* tables for matches loaded by something else than the ingester, the schema itself is only changed by ingest.py
+        interval = config.AGGREGATE_BACKFILL_INTERVAL()
+        if interval:
+            threading.Thread(target=aggregates.maintain, args=(main.db, interval, config.AGGREGATE_BACKFILL_TIMEOUT_MS()),
+                             name="aggregate-backfill", daemon=True).start()
+
+    @server.get("/metrics", response_class=PlainTextResponse)
+    def get_metrics():
+        return metrics.render()
+
+    @server.get("/healthz")
+    def liveness():
+        # the process is up and serving requests, regardless of whether the DB is reachable
+        return {"status": "ok"}
+
+    @server.get("/readyz")
+    def readiness():
+        try:
+            main.db.verify_connection()
+        except Exception as e:
+            return JSONResponse({"status": "unavailable", "error": str(e)}, status_code=503)
+
+        return {"status": "ok"}
+
     server.mount("/", WSGIMiddleware(main.app.server))
 
-    uvicorn.run(server, host='0.0.0.0', port=8080)
+    return server
+
+
+if __name__ == "__main__":
+    uvicorn.run(create_server(), host='0.0.0.0', port=8080)
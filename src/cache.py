@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+# background callbacks run in processes forked from the threaded server, where a lock may be held by a thread that doesn't exist
+_caches = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for cache in list(_caches):
+        cache.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries expire after ttl seconds (or never if ttl is None)."""
+
+    def __init__(self, ttl=None, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        _caches.add(self)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, fn):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fn()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_MISSING = object()
@@ -0,0 +1,130 @@
+import contextvars
+import os
+import threading
+import uuid
+from functools import wraps
+
+import flask
+from dash.exceptions import PreventUpdate
+
+
+CLIENT_COOKIE = "ps2ow_client"
+
+TAB_HEADER = "X-Tab-Id"
+
+_current = contextvars.ContextVar("cancel_token", default=None)
+
+
+class QueryCancelled(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class CancelToken:
+    def __init__(self, key):
+        self.key = key
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.running = None
+
+    def cancel(self):
+        # the cancel is sent while holding the lock, so detach() waits for it and the connection can't be
+        # back in the pool running someone else's query by the time the backend receives it
+        with self.lock:
+            self.cancelled = True
+            if self.running:
+                db, engine, pid = self.running
+                db.cancel_backend(engine, pid)
+
+    def attach(self, db, engine, pid):
+        with self.lock:
+            if self.cancelled:
+                raise QueryCancelled("request %s was superseded" % str(self.key))
+            self.running = (db, engine, pid)
+
+    def detach(self):
+        with self.lock:
+            self.running = None
+
+
+class CancelRegistry:
+    """Tracks the latest request per key so that starting a new one cancels the one it supersedes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # the requests of the parent's other threads aren't running in a forked process
+        self.lock = threading.Lock()
+        self.tokens = {}
+
+    def start(self, key):
+        token = CancelToken(key)
+        with self.lock:
+            previous = self.tokens.get(key)
+            self.tokens[key] = token
+
+        if previous:
+            previous.cancel()
+
+        return token
+
+    def finish(self, token):
+        with self.lock:
+            if self.tokens.get(token.key) is token:
+                del self.tokens[token.key]
+
+
+registry = CancelRegistry()
+
+
+def current_token():
+    return _current.get()
+
+
+def get_client_id():
+    client_id = flask.request.cookies.get(CLIENT_COOKIE)
+    if not client_id:
+        client_id = flask.g.get("new_client_id")
+        if not client_id:
+            client_id = flask.g.new_client_id = uuid.uuid4().hex
+
+    return client_id
+
+
+def get_tab_id():
+    # sent by assets/tab_id.js, a browser's tabs share the client cookie
+    return flask.request.headers.get(TAB_HEADER, "")[:64]
+
+
+def init_app(server):
+    @server.after_request
+    def set_client_cookie(response):
+        client_id = flask.g.get("new_client_id")
+        if client_id:
+            response.set_cookie(CLIENT_COOKIE, client_id, httponly=True, samesite="Lax")
+        return response
+
+
+def supersedable(panel):
+    """Cancels the queries of a callback's previous request from the same browser tab once a newer one starts."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = registry.start((get_client_id(), get_tab_id(), panel))
+            reset_token = _current.set(token)
+            try:
+                return fn(*args, **kwargs)
+            except QueryCancelled:
+                # the browser has already moved on, nothing to render
+                raise PreventUpdate
+            finally:
+                _current.reset(reset_token)
+                registry.finish(token)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+import weakref
+
+import metrics
+import timing
+from cancellation import QueryCancelled
+
+
+# the in-flight calls of a forked process (e.g. a background callback) are those of the parent's other threads,
+# which never finish in the child
+_flights = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for flight in list(_flights):
+        flight.lock = threading.Lock()
+        flight.calls = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class SingleFlight:
+    """Runs at most one execution per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self, name, wait_timeout=None):
+        self.name = name
+        # how long a caller waits for a shared execution before running the query itself
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+        _flights.add(self)
+
+    def do(self, key, fn, *args, **kwargs):
+        labels = {"group": self.name, "method": key[0]}
+
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = InFlightCall()
+                    self.calls[key] = call
+
+            if is_leader:
+                break
+
+            start = time.perf_counter()
+            finished = call.done.wait(self.wait_timeout)
+            # waiting on the shared execution is query time from this caller's point of view
+            timing.record("sql", time.perf_counter() - start)
+            if not finished:
+                metrics.inc("singleflight_wait_timeouts_total", labels=labels)
+                return fn(*args, **kwargs)
+            if isinstance(call.error, QueryCancelled):
+                # the leader's request was superseded, which says nothing about this caller's request
+                continue
+
+            metrics.inc("singleflight_shared_total", labels=labels)
+            if call.error:
+                raise call.error
+            return call.result
+
+        metrics.inc("singleflight_executions_total", labels=labels)
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result
+
+
+class InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CoalescingService:
+    """Wraps a Service so that identical concurrent get_* queries are executed only once."""
+
+    def __init__(self, service, wait_timeout=None):
+        self.service = service
+        self.flight = SingleFlight("service", wait_timeout=wait_timeout)
+
+    def __getattr__(self, name):
+        attr = getattr(self.service, name)
+        if not name.startswith("get_") or not callable(attr):
+            return attr
+
+        def coalesced(*args, **kwargs):
+            key = (name, tuple(make_key(arg) for arg in args), tuple(sorted((k, make_key(v)) for k, v in kwargs.items())))
+            return self.flight.do(key, attr, *args, **kwargs)
+
+        return coalesced
+
+
+def make_key(value):
+    # lists are character_id filters where order does not change the result
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(str(v) for v in value))
+    elif value is None:
+        return None
+    else:
+        return str(value)
@@ -14,6 +14,19 @@ def create_dropdown(id, label, options, default_value, multi=True):
         )
 
 
+def create_range_slider(id, label):
+    # the range and marks are set once a match is selected
+    return wrap_with_container_label(id, label, dcc.RangeSlider(
+                id=f"{id}_slider",
+                min=0,
+                max=1,
+                step=1,
+                marks=None,
+                allowCross=False,
+            )
+        )
+
+
 def create_input(id, label, input_type, default_value):
     return wrap_with_container_label(id, label, dbc.Input(
                 id=f"{id}_input",
@@ -30,3 +43,27 @@ def wrap_with_container_label(id, label, component):
             component
         ],
         className="container container-xxl input-with-label")
+
+
+def create_lazy_panel(id, title, progress=False, content=None):
+    """Collapsed panel whose content callback should only run once it is expanded, see is_expanded()."""
+
+    children = [dcc.Loading(html.Div(id=id, children=content))]
+    if progress:
+        # progress messages of background callbacks
+        children.insert(0, html.Div(id=f"{id}_progress", className="text-muted", style={"display": "none"}))
+
+    return dbc.Accordion(
+        dbc.AccordionItem(
+            children,
+            title=title,
+            item_id=id,
+        ),
+        id=f"{id}_accordion",
+        start_collapsed=True,
+        className="lazy-panel",
+    )
+
+
+def is_expanded(active_item):
+    return bool(active_item)
@@ -15,6 +15,22 @@ def get_env_string(name, default=None):
     return os.environ.get(name, default)
 
 
+def get_env_int(name, default=None):
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    else:
+        return int(val)
+
+
+def get_env_float(name, default=None):
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    else:
+        return float(val)
+
+
 def DB_DRIVERNAME():
     return get_env_string("DB_DRIVERNAME")
 
@@ -37,3 +53,112 @@ def DB_HOST():
 
 def DB_IP_TYPE():
     return get_env_string("DB_IP_TYPE").upper()
+
+
+def DB_REPLICA_HOSTS():
+    hosts = get_env_string("DB_REPLICA_HOSTS", "")
+    return [host.strip() for host in hosts.split(",") if host.strip()]
+
+
+def DB_REPLICA_HEALTH_CHECK_INTERVAL():
+    return get_env_float("DB_REPLICA_HEALTH_CHECK_INTERVAL", 10.0)
+
+
+def DB_STATEMENT_TIMEOUT_MS():
+    return get_env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+
+
+def WORLD_LIST_CACHE_SECONDS():
+    return get_env_int("WORLD_LIST_CACHE_SECONDS", 3600)
+
+
+def LIVE_POLL_INTERVAL():
+    return get_env_float("LIVE_POLL_INTERVAL", 5.0)
+
+
+def LIVE_SETTLE_SECONDS():
+    return get_env_int("LIVE_SETTLE_SECONDS", 10)
+
+
+def PROFILE_SAMPLE_RATE():
+    return get_env_float("PROFILE_SAMPLE_RATE", 0.0)
+
+
+def PROFILE_DIR():
+    return get_env_string("PROFILE_DIR", "/tmp/profiles")
+
+
+def JSON_ENGINE():
+    return get_env_string("JSON_ENGINE", "orjson")
+
+
+def RESPONSE_CACHE_SIZE():
+    return get_env_int("RESPONSE_CACHE_SIZE", 512)
+
+
+def MATCH_FINISHED_SECONDS():
+    return get_env_int("MATCH_FINISHED_SECONDS", 3600)
+
+
+def MATCH_VERSION_LIVE_TTL():
+    return get_env_int("MATCH_VERSION_LIVE_TTL", 10)
+
+
+def MATCH_VERSION_FINISHED_TTL():
+    return get_env_int("MATCH_VERSION_FINISHED_TTL", 3600)
+
+
+def CLIENTSIDE_RENDERING():
+    return get_env_bool("CLIENTSIDE_RENDERING", False)
+
+
+def JOB_CACHE_DIR():
+    return get_env_string("JOB_CACHE_DIR", "/tmp/ps2ow-jobs")
+
+
+def JOB_RESULT_EXPIRE():
+    return get_env_int("JOB_RESULT_EXPIRE", 3600)
+
+
+def INGEST_FLUSH_SIZE():
+    return get_env_int("INGEST_FLUSH_SIZE", 5000)
+
+
+def INGEST_FLUSH_INTERVAL():
+    return get_env_float("INGEST_FLUSH_INTERVAL", 1.0)
+
+
+def WINDOW_INDEX_CACHE_SIZE():
+    return get_env_int("WINDOW_INDEX_CACHE_SIZE", 64)
+
+
+def MATCH_AGGREGATES_CACHE_SIZE():
+    return get_env_int("MATCH_AGGREGATES_CACHE_SIZE", 64)
+
+
+def ACTIVITY_BUCKET_SECONDS():
+    return get_env_int("ACTIVITY_BUCKET_SECONDS", 60)
+
+
+def LEADERBOARD_SIZE():
+    return get_env_int("LEADERBOARD_SIZE", 20)
+
+
+def TIMELINE_OPEN_SECONDS():
+    return get_env_int("TIMELINE_OPEN_SECONDS", 120)
+
+
+def ENGAGEMENT_TOP_K():
+    return get_env_int("ENGAGEMENT_TOP_K", 20)
+
+
+def AGGREGATE_BACKFILL_INTERVAL():
+    return get_env_int("AGGREGATE_BACKFILL_INTERVAL", 300)
+
+
+def AGGREGATE_BACKFILL_TIMEOUT_MS():
+    return get_env_int("AGGREGATE_BACKFILL_TIMEOUT_MS", 600000)
+
+
+def COALESCE_WAIT_TIMEOUT():
+    return get_env_float("COALESCE_WAIT_TIMEOUT", 300)
@@ -1,10 +1,15 @@
+import csv
+import io
 import logging
 from pkg_resources import parse_version
 import re
 import os
+import threading
 import time
 import sqlalchemy
-from google.cloud.sql.connector import Connector, IPTypes
+
+import timing
+from cancellation import QueryCancelled, current_token
 
 
 class DB:
@@ -12,9 +17,79 @@ class DB:
         self.lastrowid = None
         self.logger = logging.getLogger(__name__)
         self.engine = None
+        # engine -> small engine of its own that cancels are sent through, see cancel_backend()
+        self.cancel_engines = {}
+        self.statement_timeout = None
+        self.replicas = []
+        self.replica_lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.connect_args = None
+        self.pid = None
+        os.register_at_fork(after_in_child=self._reset_locks_after_fork)
+
+    def connect(self, drivername, username, password, database, host, ip_type, statement_timeout=None, replica_hosts=None, health_check_interval=10, lazy=False):
+        self.statement_timeout = statement_timeout
+        self.connect_args = (drivername, username, password, database, host, ip_type, replica_hosts or [], health_check_interval)
+
+        if not lazy:
+            self._ensure_engines()
+
+    def _ensure_engines(self):
+        if self.engine and self.pid != os.getpid():
+            self._reset_after_fork()
+
+        # engines are created on first use when connecting lazily, so that startup never waits on the DB
+        if self.engine:
+            return
+
+        with self.connect_lock:
+            if self.engine:
+                return
+
+            drivername, username, password, database, host, ip_type, replica_hosts, health_check_interval = self.connect_args
+
+            self.replicas = [Replica(replica_host, self._create_engine(drivername, username, password, database, replica_host, ip_type))
+                             for replica_host in replica_hosts]
+            cancel_engines = {replica.engine: self._create_cancel_engine(drivername, username, password, database, replica.host, ip_type)
+                              for replica in self.replicas}
+            if self.replicas:
+                threading.Thread(target=self._check_replica_health, args=(health_check_interval,), name="db-replica-health", daemon=True).start()
+
+            engine = self._create_engine(drivername, username, password, database, host, ip_type)
+            cancel_engines[engine] = self._create_cancel_engine(drivername, username, password, database, host, ip_type)
+            self.cancel_engines = cancel_engines
+            self.engine = engine
+            self.pid = os.getpid()
+
+    def _reset_locks_after_fork(self):
+        # another thread of the parent may have held them while forking
+        self.replica_lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        # pooled connections (and the cloud sql connector's background thread) belong to the parent process,
+        # drop them without closing so the parent's sockets are left alone and create fresh engines
+        with self.connect_lock:
+            if self.pid == os.getpid():
+                return
+
+            for engine in [self.engine] + [replica.engine for replica in self.replicas] + list(self.cancel_engines.values()):
+                engine.dispose(close=False)
+
+            self.engine = None
+            self.cancel_engines = {}
+            self.replicas = []
+
+    def _create_cancel_engine(self, drivername, username, password, database, host, ip_type):
+        # a pool of its own, a cancel must not wait for a connection from the pool of the queries it is relieving
+        return self._create_engine(drivername, username, password, database, host, ip_type, pool_size=1, max_overflow=1)
+
+    def _create_engine(self, drivername, username, password, database, host, ip_type, pool_size=5, max_overflow=2):
+        direct_host = re.fullmatch(r"([^:]+)(?::(\d+))?", host)
+        if not direct_host:
+            # imported here since it is slow to import and only needed for Cloud SQL instance connection names
+            from google.cloud.sql.connector import Connector, IPTypes
 
-    def connect(self, drivername, username, password, database, host, ip_type):
-        if ":" in host:
             # https://github.com/GoogleCloudPlatform/cloud-sql-python-connector#how-to-use-this-connector
             # https://github.com/GoogleCloudPlatform/python-docs-samples/blob/main/cloud-sql/postgres/sqlalchemy/connect_connector_auto_iam_authn.py
             connector = Connector()
@@ -34,13 +109,13 @@ class DB:
                 )
                 return conn
 
-            self.engine = sqlalchemy.create_engine(
+            engine = sqlalchemy.create_engine(
                 f"postgresql+{drivername}://",
                 creator=get_conn,
                 # Pool size is the maximum number of permanent connections to keep.
-                pool_size=5,
+                pool_size=pool_size,
                 # Temporarily exceeds the set pool_size if no connections are available.
-                max_overflow=2,
+                max_overflow=max_overflow,
                 # The total number of concurrent connections for your application will be
                 # a total of pool_size and max_overflow.
                 # 'pool_timeout' is the maximum number of seconds to wait when retrieving a
@@ -54,19 +129,19 @@ class DB:
                 isolation_level = "AUTOCOMMIT",
             )
         else:
-            self.engine = sqlalchemy.create_engine(
+            engine = sqlalchemy.create_engine(
                 sqlalchemy.engine.url.URL.create(
                     drivername=f"postgresql+{drivername}",
                     username=username,
                     password=password,
-                    host=host,
-                    port=5432,
+                    host=direct_host.group(1),
+                    port=int(direct_host.group(2) or 5432),
                     database=database,
                 ),
                 # Pool size is the maximum number of permanent connections to keep.
-                pool_size=5,
+                pool_size=pool_size,
                 # Temporarily exceeds the set pool_size if no connections are available.
-                max_overflow=2,
+                max_overflow=max_overflow,
                 # The total number of concurrent connections for your application will be
                 # a total of pool_size and max_overflow.
                 # 'pool_timeout' is the maximum number of seconds to wait when retrieving a
@@ -80,58 +155,182 @@ class DB:
                 isolation_level = "AUTOCOMMIT",
             )
 
-    def _execute_wrapper(self, db_conn, sql, params, callback):
+        if self.statement_timeout:
+            sqlalchemy.event.listen(engine, "connect", self._set_default_statement_timeout)
+
+        return engine
+
+    def _set_default_statement_timeout(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET statement_timeout = %d" % self.statement_timeout)
+        cursor.close()
+        dbapi_connection.commit()
+
+    def _execute_wrapper(self, db_conn, sql, params, callback, timeout=None, read_only=False):
+        self._ensure_engines()
+
         if db_conn:
-            result = self._execute_query(db_conn, sql, params, callback)
+            result = self._execute_query(db_conn, sql, params, callback, timeout)
+        elif read_only and self.replicas:
+            result = self._execute_on_replica(sql, params, callback, timeout)
         else:
             with self.get_connection() as db_conn:
-                result = self._execute_query(db_conn, sql, params, callback)
+                result = self._execute_query(db_conn, sql, params, callback, timeout)
                 
         if callback:
             result = callback(result)
 
         return result
 
-    def _execute_query(self, db_conn, sql, params, callback):
+    def _execute_on_replica(self, sql, params, callback, timeout):
+        replica = self._acquire_replica()
+        if not replica:
+            with self.get_connection() as db_conn:
+                return self._execute_query(db_conn, sql, params, callback, timeout)
+
+        try:
+            with replica.engine.connect() as db_conn:
+                return self._execute_query(db_conn, sql, params, callback, timeout)
+        except QueryCancelled:
+            raise
+        except Exception as e:
+            # errors in the query itself would fail on the primary as well, only connection problems fall back
+            if isinstance(e, SqlException) and not is_connection_error(e.__cause__):
+                raise
+
+            self.logger.warning("replica %s failed, falling back to primary: %s" % (replica.host, str(e)))
+            replica.healthy = False
+            with self.get_connection() as db_conn:
+                return self._execute_query(db_conn, sql, params, callback, timeout)
+        finally:
+            self._release_replica(replica)
+
+    def _acquire_replica(self):
+        # least outstanding requests among the healthy replicas
+        with self.replica_lock:
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if not healthy:
+                return None
+
+            replica = min(healthy, key=lambda r: r.outstanding)
+            replica.outstanding += 1
+            return replica
+
+    def _release_replica(self, replica):
+        with self.replica_lock:
+            replica.outstanding -= 1
+
+    def _check_replica_health(self, interval):
+        while True:
+            for replica in self.replicas:
+                try:
+                    with replica.engine.connect() as conn:
+                        conn.execute(sqlalchemy.text("SELECT 1"))
+                    if not replica.healthy:
+                        self.logger.info("replica %s is healthy again" % replica.host)
+                    replica.healthy = True
+                except Exception as e:
+                    if replica.healthy:
+                        self.logger.warning("replica %s failed health check: %s" % (replica.host, str(e)))
+                    replica.healthy = False
+
+            time.sleep(interval)
+
+    def _execute_query(self, db_conn, sql, params, callback, timeout=None):
+        token = current_token()
+        if token:
+            token.attach(self, db_conn.engine, self._get_backend_pid(db_conn))
+
+        if timeout:
+            self._set_statement_timeout(db_conn, timeout)
+
         start_time = time.time()
         try:
             result = db_conn.execute(sqlalchemy.text(sql), params)
         except Exception as e:
+            if token and token.cancelled:
+                raise QueryCancelled("query cancelled: '%s' [%s]" % (sql, params)) from e
             raise SqlException("SQL Error: '%s' for '%s' [%s]" % (str(e), sql, params)) from e
+        finally:
+            if token:
+                token.detach()
+            if timeout:
+                self._set_statement_timeout(db_conn, self.statement_timeout or 0)
 
         elapsed = time.time() - start_time
+        timing.record("sql", elapsed)
 
         if elapsed > 0.5:
             self.logger.warning("slow query (%fs) '%s' for params: %s" % (elapsed, sql, str(params)))
 
         return result
 
-    def query_single(self, sql, params=None, db_conn=None):
+    def _set_statement_timeout(self, db_conn, timeout):
+        db_conn.execute(sqlalchemy.text("SELECT set_config('statement_timeout', :timeout, false)"), {"timeout": str(int(timeout))})
+
+    def _get_backend_pid(self, db_conn):
+        # cached per pooled DBAPI connection so the lookup happens once per physical connection
+        pid = db_conn.info.get("backend_pid")
+        if pid is None:
+            pid = db_conn.info["backend_pid"] = db_conn.execute(sqlalchemy.text("SELECT pg_backend_pid()")).scalar()
+        return pid
+
+    def cancel_backend(self, engine, pid):
+        try:
+            with self.cancel_engines.get(engine, engine).connect() as conn:
+                conn.execute(sqlalchemy.text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+        except Exception:
+            self.logger.exception("could not cancel query on backend pid %s" % pid)
+
+    def copy_rows(self, db_conn, table, columns, rows):
+        """Bulk loads rows with COPY FROM STDIN, which is much faster than INSERTs for large batches."""
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns))
+        cursor = db_conn.connection.driver_connection.cursor()
+        start_time = time.time()
+        try:
+            if hasattr(cursor, "copy_expert"):
+                cursor.copy_expert(sql, buffer)
+            else:
+                # pg8000
+                cursor.execute(sql, stream=buffer)
+        except Exception as e:
+            raise SqlException("SQL Error: '%s' for '%s'" % (str(e), sql)) from e
+        finally:
+            cursor.close()
+
+        timing.record("sql", time.time() - start_time)
+
+    def query_single(self, sql, params=None, db_conn=None, timeout=None):
         if params is None:
             params = []
 
         def map_result(result):
             return result.mappings().first()
 
-        return self._execute_wrapper(db_conn, sql, params, map_result)
+        return self._execute_wrapper(db_conn, sql, params, map_result, timeout, read_only=True)
 
-    def query(self, sql, params=None, db_conn=None):
+    def query(self, sql, params=None, db_conn=None, timeout=None):
         if params is None:
             params = []
 
         def map_result(result):
             return result.mappings().all()
 
-        return self._execute_wrapper(db_conn, sql, params, map_result)
+        return self._execute_wrapper(db_conn, sql, params, map_result, timeout, read_only=True)
 
-    def exec(self, sql, params=None, db_conn=None):
+    def exec(self, sql, params=None, db_conn=None, timeout=None):
         if params is None:
             params = []
 
         def map_result(result):
             return result.rowcount
 
-        row_count = self._execute_wrapper(db_conn, sql, params, map_result)
+        row_count = self._execute_wrapper(db_conn, sql, params, map_result, timeout)
         return row_count
 
     def last_insert_id(self):
@@ -145,6 +344,7 @@ class DB:
         return SqlConnectionWrapper(self.get_connection())
 
     def get_connection(self):
+        self._ensure_engines()
         return self.engine.connect()
         
     def table_exists(self, table_name):
@@ -153,6 +353,21 @@ class DB:
         return row.table_exists
 
 
+class Replica:
+    def __init__(self, host, engine):
+        self.host = host
+        self.engine = engine
+        self.outstanding = 0
+        self.healthy = True
+
+
+def is_connection_error(e):
+    if isinstance(e, sqlalchemy.exc.DBAPIError) and e.connection_invalidated:
+        return True
+
+    return isinstance(e, (sqlalchemy.exc.OperationalError, sqlalchemy.exc.InterfaceError, sqlalchemy.exc.TimeoutError))
+
+
 class SqlException(Exception):
     def __init__(self, message):
         super().__init__(message)
@@ -0,0 +1,51 @@
+import re
+
+from fastapi import APIRouter, HTTPException
+
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# sorts before every event of the same second
+START_KEY = (-1, 0, 0, 0, "(0,0)")
+
+ROW_ID = re.compile(r"^\(\d+,\d+\)$")
+
+
+def encode_cursor(row):
+    return "%d:%d:%d:%d:%d:%s" % (row["timestamp"], row["kind"], row["id1"], row["id2"], row["id3"], row["row_id"])
+
+
+def decode_cursor(cursor):
+    try:
+        *ids, row_id = cursor.split(":")
+        timestamp, kind, id1, id2, id3 = (int(value) for value in ids)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+    if not ROW_ID.match(row_id):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+    return timestamp, kind, id1, id2, id3, row_id
+
+
+def create_router(service):
+    router = APIRouter()
+
+    # a plain (not async) endpoint, so the blocking query runs in the threadpool
+    @router.get("/events/{world_id}/{zone_id}")
+    def get_events(world_id: int, zone_id: int, after: str = None, start: int = 0, limit: int = PAGE_SIZE):
+        """A page of the match's event log; the next page starts after the returned cursor."""
+
+        after = decode_cursor(after) if after else (start,) + START_KEY
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+        rows = service.get_event_log(world_id, zone_id, *after, limit)
+        events = [{k: v for k, v in row.items() if k not in ("kind", "id1", "id2", "id3", "row_id")} for row in rows]
+
+        return {
+            "events": events,
+            "next": encode_cursor(rows[-1]) if len(rows) == limit else None,
+        }
+
+    return router
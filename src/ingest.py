@@ -0,0 +1,331 @@
+import argparse
+import json
+import logging
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import config
+import metrics
+import schema
+from db import DB
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventTable:
+    def __init__(self, name, columns):
+        self.name = name
+        # (table column, census payload key)
+        self.columns = columns
+        self.staging = "ingest_%s" % name
+        self.key = schema.EVENT_KEYS[name]
+
+    def to_row(self, payload):
+        row = tuple(to_int(payload.get(key)) for column, key in self.columns)
+        # loaded events are looked up by their key columns with =, see Ingester._load
+        for column, value in zip(self.column_names(), row):
+            if value is None and column in self.key:
+                raise ValueError("%s is missing" % column)
+        return row
+
+    def column_names(self):
+        return [column for column, key in self.columns]
+
+
+# only the columns the dashboard reads are loaded
+EVENT_TABLES = {
+    "Death": EventTable("death_event", [
+        ("world_id", "world_id"),
+        ("zone_id", "zone_id"),
+        ("timestamp", "timestamp"),
+        ("character_id", "character_id"),
+        ("character_loadout_id", "character_loadout_id"),
+        ("attacker_character_id", "attacker_character_id"),
+        ("attacker_loadout_id", "attacker_loadout_id"),
+        ("attacker_vehicle_id", "attacker_vehicle_id"),
+        ("attacker_weapon_id", "attacker_weapon_id"),
+        ("is_headshot", "is_headshot"),
+    ]),
+    "VehicleDestroy": EventTable("vehicle_destroy_event", [
+        ("world_id", "world_id"),
+        ("zone_id", "zone_id"),
+        ("timestamp", "timestamp"),
+        ("character_id", "character_id"),
+        ("character_vehicle_id", "vehicle_id"),
+        ("attacker_character_id", "attacker_character_id"),
+        ("attacker_loadout_id", "attacker_loadout_id"),
+        ("attacker_vehicle_id", "attacker_vehicle_id"),
+        ("attacker_weapon_id", "attacker_weapon_id"),
+    ]),
+    "GainExperience": EventTable("gain_experience_event", [
+        ("world_id", "world_id"),
+        ("zone_id", "zone_id"),
+        ("timestamp", "timestamp"),
+        ("character_id", "character_id"),
+        ("experience_id", "experience_id"),
+    ]),
+    "FacilityControl": EventTable("facility_control_event", [
+        ("world_id", "world_id"),
+        ("zone_id", "zone_id"),
+        ("timestamp", "timestamp"),
+        ("facility_id", "facility_id"),
+        ("new_faction_id", "new_faction_id"),
+        ("outfit_id", "outfit_id"),
+    ]),
+}
+
+
+def to_int(value):
+    # census sends every value as a string
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+class Ingester:
+    """Batches recorded census events per table and bulk loads them with COPY, updating the match aggregates as it goes.
+
+    Every batch goes through a staging table and only the copies of an event that the event table doesn't have yet are
+    inserted, so replaying a recording (or overlapping recordings) doesn't duplicate events, while a player getting the
+    same experience several times in a second is still loaded as often as it happened.
+    """
+
+    def __init__(self, db, flush_size, flush_interval):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.batches = {table.name: [] for table in EVENT_TABLES.values()}
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.db_conn = None
+
+    def add(self, message):
+        # recordings contain the full websocket messages, but bare payloads are accepted as well
+        payload = message.get("payload", message)
+        table = EVENT_TABLES.get(payload.get("event_name"))
+        if not table:
+            metrics.inc("ingest_skipped_total")
+            return
+
+        try:
+            row = table.to_row(payload)
+        except (TypeError, ValueError):
+            logger.warning("skipping malformed %s event: %s" % (payload.get("event_name"), payload))
+            metrics.inc("ingest_skipped_total")
+            return
+
+        self.batches[table.name].append(row)
+        self.pending += 1
+
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        start = time.perf_counter()
+        if not self.db_conn:
+            self.db_conn = self.db.get_connection()
+
+        for table in EVENT_TABLES.values():
+            rows = self.batches[table.name]
+            if not rows:
+                continue
+
+            inserted = self._load(table, rows)
+            metrics.inc("ingest_events_total", inserted, labels={"table": table.name})
+            metrics.inc("ingest_duplicates_total", len(rows) - inserted, labels={"table": table.name})
+
+            # how far behind the game the loaded events are, timestamp is the third column of every table
+            metrics.observe("ingest_lag_seconds", max(time.time() - max(row[2] for row in rows), 0), labels={"table": table.name})
+
+            self.batches[table.name] = []
+
+        metrics.observe("ingest_flush_seconds", time.perf_counter() - start)
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def _load(self, table, rows):
+        columns = table.column_names()
+
+        # temp tables live as long as the session, so the staging table is created once per connection
+        self.db.exec("CREATE TEMP TABLE IF NOT EXISTS %s AS SELECT %s FROM %s WITH NO DATA" % (table.staging, ", ".join(columns), table.name), db_conn=self.db_conn)
+        self.db.exec("TRUNCATE %s" % table.staging, db_conn=self.db_conn)
+        self.db.copy_rows(self.db_conn, table.staging, columns, rows)
+
+        # identical events are counted on both sides, only the copies beyond those already loaded are inserted. The lookup
+        # is served by the key index (see schema.EVENT_KEY_INDEXES) and the other columns are compared on its rows
+        sql = """
+            WITH batch AS (
+                SELECT %(columns)s, COUNT(1) AS copies
+                FROM %(staging)s s
+                GROUP BY %(columns)s
+            ), missing AS (
+                SELECT
+                    b.*,
+                    b.copies - (
+                        SELECT COUNT(1)
+                        FROM %(table)s e
+                        WHERE %(match)s
+                    ) AS num
+                FROM batch b
+            ), inserted AS (
+                INSERT INTO %(table)s (%(columns)s)
+                SELECT %(columns)s
+                FROM missing m
+                    CROSS JOIN generate_series(1, m.num)
+                RETURNING %(columns)s
+            ), %(aggregates)s
+            SELECT COUNT(1) AS num FROM inserted
+        """ % {
+            "table": table.name,
+            "staging": table.staging,
+            "columns": ", ".join(columns),
+            "match": " AND ".join(("e.%s = b.%s" if column in table.key else "e.%s IS NOT DISTINCT FROM b.%s") % (column, column)
+                                  for column in columns),
+            # the catalog and rollups are only updated with the rows that were actually inserted
+            "aggregates": ", ".join("aggregate%d AS (%s RETURNING 1)" % (i, upsert)
+                                    for i, upsert in enumerate(schema.get_aggregate_upserts(table.name, "SELECT * FROM inserted"))),
+        }
+
+        # concurrent ingesters would each miss the events the other is inserting, so they load a table one at a time
+        lock = {"lock": "ingest:%s" % table.name}
+        self.db.query_single("SELECT pg_advisory_lock(hashtext(:lock)) AS locked", lock, db_conn=self.db_conn)
+        try:
+            return self.db.query_single(sql, db_conn=self.db_conn)["num"]
+        finally:
+            self.db.query_single("SELECT pg_advisory_unlock(hashtext(:lock)) AS unlocked", lock, db_conn=self.db_conn)
+
+    def run(self, events, done):
+        """Consumes parsed messages from the events queue until done is set and the queue is drained."""
+
+        while not (done.is_set() and events.empty()):
+            try:
+                self.add(events.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+
+            self.flush_if_due()
+
+        if self.pending:
+            self.flush()
+
+        if self.db_conn:
+            self.db_conn.close()
+
+
+def read_lines(lines, events, source):
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            events.put(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning("%s:%d is not valid json" % (source, line_number))
+            metrics.inc("ingest_skipped_total")
+
+
+def read_files(paths, events, done):
+    try:
+        for path in paths:
+            if path == "-":
+                read_lines(sys.stdin, events, "stdin")
+            else:
+                with open(path, encoding="utf8") as f:
+                    read_lines(f, events, path)
+    finally:
+        done.set()
+
+
+def serve(host, port, events):
+    """Local stand-in for the census websocket: accepts newline delimited JSON over TCP."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            read_lines((line.decode("utf8") for line in self.rfile), events, "%s:%d" % self.client_address)
+
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def report(interval, done):
+    last_total = 0
+    while not done.wait(interval):
+        total = sum(metrics.get("ingest_events_total", labels={"table": table.name}) for table in EVENT_TABLES.values())
+        logger.info("ingested %d events (%.0f/s)" % (total, (total - last_total) / interval))
+        last_total = total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loads recorded census event streams (newline delimited JSON) into the event tables")
+    parser.add_argument("files", nargs="*", help="recordings to load, - for stdin")
+    parser.add_argument("--listen", metavar="PORT", type=int, help="accept newline delimited JSON on this local port instead of reading files")
+    parser.add_argument("--flush-size", type=int, default=config.INGEST_FLUSH_SIZE())
+    parser.add_argument("--flush-interval", type=float, default=config.INGEST_FLUSH_INTERVAL())
+    parser.add_argument("--create-schema", action="store_true",
+                        help="create the aggregate tables and indexes and exit, e.g. before deploying the web app which doesn't change the schema")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="recompute the match catalog and rollups from the event tables and exit")
+    parser.add_argument("--backfill-aggregates", action="store_true",
+                        help="recompute the match catalog and rollups of matches loaded by something else than the ingester and exit, "
+                             "the web app does this every AGGREGATE_BACKFILL_INTERVAL seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    db = DB()
+    db.connect(
+        config.DB_DRIVERNAME(),
+        config.DB_USERNAME(),
+        config.DB_PASSWORD(),
+        config.DB_NAME(),
+        config.DB_HOST(),
+        config.DB_IP_TYPE())
+
+    schema.create_schema(db)
+    if args.create_schema:
+        return
+    if args.rebuild_aggregates:
+        schema.rebuild_aggregates(db)
+        return
+    if args.backfill_aggregates:
+        logger.info("backfilled aggregates of %d matches" % schema.backfill_aggregates(db))
+        return
+
+    if not args.files and not args.listen:
+        parser.error("either recordings or --listen are required")
+
+    # bounded so readers wait for the database instead of buffering a whole recording in memory
+    events = queue.Queue(maxsize=args.flush_size * 4)
+    done = threading.Event()
+
+    if args.listen:
+        threading.Thread(target=serve, args=("127.0.0.1", args.listen, events), name="ingest-listen", daemon=True).start()
+    else:
+        threading.Thread(target=read_files, args=(args.files, events, done), name="ingest-read", daemon=True).start()
+
+    finished = threading.Event()
+    threading.Thread(target=report, args=(10, finished), name="ingest-report", daemon=True).start()
+
+    start = time.perf_counter()
+    try:
+        Ingester(db, args.flush_size, args.flush_interval).run(events, done)
+    finally:
+        finished.set()
+
+    elapsed = time.perf_counter() - start
+    print(metrics.render(), end="")
+    total = sum(metrics.get("ingest_events_total", labels={"table": table.name}) for table in EVENT_TABLES.values())
+    print("ingested %d events in %.1fs (%.0f/s)" % (total, elapsed, total / elapsed if elapsed else 0))
+
+
+if __name__ == "__main__":
+    main()
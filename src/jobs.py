@@ -0,0 +1,35 @@
+import hashlib
+import json
+
+import diskcache
+from dash import DiskcacheManager
+
+
+class JobQueue:
+    """Local, disk backed queue for dash background callbacks.
+
+    Background callbacks run in their own process, so results are shared through the disk cache: identical jobs
+    wait for the one that is already running and everything computed is kept for later requests.
+    """
+
+    def __init__(self, cache_dir, expire, lock_timeout=600):
+        self.cache = diskcache.Cache(cache_dir)
+        self.expire = expire
+        self.lock_timeout = lock_timeout
+        self.manager = DiskcacheManager(self.cache, expire=expire)
+
+    def run_deduplicated(self, key, fn):
+        key = "job-%s" % hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf8")).hexdigest()
+
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        # the lock expires so a killed job can't block identical jobs forever
+        with diskcache.Lock(self.cache, key + "-lock", expire=self.lock_timeout):
+            result = self.cache.get(key)
+            if result is None:
+                result = fn()
+                self.cache.set(key, result, expire=self.expire)
+
+        return result
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+
+import schema
+
+
+TOP_N = 20
+MAX_TOP_N = 100
+
+
+def create_router(service, match_aggregates):
+    router = APIRouter()
+
+    @router.get("/leaderboard/{world_id}/{zone_id}")
+    def get_leaderboard(world_id: int, zone_id: int, sort: str = "kills", limit: int = TOP_N):
+        """The top players of a match, sorted by one of schema.LEADERBOARD_METRICS."""
+
+        if sort not in schema.LEADERBOARD_METRICS:
+            raise HTTPException(status_code=400, detail="sort must be one of %s" % ", ".join(schema.LEADERBOARD_METRICS))
+
+        limit = min(max(limit, 1), MAX_TOP_N)
+        match_aggregates.ensure(world_id, zone_id)
+        return {"players": [dict(row) for row in service.get_leaderboard(world_id, zone_id, sort, limit)]}
+
+    return router
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+import config
+
+
+# per-subscriber buffer; a subscriber that falls this far behind is resynced with a snapshot
+SUBSCRIBER_QUEUE_SIZE = 32
+
+KEEPALIVE_SECONDS = 15
+
+
+class LiveFeed:
+    """Fans out live match deltas to every subscribed browser.
+
+    One MatchProducer polls the DB per (world_id, zone_id) no matter how many viewers are subscribed.
+    """
+
+    def __init__(self, service, poll_interval=None, settle_seconds=None):
+        self.service = service
+        self.poll_interval = poll_interval or config.LIVE_POLL_INTERVAL()
+        self.settle_seconds = config.LIVE_SETTLE_SECONDS() if settle_seconds is None else settle_seconds
+        self.logger = logging.getLogger(__name__)
+        self.producers = {}
+
+    def subscribe(self, world_id, zone_id):
+        key = (world_id, zone_id)
+        producer = self.producers.get(key)
+        if not producer:
+            producer = MatchProducer(self, world_id, zone_id)
+            self.producers[key] = producer
+            producer.start()
+
+        return producer.add_subscriber()
+
+    def unsubscribe(self, world_id, zone_id, queue):
+        key = (world_id, zone_id)
+        producer = self.producers.get(key)
+        if not producer:
+            return
+
+        producer.remove_subscriber(queue)
+        if not producer.subscribers:
+            producer.stop()
+            del self.producers[key]
+
+
+class MatchProducer:
+    def __init__(self, feed, world_id, zone_id):
+        self.feed = feed
+        self.world_id = world_id
+        self.zone_id = zone_id
+        self.subscribers = set()
+        self.totals = defaultdict(dict)
+        self.since = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def add_subscriber(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        queue.put_nowait(("snapshot", self.snapshot()))
+        self.subscribers.add(queue)
+        return queue
+
+    def remove_subscriber(self, queue):
+        self.subscribers.discard(queue)
+
+    def snapshot(self):
+        # a copy, since queued snapshots are serialized later and must not include deltas applied in the meantime
+        return {"until": self.since, "series": {series: dict(outfits) for series, outfits in self.totals.items()}}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            # only read up to a settled point in time so events arriving late within the window are not skipped
+            until = int(time.time()) - self.feed.settle_seconds
+            if until > self.since:
+                try:
+                    rows = await loop.run_in_executor(None, self.feed.service.get_live_deltas, self.world_id, self.zone_id, self.since, until)
+                except Exception:
+                    self.feed.logger.exception("could not fetch live deltas for world_id %s zone_id %s" % (self.world_id, self.zone_id))
+                else:
+                    delta = self.apply(rows)
+                    self.since = until
+                    if delta:
+                        self.broadcast({"until": until, "series": delta})
+
+            await asyncio.sleep(self.feed.poll_interval)
+
+    def apply(self, rows):
+        delta = defaultdict(dict)
+        for row in rows:
+            outfit = row["outfit"] or "Unknown"
+            series = self.totals[row["series"]]
+            series[outfit] = series.get(outfit, 0) + row["num"]
+            delta[row["series"]][outfit] = delta[row["series"]].get(outfit, 0) + row["num"]
+
+        return delta
+
+    def broadcast(self, delta):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(("delta", delta))
+            except asyncio.QueueFull:
+                # replace the backlog with the current totals instead of growing without bound
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.snapshot()))
+
+
+def create_router(feed):
+    router = APIRouter()
+
+    @router.get("/live/{world_id}/{zone_id}")
+    async def live_events(world_id: int, zone_id: int, request: Request):
+        queue = feed.subscribe(world_id, zone_id)
+
+        async def stream():
+            try:
+                while not await request.is_disconnected():
+                    try:
+                        event, data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+
+                    yield "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+            finally:
+                feed.unsubscribe(world_id, zone_id, queue)
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            # disable response buffering in nginx based ingress controllers
+            "X-Accel-Buffering": "no",
+        })
+
+    return router
@@ -1,14 +1,32 @@
-from dash import Dash, html, dcc, dash_table, Output, Input
-import plotly.express as px
-import pandas as pd
+from dash import Dash, html, dcc, dash_table, Output, Input, State, ClientsideFunction
 from service import Service
+from coalesce import CoalescingService
 import util
 import components
+import cancellation
+import timing
+import cache
+import serialization
+import response_cache
+import jobs
+import windows
+import aggregates
+import schema
 import dash_ui as dui
 import config
 from db import DB
 from collections import Counter, defaultdict
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urlparse
+import flask
+import re
+
+
+# pandas and plotly express are slow to import and only needed once the first panel is rendered
+px = util.LazyModule("plotly.express")
+pd = util.LazyModule("pandas")
+go = util.LazyModule("plotly.graph_objects")
+plotly_subplots = util.LazyModule("plotly.subplots")
+np = util.LazyModule("numpy")
 
 
 external_stylesheets = [
@@ -28,12 +46,22 @@ meta_tags = [
 ]
 
 
+# heavy panels run as background callbacks in their own process so web workers are never blocked by them
+job_queue = jobs.JobQueue(config.JOB_CACHE_DIR(), expire=config.JOB_RESULT_EXPIRE())
+
 app = Dash(__name__,
            title="PS2 Outfit Wars Stats",
            server=True,
            assets_folder="../assets",
            external_stylesheets=external_stylesheets,
-           url_base_pathname="/")
+           url_base_pathname="/",
+           # the character page has its own layout, so not every callback's components exist on every page
+           suppress_callback_exceptions=True,
+           background_callback_manager=job_queue.manager)
+
+cancellation.init_app(app.server)
+timing.init_app(app.server)
+serialization.install(config.JSON_ENGINE())
 
 db = DB()
 db.connect(
@@ -42,55 +70,262 @@ db.connect(
     config.DB_PASSWORD(),
     config.DB_NAME(),
     config.DB_HOST(),
-    config.DB_IP_TYPE())
+    config.DB_IP_TYPE(),
+    statement_timeout=config.DB_STATEMENT_TIMEOUT_MS(),
+    replica_hosts=config.DB_REPLICA_HOSTS(),
+    health_check_interval=config.DB_REPLICA_HEALTH_CHECK_INTERVAL(),
+    lazy=True)
 
 
-service = Service(db)
+service = CoalescingService(Service(db), wait_timeout=config.COALESCE_WAIT_TIMEOUT())
 
-div = html.Div(children=[
-    html.H1(children="PS2 Outfit Wars Stats"),
+match_versions = response_cache.MatchVersions(service,
+                                              finished_after=config.MATCH_FINISHED_SECONDS(),
+                                              live_ttl=config.MATCH_VERSION_LIVE_TTL(),
+                                              finished_ttl=config.MATCH_VERSION_FINISHED_TTL())
 
-    html.Div(id="outfit_stats"),
 
-    html.Div(id="vehicle_kills"),
+# the rollups and roster read by the outfit, leaderboard and season panels, rebuilt for matches the ingester didn't load
+match_aggregates = aggregates.MatchAggregates(db, service, match_versions, timeout=config.AGGREGATE_BACKFILL_TIMEOUT_MS())
 
-    html.Div(id="infantry_stats"),
 
-    html.Div(id="infantry_kills"),
+# aggregate panels of a time window are computed from per minute prefix sums of the match instead of re-querying
+match_windows = windows.MatchWindows(service, match_versions, max_size=config.WINDOW_INDEX_CACHE_SIZE())
 
-    html.Div(id="vehicle_deaths"),
+# the whole match aggregate panels share one read of each event table, see Service.get_match_aggregates
+match_aggregates_cache = cache.TTLCache(max_size=config.MATCH_AGGREGATES_CACHE_SIZE())
 
-    html.Div(id="timeline"),
 
-    html.Div(id="vehicle_loadouts"),
+def get_match_aggregates(world_id, zone_id, character_ids):
+    version = match_versions.get_version(world_id, zone_id)
+    key = (str(world_id), str(zone_id), tuple(sorted(character_ids or [])), version)
+    # panels loading at the same time are coalesced by the service, later ones hit the cache until the match changes
+    return match_aggregates_cache.get_or_compute(key, lambda: service.get_match_aggregates(world_id, zone_id, character_ids))
 
-    html.Div(id="infantry_loadouts"),
 
-    dcc.Location(id="url", refresh=False),
+def get_panel_version(inputs):
+    world_id, zone_id, character_ids = get_match_state(inputs.get("match_state.data"))
+    if not world_id or not zone_id:
+        return None
+
+    return match_versions.get_version(world_id, zone_id)
+
+
+# the loadout panels are background callbacks whose results are cached by the job queue instead
+response_cache.init_app(app.server, outputs={
+    "outfit_stats.children",
+    "vehicle_kills.children",
+    "vehicle_kills_data.data",
+    "infantry_stats.children",
+    "infantry_stats_data.data",
+    "infantry_kills.children",
+    "vehicle_deaths.children",
+    "timeline.children",
+    "activity.children",
+    "engagements.children",
+    "leaderboard_table.data",
+}, get_version=get_panel_version, max_size=config.RESPONSE_CACHE_SIZE())
+
+# when enabled, bar chart panels send compact columnar data and the figures are built in the browser
+CLIENTSIDE_RENDERING = config.CLIENTSIDE_RENDERING()
+
+
+def create_clientside_panel(id):
+    return html.Div(id=id, children=[
+        dcc.Store(id=f"{id}_data"),
+        dcc.Graph(id=f"{id}_graph", config={"autosizable": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']}),
+        html.Br(),
+    ])
 
-    dcc.Location(id="url2", refresh=False),
-])
 
-grid = dui.Grid(_id=f"grid", num_rows=2, num_cols=1, grid_padding=5)
-grid.add_element(col=1, row=1, width=1, height=1, element=div)
+def parse_match_state(query_string):
+    params = parse_qs(query_string)
 
-controlpanel = dui.ControlPanel(_id=f"controlpanel")
-controlpanel.create_group(
-    group="Options",
-    group_title="Options"
-)
+    character_ids = params.get("character_ids")
+    if character_ids:
+        character_ids = character_ids[0].split(",")
 
-world_dropdown = components.create_dropdown(f"world", "World", util.format_for_dropdown("name", "world_id", service.get_world_list()), "1", multi=False)
-match_dropdown = components.create_dropdown(f"match", "Match", list(), None, multi=False)
-character_dropdown = components.create_dropdown(f"character", "Character", list(), [], multi=True)
-controlpanel.add_element(world_dropdown, "Options")
-controlpanel.add_element(match_dropdown, "Options")
-controlpanel.add_element(character_dropdown, "Options")
+    zone_id = params.get("match_id", [None])[0]
+    if zone_id and zone_id.isdigit():
+        # match options use integer zone_ids
+        zone_id = int(zone_id)
+
+    window = None
+    start_minute = params.get("from", [""])[0]
+    end_minute = params.get("to", [""])[0]
+    if start_minute.isdigit() and end_minute.isdigit():
+        window = [int(start_minute), int(end_minute)]
+
+    return {
+        "world_id": params.get("world_id", ["1"])[0],
+        "zone_id": zone_id,
+        "character_ids": character_ids or [],
+        "window": window,
+    }
 
-app.layout = dui.Layout(
-    grid=grid,
-    controlpanel=controlpanel
-)
+
+def get_match_state(state):
+    state = state or {}
+    return state.get("world_id"), state.get("zone_id"), state.get("character_ids")
+
+
+def get_time_window(state):
+    """The selected [start, end) minutes (since the epoch) of the match, None for the whole match."""
+
+    window = (state or {}).get("window")
+    return tuple(window) if window else None
+
+
+MATCH_AGGREGATE_METHODS = {"get_vehicle_kills", "get_vehicle_deaths_by_weapon", "get_kills_by_weapon"}
+
+
+def query_panel(method, state):
+    world_id, zone_id, character_ids = get_match_state(state)
+    window = get_time_window(state)
+    if not window:
+        if method in MATCH_AGGREGATE_METHODS:
+            return get_match_aggregates(world_id, zone_id, character_ids)[method]
+        return getattr(service, method)(world_id, zone_id, character_ids)
+
+    return match_windows.get(method, world_id, zone_id, character_ids, *window)
+
+
+CHARACTER_PATH = re.compile(r"/character/(\d+)/?")
+
+
+def get_character_url(character_id, world_id=None, zone_id=None):
+    url = "/character/%s" % character_id
+    if zone_id:
+        url += "?world_id=%s&match_id=%s" % (world_id, zone_id)
+    return url
+
+
+def serve_layout():
+    # dash requests the layout with a fetch from the page, so the page url (and its query string) is the referrer
+    path = ""
+    query_string = ""
+    if flask.has_request_context() and flask.request.referrer:
+        url = urlparse(flask.request.referrer)
+        path = url.path
+        query_string = url.query
+
+    state = parse_match_state(query_string)
+
+    character_path = CHARACTER_PATH.fullmatch(path)
+    if character_path:
+        return serve_character_layout(character_path.group(1), state)
+
+    div = html.Div(children=[
+        html.H1(children="PS2 Outfit Wars Stats"),
+
+        # the single source of truth for all panels, initialized from the url so they only load once per page view
+        dcc.Store(id="match_state", data=state),
+
+        html.Div(id="live_match", children=[
+            dcc.Graph(id="live_match_graph", config={"displayModeBar": False}),
+            dcc.Store(id="live_subscription"),
+            # ticks are handled by a clientside callback and never reach the server
+            dcc.Interval(id="live_interval", interval=1000),
+        ]),
+
+        html.Div(id="character_links"),
+
+        html.Div(id="outfit_stats"),
+
+        create_clientside_panel("vehicle_kills") if CLIENTSIDE_RENDERING else html.Div(id="vehicle_kills"),
+
+        create_clientside_panel("infantry_stats") if CLIENTSIDE_RENDERING else html.Div(id="infantry_stats"),
+
+        html.Div(id="infantry_kills"),
+
+        html.Div(id="vehicle_deaths"),
+
+        # expensive panels are only computed once they are expanded
+        components.create_lazy_panel("timeline", "Facility Control Timeline"),
+
+        components.create_lazy_panel("activity", "Activity Over Time"),
+
+        components.create_lazy_panel("engagements", "Who Killed Whom"),
+
+        components.create_lazy_panel("vehicle_loadouts", "Vehicle Use Over Time", progress=True),
+
+        components.create_lazy_panel("infantry_loadouts", "Infantry Loadouts Over Time", progress=True),
+
+        components.create_lazy_panel("leaderboard", "Match Leaderboard", content=[
+            # sorting is done by the server, so each column's top players come from the rollup's index on it
+            dash_table.DataTable(id="leaderboard_table",
+                                 columns=[{"name": i, "id": i, "sortable": i in schema.LEADERBOARD_METRICS} for i in LEADERBOARD_COLUMNS],
+                                 sort_action="custom",
+                                 sort_mode="single",
+                                 sort_by=[{"column_id": "kills", "direction": "desc"}]),
+        ]),
+
+        components.create_lazy_panel("season_stats", "Season Totals"),
+
+        # rows are fetched page by page from the /events api and appended by the event_log clientside functions
+        components.create_lazy_panel("event_log", "Event Log", content=[
+            dcc.Store(id="event_log_source"),
+            html.Div(id="event_log_scroll", className="event-log", children=[
+                html.Table(className="table table-sm", children=[
+                    html.Thead(html.Tr([html.Th(column) for column in ["Time", "Event", "Attacker", "Victim", "Weapon", "Vehicle"]])),
+                    html.Tbody(id="event_log_rows"),
+                ]),
+                html.Div(id="event_log_sentinel"),
+            ]),
+        ]),
+
+        dcc.Location(id="url", refresh=False),
+    ])
+
+    grid = dui.Grid(_id=f"grid", num_rows=2, num_cols=1, grid_padding=5)
+    grid.add_element(col=1, row=1, width=1, height=1, element=div)
+
+    controlpanel = dui.ControlPanel(_id=f"controlpanel")
+    controlpanel.create_group(
+        group="Options",
+        group_title="Options"
+    )
+
+    world_dropdown = components.create_dropdown(f"world", "World", list(), state["world_id"], multi=False)
+    match_dropdown = components.create_dropdown(f"match", "Match", list(), state["zone_id"], multi=False)
+    character_dropdown = components.create_dropdown(f"character", "Character", list(), state["character_ids"], multi=True)
+    time_window_slider = components.create_range_slider(f"time_window", "Time Window")
+    controlpanel.add_element(world_dropdown, "Options")
+    controlpanel.add_element(match_dropdown, "Options")
+    controlpanel.add_element(character_dropdown, "Options")
+    controlpanel.add_element(time_window_slider, "Options")
+
+    return dui.Layout(
+        grid=grid,
+        controlpanel=controlpanel
+    )
+
+
+def serve_character_layout(character_id, state):
+    return html.Div(className="container container-xxl", children=[
+        dcc.Link("PS2 Outfit Wars Stats", href="/"),
+
+        dcc.Store(id="character_state", data={
+            "character_id": character_id,
+            "world_id": state["world_id"],
+            "zone_id": state["zone_id"],
+        }),
+
+        html.Div(id="character_header"),
+
+        html.Div(id="character_matches"),
+
+        html.Div(id="character_kills"),
+
+        html.Div(id="character_deaths"),
+
+        html.Div(id="character_vehicles_lost"),
+
+        html.Div(id="character_loadouts"),
+    ])
+
+
+app.layout = serve_layout
 
 
 # https://colorkit.co/color-shades-generator
@@ -121,10 +356,50 @@ def get_attacker(r):
     return "[%s] %s" % (r['attacker_outfit'], category)
 
 
+def create_bar_payload(title, y_label, y_values, x_label, x_values, color_label, color_values, color_map, color_order):
+    """Columnar equivalent of a relative horizontal px.bar figure; built into a figure by the figures.bar clientside callback."""
+
+    y_categories = sorted(set(y_values))
+    # same trace order as plotly express: explicitly ordered categories first, then in order of appearance
+    present = set(color_values)
+    color_categories = [c for c in color_order if c in present] + [c for c in dict.fromkeys(color_values) if c not in color_order]
+
+    y_codes = {c: i for i, c in enumerate(y_categories)}
+    color_codes = {c: i for i, c in enumerate(color_categories)}
+
+    return {
+        "title": title,
+        "labels": {"x": x_label, "y": y_label, "color": color_label},
+        "x": x_values,
+        "y": [y_codes[v] for v in y_values],
+        "y_categories": y_categories,
+        "color": [color_codes[v] for v in color_values],
+        "color_categories": color_categories,
+        "color_map": {c: color_map[c] for c in color_categories if c in color_map},
+    }
+
+
+world_list_cache = cache.TTLCache(ttl=config.WORLD_LIST_CACHE_SECONDS())
+
+
+def get_world_options():
+    return world_list_cache.get_or_compute("worlds", lambda: util.format_for_dropdown("name", "world_id", service.get_world_list()))
+
+
+@app.callback(
+    Output(f"world_dropdown", "options"),
+    Input("url", "pathname"),
+)
+@timing.instrument("world_list")
+def update_world_list(pathname):
+    return get_world_options()
+
+
 @app.callback(
     Output(f"match_dropdown", "options"),
     Input(f"world_dropdown", "value"),
 )
+@timing.instrument("match_list")
 def update_match_list(world_id):
     if not world_id:
         return []
@@ -134,10 +409,11 @@ def update_match_list(world_id):
 
 @app.callback(
     Output(f"character_dropdown", "options"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
+    Input("match_state", "data"),
 )
-def update_character_list(world_id, zone_id):
+@timing.instrument("character_list")
+def update_character_list(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
         return []
 
@@ -145,16 +421,124 @@ def update_character_list(world_id, zone_id):
 
 
 @app.callback(
-    Output(f"outfit_stats", "children"),
+    Output(f"time_window_slider", "min"),
+    Output(f"time_window_slider", "max"),
+    Output(f"time_window_slider", "marks"),
+    Output(f"time_window_slider", "value"),
+    Input(f"match_dropdown", "value"),
+    State(f"world_dropdown", "value"),
+    State("match_state", "data"),
+)
+@timing.instrument("time_window")
+def update_time_window_range(zone_id, world_id, state):
+    if not world_id or not zone_id:
+        return 0, 1, None, None
+
+    row = service.get_match_range(world_id, zone_id)
+    if not row or row["first_timestamp"] is None:
+        return 0, 1, None, None
+
+    first_minute = row["first_timestamp"] // 60
+    last_minute = row["last_timestamp"] // 60 + 1
+    marks = {minute: "%dm" % (minute - first_minute) for minute in range(first_minute, last_minute + 1, 10)}
+
+    # keep a window that came with the page url
+    window = get_time_window(state)
+    if window and str(state.get("zone_id")) == str(zone_id):
+        return first_minute, last_minute, marks, list(window)
+
+    return first_minute, last_minute, marks, [first_minute, last_minute]
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="state", function_name="update"),
+    Output("match_state", "data"),
     Input(f"world_dropdown", "value"),
     Input(f"match_dropdown", "value"),
     Input(f"character_dropdown", "value"),
+    Input(f"time_window_slider", "value"),
+    State(f"time_window_slider", "min"),
+    State(f"time_window_slider", "max"),
+    State("match_state", "data"),
+    prevent_initial_call=True,
+)
+
+
+@app.callback(
+    Output(f"character_links", "children"),
+    Input("match_state", "data"),
+    State(f"character_dropdown", "options"),
+)
+@timing.instrument("character_links")
+def update_character_links(state, options):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not character_ids:
+        return []
+
+    labels = {option["value"]: option["label"] for option in options or []}
+    return [
+        html.Span([dcc.Link(labels.get(character_id, character_id), href=get_character_url(character_id, world_id, zone_id)), " "])
+        for character_id in character_ids
+    ]
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="state", function_name="url"),
+    Output("url", "search"),
+    Input("match_state", "data"),
+    prevent_initial_call=True,
+)
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="event_log", function_name="start"),
+    Output("event_log_source", "data"),
+    Input("match_state", "data"),
+    Input(f"event_log_accordion", "active_item"),
+)
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="live", function_name="subscribe"),
+    Output("live_subscription", "data"),
+    Input("match_state", "data"),
 )
-def update_outfit_stats(world_id, zone_id, character_ids):
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="live", function_name="render"),
+    Output("live_match_graph", "figure"),
+    Input("live_interval", "n_intervals"),
+    Input("live_subscription", "data"),
+)
+
+
+if CLIENTSIDE_RENDERING:
+    for panel in ["vehicle_kills", "infantry_stats"]:
+        app.clientside_callback(
+            ClientsideFunction(namespace="figures", function_name="bar"),
+            Output(f"{panel}_graph", "figure"),
+            Input(f"{panel}_data", "data"),
+        )
+
+
+@app.callback(
+    Output(f"outfit_stats", "children"),
+    Input("match_state", "data"),
+)
+@timing.instrument("outfit_stats")
+@cancellation.supersedable("outfit_stats")
+def update_outfit_stats(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
         return []
 
     rows = service.get_outfit_stats(world_id, zone_id, character_ids)
+    if not rows and not service.has_match_roster(world_id, zone_id):
+        # matches the ingester didn't load have no roster as of the match, today's character info changes so it isn't cached
+        response_cache.skip()
+        rows = service.get_current_outfit_stats(world_id, zone_id, character_ids)
+
     events = []
     for row in rows:
         d = { k: v for k, v in row.items() }
@@ -176,20 +560,21 @@ def update_outfit_stats(world_id, zone_id, character_ids):
 
 
 @app.callback(
-    Output(f"vehicle_kills", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Output(f"vehicle_kills_data", "data") if CLIENTSIDE_RENDERING else Output(f"vehicle_kills", "children"),
+    Input("match_state", "data"),
 )
-def update_vehicle_kills(world_id, zone_id, character_ids):
+@timing.instrument("vehicle_kills")
+@cancellation.supersedable("vehicle_kills")
+def update_vehicle_kills(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
-        return []
+        return None if CLIENTSIDE_RENDERING else []
 
     col1 = "Vehicle [Outfit]"
     col2 = "Amount Lost"
     col3 = "Attacker"
 
-    results = service.get_vehicle_kills(world_id, zone_id, character_ids)
+    results = query_panel("get_vehicle_kills", state)
     # print(vehicles_killed_list)
 
     col1_values = []
@@ -217,6 +602,9 @@ def update_vehicle_kills(world_id, zone_id, character_ids):
 
     color_map["Unknown"] = "black"
 
+    if CLIENTSIDE_RENDERING:
+        return create_bar_payload("Vehicles Lost", col1, col1_values, col2, col2_values, col3, col3_values, color_map, col3_order)
+
     # assume you have a "long-form" data frame
     # see https://plotly.com/python/px-arguments/ for more options
     df = pd.DataFrame({
@@ -225,12 +613,13 @@ def update_vehicle_kills(world_id, zone_id, character_ids):
         col3: col3_values
     })
 
-    fig = px.bar(df, x=col2, y=col1, color=col3, barmode="relative", height=800, title="Vehicles Lost",
-                 color_discrete_map=color_map,
-                 category_orders={
-                     col1: sorted(set(df[col1].values)),
-                     col3: col3_order
-                 })
+    with timing.phase("figure"):
+        fig = px.bar(df, x=col2, y=col1, color=col3, barmode="relative", height=800, title="Vehicles Lost",
+                     color_discrete_map=color_map,
+                     category_orders={
+                         col1: sorted(set(df[col1].values)),
+                         col3: col3_order
+                     })
 
     conf = dict({"autosizable": True, "sendData": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']})
     graph = dcc.Graph(
@@ -246,20 +635,21 @@ def update_vehicle_kills(world_id, zone_id, character_ids):
 
 
 @app.callback(
-    Output(f"infantry_stats", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Output(f"infantry_stats_data", "data") if CLIENTSIDE_RENDERING else Output(f"infantry_stats", "children"),
+    Input("match_state", "data"),
 )
-def update_infantry_stats(world_id, zone_id, character_ids):
+@timing.instrument("infantry_stats")
+@cancellation.supersedable("infantry_stats")
+def update_infantry_stats(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
-        return []
+        return None if CLIENTSIDE_RENDERING else []
 
     col1 = "Action [Outfit]"
     col2 = "Count"
     col3 = "Outfit"
 
-    results = service.get_infantry_stats(world_id, zone_id, character_ids)
+    results = query_panel("get_infantry_stats", state)
 
     col1_values = []
     col2_values = []
@@ -275,6 +665,9 @@ def update_infantry_stats(world_id, zone_id, character_ids):
             color_map[outfit] = colors[i][0]
     color_map["Unknown"] = "black"
 
+    if CLIENTSIDE_RENDERING:
+        return create_bar_payload("Infantry Stats", col1, col1_values, col2, col2_values, col3, col3_values, color_map, [])
+
     # assume you have a "long-form" data frame
     # see https://plotly.com/python/px-arguments/ for more options
     df = pd.DataFrame({
@@ -283,11 +676,12 @@ def update_infantry_stats(world_id, zone_id, character_ids):
         col3: col3_values
     })
 
-    fig = px.bar(df, x=col2, y=col1, color=col3, barmode="relative", height=800, title="Infantry Stats",
-                 color_discrete_map=color_map,
-                 category_orders={
-                     col1: sorted(set(df[col1].values))
-                 })
+    with timing.phase("figure"):
+        fig = px.bar(df, x=col2, y=col1, color=col3, barmode="relative", height=800, title="Infantry Stats",
+                     color_discrete_map=color_map,
+                     category_orders={
+                         col1: sorted(set(df[col1].values))
+                     })
 
     conf = dict(
         {"autosizable": True, "sendData": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']})
@@ -305,15 +699,16 @@ def update_infantry_stats(world_id, zone_id, character_ids):
 
 @app.callback(
     Output(f"infantry_kills", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Input("match_state", "data"),
 )
-def update_kills_by_weapon(world_id, zone_id, character_ids):
+@timing.instrument("infantry_kills")
+@cancellation.supersedable("infantry_kills")
+def update_kills_by_weapon(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
         return []
 
-    rows = service.get_kills_by_weapon(world_id, zone_id, character_ids)
+    rows = query_panel("get_kills_by_weapon", state)
     events = []
     for row in rows:
         d = { k: v for k, v in row.items() }
@@ -337,15 +732,16 @@ def update_kills_by_weapon(world_id, zone_id, character_ids):
 
 @app.callback(
     Output(f"vehicle_deaths", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Input("match_state", "data"),
 )
-def update_vehicle_deaths_by_weapon(world_id, zone_id, character_ids):
+@timing.instrument("vehicle_deaths")
+@cancellation.supersedable("vehicle_deaths")
+def update_vehicle_deaths_by_weapon(state):
+    world_id, zone_id, character_ids = get_match_state(state)
     if not world_id or not zone_id:
         return []
 
-    rows = service.get_vehicle_deaths_by_weapon(world_id, zone_id, character_ids)
+    rows = query_panel("get_vehicle_deaths_by_weapon", state)
     events = []
     for row in rows:
         d = { k: v for k, v in row.items() }
@@ -366,70 +762,43 @@ def update_vehicle_deaths_by_weapon(world_id, zone_id, character_ids):
     ]
 
 
+def set_time_window_range(fig, window):
+    if window:
+        fig.update_xaxes(range=[pd.to_datetime(window[0] * 60, unit="s"), pd.to_datetime(window[1] * 60, unit="s")])
+
+
 @app.callback(
     Output(f"timeline", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
+    Input("match_state", "data"),
+    Input(f"timeline_accordion", "active_item"),
 )
-def update_timeline(world_id, zone_id):
-    if not world_id or not zone_id:
+@timing.instrument("timeline")
+@cancellation.supersedable("timeline")
+def update_timeline(state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
         return []
     
-    results = service.get_timeline(world_id, zone_id)
+    intervals = service.get_facility_intervals(world_id, zone_id, config.TIMELINE_OPEN_SECONDS())
+    totals = service.get_facility_hold_totals(world_id, zone_id, config.TIMELINE_OPEN_SECONDS())
 
     FACILITY_LABEL = "Facility"
     COLOR_LABEL = "Team"
 
-    data = []
-    previous_row = None
-    last_time = 0
-    for row in results:
-        if not previous_row:
-            previous_row = row
-            last_time = row["timestamp"]
-            continue
-
-        data.append({
-            FACILITY_LABEL: previous_row["facility"],
-            "Start": previous_row["timestamp"],
-            "Finish": row["timestamp"] if row["facility_id"] == previous_row["facility_id"] else None,
-            COLOR_LABEL: previous_row["team"],
-            "Outfit": previous_row["outfit"],
-        })
-
-        if last_time < row["timestamp"]:
-            last_time = row["timestamp"]
-
-        previous_row = row
-
-    # add the last row to the data set
-    if previous_row:
-        data.append({
-            FACILITY_LABEL: previous_row["facility"],
-            "Start": previous_row["timestamp"],
-            "Finish": None,
-            COLOR_LABEL: previous_row["team"],
-            "Outfit": previous_row["outfit"],
-        })
-    
-    # add extra time to last_time so the final ownership shows up in the graph
-    last_time += 120
-
-    # set last_time for rows that don't have a Finish time already set
-    for item in data:
-        if not item["Finish"]:
-            item["Finish"] = last_time
-
-    df = pd.DataFrame.from_records(data)
-    if data:
+    df = pd.DataFrame([dict(row) for row in intervals])
+    if not df.empty:
+        df = df.rename(columns={"facility": FACILITY_LABEL, "team": COLOR_LABEL, "outfit": "Outfit", "start_timestamp": "Start", "finish_timestamp": "Finish"})
         # convert unix epocs to timestamps
         df["Start"] = pd.to_datetime(df["Start"], unit="s")
         df["Finish"] = pd.to_datetime(df["Finish"], unit="s")
         
-        fig = px.timeline(df, x_start="Start", x_end="Finish", y=FACILITY_LABEL,
-                            color=COLOR_LABEL,
-                            hover_data=["Outfit"],
-                            color_discrete_map={"Omega (Blue)": "#1e487b", "Alpha (Red)": "#961c03"})
+        with timing.phase("figure"):
+            fig = px.timeline(df, x_start="Start", x_end="Finish", y=FACILITY_LABEL,
+                                color=COLOR_LABEL,
+                                hover_data=["Outfit"],
+                                color_discrete_map={"Omega (Blue)": "#1e487b", "Alpha (Red)": "#961c03"})
+
+        set_time_window_range(fig, get_time_window(state))
         
         conf = dict({
             "autosizable": True,
@@ -452,21 +821,181 @@ def update_timeline(world_id, zone_id):
         html.H1("Facility Control Timeline"),
         graph,
         html.Br(),
+    ] + (create_table("Facility Hold Times", totals, "hold_seconds") if totals else [])
+
+
+ACTIVITY_SERIES = ["Kills", "Vehicles Lost", "Revives & Heals"]
+
+
+def create_activity_matrix(rows, bucket_seconds):
+    """(bucket x (series, outfit)) counts, with a row for every bucket of the match including empty ones."""
+
+    df = pd.DataFrame([dict(row) for row in rows])
+    df["outfit"] = df["outfit"].fillna("Unknown")
+
+    matrix = df.pivot_table(index="bucket", columns=["series", "outfit"], values="num", aggfunc="sum", fill_value=0)
+    return matrix.reindex(range(matrix.index.min(), matrix.index.max() + bucket_seconds, bucket_seconds), fill_value=0)
+
+
+@app.callback(
+    Output(f"activity", "children"),
+    Input("match_state", "data"),
+    Input(f"activity_accordion", "active_item"),
+)
+@timing.instrument("activity")
+@cancellation.supersedable("activity")
+def update_activity(state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
+        return []
+
+    bucket_seconds = config.ACTIVITY_BUCKET_SECONDS()
+    rows = service.get_activity(world_id, zone_id, character_ids, bucket_seconds)
+    if not rows:
+        return []
+
+    matrix = create_activity_matrix(rows, bucket_seconds)
+    dates = pd.to_datetime(matrix.index, unit="s")
+
+    # most active outfits first, with the same color in every chart
+    outfits = matrix.T.groupby(level="outfit").sum().sum(axis=1).sort_values(ascending=False).index
+    outfit_colors = {outfit: colors[i][1] for i, outfit in enumerate(outfits) if i < len(colors)}
+
+    with timing.phase("figure"):
+        fig = plotly_subplots.make_subplots(rows=len(ACTIVITY_SERIES), cols=1, shared_xaxes=True, vertical_spacing=0.06,
+                                            subplot_titles=ACTIVITY_SERIES)
+        for row_index, series in enumerate(ACTIVITY_SERIES, 1):
+            for outfit in outfits:
+                if (series, outfit) not in matrix.columns:
+                    continue
+
+                fig.add_trace(go.Scatter(x=dates, y=matrix[(series, outfit)].values, mode="lines", name=outfit,
+                                         legendgroup=outfit, showlegend=row_index == 1,
+                                         line={"color": outfit_colors.get(outfit), "shape": "hv"}),
+                              row=row_index, col=1)
+
+        fig.update_layout(title="Activity Over Time (per %d seconds)" % bucket_seconds, height=800, legend_title_text="Outfit")
+        set_time_window_range(fig, get_time_window(state))
+
+    return [
+        dcc.Graph(figure=fig, config={"autosizable": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']}),
+        html.Br(),
     ]
 
 
+ENGAGEMENT_SERIES = [("kills", "Kills"), ("vehicle_kills", "Vehicle Kills")]
+
+
+def create_engagement_matrices(rows, top_k):
+    """(attacker x victim) matrices of every engagement series, limited to the top_k most involved ids on both axes."""
+
+    df = pd.DataFrame([dict(row) for row in rows])
+    df["total"] = sum(df[column].astype(np.int64) for column, title in ENGAGEMENT_SERIES)
+
+    # ids are ranked on the grouped rows, so only the top_k x top_k matrices are ever allocated
+    involvement = df.groupby("attacker_id")["total"].sum().add(df.groupby("victim_id")["total"].sum(), fill_value=0)
+    keep = involvement.sort_values(ascending=False, kind="stable").index[:top_k]
+
+    labels = pd.concat([df.set_index("attacker_id")["attacker"], df.set_index("victim_id")["victim"]])
+    labels = labels[~labels.index.duplicated()]
+    names = [str(labels[id]) for id in keep]
+
+    df = df[df["attacker_id"].isin(keep) & df["victim_id"].isin(keep)]
+    attacker_codes = pd.Categorical(df["attacker_id"], categories=keep).codes
+    victim_codes = pd.Categorical(df["victim_id"], categories=keep).codes
+
+    matrices = {}
+    for column, title in ENGAGEMENT_SERIES:
+        matrix = np.zeros((len(keep), len(keep)), dtype=np.int64)
+        # COO style, duplicate (attacker, victim) pairs are summed
+        np.add.at(matrix, (attacker_codes, victim_codes), df[column].astype(np.int64).values)
+        matrices[column] = matrix
+
+    return names, matrices
+
+
+@app.callback(
+    Output(f"engagements", "children"),
+    Input("match_state", "data"),
+    Input(f"engagements_accordion", "active_item"),
+)
+@timing.instrument("engagements")
+@cancellation.supersedable("engagements")
+def update_engagements(state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
+        return []
+
+    # windows are in minutes, see get_time_window
+    window = get_time_window(state)
+    start, end = (window[0] * 60, window[1] * 60) if window else (None, None)
+
+    # outfits against outfits, or the selected players against whoever they fought
+    if character_ids:
+        rows = service.get_character_engagements(world_id, zone_id, character_ids, start, end)
+    else:
+        rows = service.get_outfit_engagements(world_id, zone_id, start, end)
+    if not rows:
+        return []
+
+    top_k = config.ENGAGEMENT_TOP_K()
+    names, matrices = create_engagement_matrices(rows, top_k)
+
+    with timing.phase("figure"):
+        fig = plotly_subplots.make_subplots(rows=1, cols=len(ENGAGEMENT_SERIES), shared_yaxes=True, horizontal_spacing=0.04,
+                                            subplot_titles=[title for column, title in ENGAGEMENT_SERIES])
+        for col_index, (column, title) in enumerate(ENGAGEMENT_SERIES, 1):
+            fig.add_trace(go.Heatmap(z=matrices[column], x=names, y=names, coloraxis="coloraxis",
+                                     hovertemplate="%{y} killed %{x}: %{z}<extra>" + title + "</extra>"),
+                          row=1, col=col_index)
+
+        fig.update_layout(title="Who Killed Whom (top %d %s)" % (top_k, "players" if character_ids else "outfits"),
+                          height=max(400, 30 * len(names) + 200), coloraxis={"colorscale": "Reds"})
+        fig.update_yaxes(title_text="Attacker", autorange="reversed", row=1, col=1)
+        fig.update_xaxes(title_text="Victim")
+
+    return [
+        dcc.Graph(figure=fig, config={"autosizable": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']}),
+        html.Br(),
+    ]
+
+
+def get_loadout_rows(world_id, zone_id, character_ids, version):
+    # shared by both loadout panels
+    return job_queue.run_deduplicated(["loadouts", world_id, zone_id, sorted(character_ids or []), version],
+                                      lambda: [dict(row) for row in service.get_loadouts(world_id, zone_id, character_ids)])
+
+
+def run_loadouts_job(panel, build, set_progress, world_id, zone_id, character_ids, window):
+    version = match_versions.get_version(world_id, zone_id)
+
+    def compute():
+        set_progress("Loading events...")
+        rows = get_loadout_rows(world_id, zone_id, character_ids, version)
+        set_progress("Building chart...")
+        # the counts carry over from earlier events, so the whole match is built and only the shown range is limited
+        return build(rows, window)
+
+    return job_queue.run_deduplicated([panel, world_id, zone_id, sorted(character_ids or []), window, version], compute)
+
+
 @app.callback(
     Output(f"vehicle_loadouts", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Input("match_state", "data"),
+    Input(f"vehicle_loadouts_accordion", "active_item"),
+    background=True,
+    progress=Output(f"vehicle_loadouts_progress", "children"),
+    running=[(Output(f"vehicle_loadouts_progress", "style"), {"display": "block"}, {"display": "none"})],
 )
-def update_vehicle_loadouts(world_id, zone_id, character_ids):
-    if not world_id or not zone_id:
+def update_vehicle_loadouts(set_progress, state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
         return []
 
-    rows = service.get_loadouts(world_id, zone_id, character_ids)
+    return run_loadouts_job("vehicle_loadouts", build_vehicle_loadouts, set_progress, world_id, zone_id, character_ids, get_time_window(state))
+
 
+def build_vehicle_loadouts(rows, window=None):
     loadout_counts = Counter()
     results = []
     player_loadout_previous = defaultdict(int)
@@ -508,18 +1037,21 @@ def update_vehicle_loadouts(world_id, zone_id, character_ids):
             df.drop(columns=[loadout_key], inplace=True)
             loadout_keys.remove(loadout_key)
 
-    fig = px.area(df, x="date", y=list(loadout_keys),
-                  #color_discrete_map=color_map,
-                  #hover_data={"date": "|%B %d, %Y"},
-                  labels={
-                      "variable": "Vehicle [Outfit]",
-                      "value": "Amount",
-                      "date": "Time"
-                  },
-                  category_orders={
-                      "variable": sorted(loadout_keys)
-                  },
-                  title="Vehicle Use Over Time")
+    with timing.phase("figure"):
+        fig = px.area(df, x="date", y=list(loadout_keys),
+                      #color_discrete_map=color_map,
+                      #hover_data={"date": "|%B %d, %Y"},
+                      labels={
+                          "variable": "Vehicle [Outfit]",
+                          "value": "Amount",
+                          "date": "Time"
+                      },
+                      category_orders={
+                          "variable": sorted(loadout_keys)
+                      },
+                      title="Vehicle Use Over Time")
+
+    set_time_window_range(fig, window)
 
     conf = dict({
         "autosizable": True,
@@ -543,16 +1075,21 @@ def update_vehicle_loadouts(world_id, zone_id, character_ids):
 
 @app.callback(
     Output(f"infantry_loadouts", "children"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Input("match_state", "data"),
+    Input(f"infantry_loadouts_accordion", "active_item"),
+    background=True,
+    progress=Output(f"infantry_loadouts_progress", "children"),
+    running=[(Output(f"infantry_loadouts_progress", "style"), {"display": "block"}, {"display": "none"})],
 )
-def update_infantry_loadouts(world_id, zone_id, character_ids):
-    if not world_id or not zone_id:
+def update_infantry_loadouts(set_progress, state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
         return []
 
-    rows = service.get_loadouts(world_id, zone_id, character_ids)
+    return run_loadouts_job("infantry_loadouts", build_infantry_loadouts, set_progress, world_id, zone_id, character_ids, get_time_window(state))
 
+
+def build_infantry_loadouts(rows, window=None):
     loadout_counts = Counter()
     results = []
     player_loadout_previous = defaultdict(int)
@@ -589,18 +1126,21 @@ def update_infantry_loadouts(world_id, zone_id, character_ids):
     df["date"] = pd.to_datetime(df["timestamp"], unit="s")
     df.fillna(0, inplace=True)
 
-    fig = px.area(df, x="date", y=list(loadout_keys),
-                  #color_discrete_map=color_map,
-                  #hover_data={"date": "|%B %d, %Y"},labels={
-                  labels={
-                      "variable": "Loadout [Outfit]",
-                      "value": "Amount",
-                      "date": "Time"
-                  },
-                  category_orders={
-                      "variable": sorted(loadout_keys)
-                  },
-                  title="Infantry Loadouts Over Time")
+    with timing.phase("figure"):
+        fig = px.area(df, x="date", y=list(loadout_keys),
+                      #color_discrete_map=color_map,
+                      #hover_data={"date": "|%B %d, %Y"},labels={
+                      labels={
+                          "variable": "Loadout [Outfit]",
+                          "value": "Amount",
+                          "date": "Time"
+                      },
+                      category_orders={
+                          "variable": sorted(loadout_keys)
+                      },
+                      title="Infantry Loadouts Over Time")
+
+    set_time_window_range(fig, window)
 
     conf = dict({
         "autosizable": True,
@@ -623,38 +1163,189 @@ def update_infantry_loadouts(world_id, zone_id, character_ids):
 
 
 @app.callback(
-    Output(f"world_dropdown", "value"),
-    Output(f"match_dropdown", "value"),
-    Output(f"character_dropdown", "value"),
-    Input("url2", "search"),
+    Output(f"season_stats", "children"),
+    Input("match_state", "data"),
+    Input(f"season_stats_accordion", "active_item"),
 )
-def update_params(query_string):
-    params = parse_qs(query_string[1:])
+@timing.instrument("season_stats")
+@cancellation.supersedable("season_stats")
+def update_season_stats(state, active_item):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not components.is_expanded(active_item):
+        return []
 
-    character_ids = params.get("character_ids")
-    if character_ids:
-        character_ids = character_ids[0].split(",")
+    # running and other matches of the world are backfilled in the background, see aggregates.maintain
+    if zone_id:
+        match_aggregates.ensure(world_id, zone_id)
 
-    return (
-        params.get("world_id", ["1"])[0],
-        params.get("match_id", [None])[0],
-        character_ids,
-    )
+    outfits = pd.DataFrame([dict(row) for row in service.get_season_outfit_stats(world_id)])
+    players = pd.DataFrame([dict(row) for row in service.get_season_character_stats(world_id)])
+
+    return [
+        html.H1("Season Outfit Totals"),
+        dash_table.DataTable(data=outfits.to_dict("records"),
+                             columns=[{"name": i, "id": i} for i in outfits.columns],
+                             page_size=10,
+                             sort_action="native",
+                             sort_by=[{"column_id": "kills", "direction": "desc"}],
+                             page_action="native"),
+        html.Br(),
+        html.H1("Season Player Totals"),
+        dash_table.DataTable(data=players.to_dict("records"),
+                             columns=[{"name": i, "id": i} for i in players.columns],
+                             page_size=20,
+                             sort_action="native",
+                             sort_by=[{"column_id": "kills", "direction": "desc"}],
+                             filter_action="native",
+                             page_action="native"),
+        html.Br(),
+    ]
+
+
+LEADERBOARD_COLUMNS = ["name", "outfit"] + schema.LEADERBOARD_METRICS
 
 
 @app.callback(
-    Output("url", "search"),
-    Input(f"world_dropdown", "value"),
-    Input(f"match_dropdown", "value"),
-    Input(f"character_dropdown", "value"),
+    Output("leaderboard_table", "data"),
+    Input("match_state", "data"),
+    Input("leaderboard_accordion", "active_item"),
+    Input("leaderboard_table", "sort_by"),
 )
-def update_url(world_id, match_id, character_ids):
-    params = []
-    if world_id:
-        params.append(f"world_id={world_id}")
-    if match_id:
-        params.append(f"match_id={match_id}")
-    if character_ids:
-        params.append(f"character_ids={','.join(character_ids)}")
+@timing.instrument("leaderboard")
+@cancellation.supersedable("leaderboard")
+def update_leaderboard(state, active_item, sort_by):
+    world_id, zone_id, character_ids = get_match_state(state)
+    if not world_id or not zone_id or not components.is_expanded(active_item):
+        return []
+
+    # only descending top lists are served, any column click shows that column's leaders
+    metric = sort_by[0]["column_id"] if sort_by else "kills"
+    if metric not in schema.LEADERBOARD_METRICS:
+        metric = "kills"
 
-    return "?" + "&".join(params)
+    match_aggregates.ensure(world_id, zone_id)
+    rows = service.get_leaderboard(world_id, zone_id, metric, config.LEADERBOARD_SIZE())
+    return [{column: row[column] for column in LEADERBOARD_COLUMNS} for row in rows]
+
+
+def get_character_state(state):
+    state = state or {}
+    return state.get("character_id"), state.get("world_id"), state.get("zone_id")
+
+
+def create_table(title, rows, sort_column, page_size=10):
+    df = pd.DataFrame([dict(row) for row in rows])
+
+    return [
+        html.H2(title),
+        dash_table.DataTable(data=df.to_dict("records"),
+                             columns=[{"name": i, "id": i} for i in df.columns],
+                             page_size=page_size,
+                             sort_action="native",
+                             sort_by=[{"column_id": sort_column, "direction": "desc"}] if sort_column in df.columns else [],
+                             page_action="native"),
+        html.Br(),
+    ]
+
+
+@app.callback(
+    Output(f"character_header", "children"),
+    Output(f"character_matches", "children"),
+    Input("character_state", "data"),
+)
+@timing.instrument("character_overview")
+@cancellation.supersedable("character_overview")
+def update_character_overview(state):
+    character_id, world_id, zone_id = get_character_state(state)
+
+    character = service.get_character(character_id)
+    name = "[%s] %s" % (character["outfit"], character["name"]) if character else character_id
+    scope = "Match %s" % zone_id if zone_id else "All Matches"
+
+    header = [html.H1(name), html.H4(scope)]
+    if zone_id:
+        header.append(dcc.Link("Show all matches", href=get_character_url(character_id)))
+
+    matches = []
+    for row in service.get_character_matches(character_id):
+        d = dict(row)
+        d["zone_id"] = "[%s](%s)" % (row["zone_id"], get_character_url(character_id, row["world_id"], row["zone_id"]))
+        matches.append(d)
+
+    df = pd.DataFrame(matches)
+
+    return header, [
+        html.H2("Matches"),
+        dash_table.DataTable(data=df.to_dict("records"),
+                             columns=[{"name": i, "id": i, "presentation": "markdown"} if i == "zone_id" else {"name": i, "id": i} for i in df.columns],
+                             page_size=10,
+                             sort_action="native",
+                             page_action="native"),
+        html.Br(),
+    ]
+
+
+@app.callback(
+    Output(f"character_kills", "children"),
+    Input("character_state", "data"),
+)
+@timing.instrument("character_kills")
+@cancellation.supersedable("character_kills")
+def update_character_kills(state):
+    character_id, world_id, zone_id = get_character_state(state)
+    return create_table("Kills By Weapon", service.get_character_kills_by_weapon(character_id, world_id, zone_id), "kills")
+
+
+@app.callback(
+    Output(f"character_deaths", "children"),
+    Input("character_state", "data"),
+)
+@timing.instrument("character_deaths")
+@cancellation.supersedable("character_deaths")
+def update_character_deaths(state):
+    character_id, world_id, zone_id = get_character_state(state)
+    return create_table("Deaths By Weapon", service.get_character_deaths_by_weapon(character_id, world_id, zone_id), "deaths")
+
+
+@app.callback(
+    Output(f"character_vehicles_lost", "children"),
+    Input("character_state", "data"),
+)
+@timing.instrument("character_vehicles_lost")
+@cancellation.supersedable("character_vehicles_lost")
+def update_character_vehicles_lost(state):
+    character_id, world_id, zone_id = get_character_state(state)
+    return create_table("Vehicles Lost", service.get_character_vehicles_lost(character_id, world_id, zone_id), "lost")
+
+
+@app.callback(
+    Output(f"character_loadouts", "children"),
+    Input("character_state", "data"),
+)
+@timing.instrument("character_loadouts")
+@cancellation.supersedable("character_loadouts")
+def update_character_loadouts(state):
+    character_id, world_id, zone_id = get_character_state(state)
+    # the history is per match, across matches it would be unreadable
+    if not zone_id:
+        return []
+
+    rows = service.get_character_loadouts(character_id, world_id, zone_id)
+    if not rows:
+        return []
+
+    df = pd.DataFrame([dict(row) for row in rows])
+    df["date"] = pd.to_datetime(df["timestamp"], unit="s")
+    df["vehicle_name"] = df["vehicle_name"].fillna("Infantry")
+
+    with timing.phase("figure"):
+        fig = px.scatter(df, x="date", y="loadout", color="event", symbol="event",
+                         hover_data=["vehicle_name"],
+                         labels={"date": "Time", "loadout": "Loadout", "event": "Event", "vehicle_name": "Vehicle"},
+                         category_orders={"loadout": sorted(df["loadout"].unique())},
+                         title="Loadout History")
+
+    return [
+        dcc.Graph(figure=fig, config={"autosizable": True, "displayModeBar": True, "modeBarButtonsToRemove": ['zoom', 'pan']}),
+        html.Br(),
+    ]
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import defaultdict
+
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_summaries = {}
+
+
+def _reset_after_fork():
+    # a forked process (e.g. a background callback) may have inherited the lock held by another thread of the parent
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name, value=1, labels=None):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, value, labels=None):
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            summary = _summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+
+        summary["count"] += 1
+        summary["sum"] += value
+        if value > summary["max"]:
+            summary["max"] = value
+
+
+def get(name, labels=None):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def _format(name, labels, suffix=""):
+    if not labels:
+        return name + suffix
+
+    return "%s%s{%s}" % (name, suffix, ",".join('%s="%s"' % (k, v) for k, v in labels))
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format."""
+
+    lines = []
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            lines.append("%s %s" % (_format(name, labels), value))
+
+        for (name, labels), summary in sorted(_summaries.items()):
+            lines.append("%s %s" % (_format(name, labels, "_count"), summary["count"]))
+            lines.append("%s %s" % (_format(name, labels, "_sum"), summary["sum"]))
+            lines.append("%s %s" % (_format(name, labels, "_max"), summary["max"]))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,216 @@
+import argparse
+import concurrent.futures
+import html as html_lib
+import json
+import multiprocessing
+import os
+import time
+
+
+# panel -> (callback in main, whether it is a background callback taking set_progress, whether it is a lazy panel)
+PANELS = [
+    ("outfit_stats", "update_outfit_stats", False, False),
+    ("vehicle_kills", "update_vehicle_kills", False, False),
+    ("infantry_stats", "update_infantry_stats", False, False),
+    ("infantry_kills", "update_kills_by_weapon", False, False),
+    ("vehicle_deaths", "update_vehicle_deaths_by_weapon", False, False),
+    ("timeline", "update_timeline", False, True),
+    ("activity", "update_activity", False, True),
+    ("engagements", "update_engagements", False, True),
+    ("vehicle_loadouts", "update_vehicle_loadouts", True, True),
+    ("infantry_loadouts", "update_infantry_loadouts", True, True),
+    ("leaderboard", "update_leaderboard", False, True),
+    ("season_stats", "update_season_stats", False, True),
+]
+
+# inputs of a panel after its accordion item, the leaderboard's sort_by defaults to its first metric
+EXTRA_ARGS = {
+    "leaderboard": [None],
+}
+
+PROGRESS_FILE = "progress.json"
+
+
+def compute_panels(world_id, zone_id):
+    import main
+
+    state = {"world_id": world_id, "zone_id": zone_id, "character_ids": []}
+    outputs = {}
+    timings = {}
+
+    # the callbacks expect a request, e.g. for the cancellation client id
+    with main.app.server.test_request_context():
+        for panel, callback_name, background, lazy in PANELS:
+            callback = getattr(main, callback_name)
+            args = [state, panel] + EXTRA_ARGS.get(panel, []) if lazy else [state]
+            if background:
+                args.insert(0, lambda message: None)
+
+            start = time.perf_counter()
+            outputs[panel] = callback(*args)
+            timings[panel] = time.perf_counter() - start
+
+    return outputs, timings
+
+
+def render_component(value):
+    from dash import dcc, dash_table
+    import plotly.io as pio
+
+    if value is None:
+        return ""
+    elif isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        # table data, e.g. the leaderboard rows
+        header = "".join("<th>%s</th>" % html_lib.escape(str(c)) for c in value[0])
+        rows = "".join("<tr>%s</tr>" % "".join("<td>%s</td>" % html_lib.escape(str(v)) for v in row.values()) for row in value)
+        return "<table><thead><tr>%s</tr></thead><tbody>%s</tbody></table>" % (header, rows)
+    elif isinstance(value, (list, tuple)):
+        return "".join(render_component(v) for v in value)
+    elif isinstance(value, (str, int, float)):
+        return html_lib.escape(str(value))
+    elif isinstance(value, dcc.Graph):
+        return pio.to_html(value.figure, full_html=False, include_plotlyjs=False)
+    elif isinstance(value, dash_table.DataTable):
+        columns = [c["id"] for c in value.columns]
+        header = "".join("<th>%s</th>" % html_lib.escape(str(c["name"])) for c in value.columns)
+        rows = "".join("<tr>%s</tr>" % "".join("<td>%s</td>" % html_lib.escape(str(row.get(c, ""))) for c in columns) for row in value.data)
+        return "<table><thead><tr>%s</tr></thead><tbody>%s</tbody></table>" % (header, rows)
+    elif hasattr(value, "to_plotly_json"):
+        # dash html components map onto the tag of the same name
+        tag = type(value).__name__.lower()
+        return "<%s>%s</%s>" % (tag, render_component(getattr(value, "children", None)), tag)
+    else:
+        # client side rendered panels return data for the browser to build the figure from
+        return ""
+
+
+def render_html(world_id, zone_id, outputs):
+    body = "".join(render_component(output) for output in outputs.values())
+    return """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>PS2 Outfit Wars Stats - World %s Match %s</title>
+<script src="https://cdn.plot.ly/plotly-2.18.0.min.js"></script>
+</head>
+<body>
+%s
+</body>
+</html>
+""" % (html_lib.escape(str(world_id)), html_lib.escape(str(zone_id)), body)
+
+
+def write_file(path, content):
+    # written next to the target and renamed so an interrupted run never leaves a partial report behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def precompute_match(world_id, zone_id, version, output_dir, formats):
+    import serialization
+
+    start = time.perf_counter()
+    outputs, timings = compute_panels(world_id, zone_id)
+
+    match_dir = os.path.join(output_dir, str(world_id))
+    os.makedirs(match_dir, exist_ok=True)
+
+    if "json" in formats:
+        report = {"world_id": world_id, "zone_id": zone_id, "version": version, "panels": outputs}
+        write_file(os.path.join(match_dir, "%s.json" % zone_id), serialization.to_json(report))
+
+    if "html" in formats:
+        write_file(os.path.join(match_dir, "%s.html" % zone_id), render_html(world_id, zone_id, outputs))
+
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def load_progress(output_dir):
+    try:
+        with open(os.path.join(output_dir, PROGRESS_FILE), encoding="utf8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def get_matches(service, match_versions, world_id, zone_ids, include_live):
+    if not zone_ids:
+        zone_ids = [row["zone_id"] for row in service.get_match_list(world_id)]
+
+    matches = []
+    for zone_id in zone_ids:
+        last_timestamp, finished = match_versions.get(world_id, zone_id)
+        if not last_timestamp:
+            print("world %s match %s: no events, skipped" % (world_id, zone_id))
+        elif not finished and not include_live:
+            print("world %s match %s: still running, skipped" % (world_id, zone_id))
+        else:
+            matches.append((zone_id, last_timestamp))
+
+    return matches
+
+
+def format_timings(timings):
+    return ", ".join("%s %.2fs" % (panel, seconds) for panel, seconds in timings.items() if panel != "total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputes every dashboard panel of finished matches. "
+                                                 "The loadout panels are stored in the background job cache (JOB_CACHE_DIR) "
+                                                 "the web server reads from, the JSON and HTML reports can be served statically.")
+    parser.add_argument("--world", type=int, required=True)
+    parser.add_argument("--zones", type=int, nargs="+", help="defaults to every match of the world")
+    parser.add_argument("--output", default="precomputed")
+    parser.add_argument("--format", dest="formats", choices=["json", "html"], nargs="*", default=["json"],
+                        help="report formats to write, none to only warm the job cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--include-live", action="store_true", help="also precompute matches that are still receiving events")
+    parser.add_argument("--force", action="store_true", help="recompute matches that were already precomputed at the same version")
+    args = parser.parse_args()
+
+    import main as app_main
+
+    os.makedirs(args.output, exist_ok=True)
+    progress = load_progress(args.output)
+
+    matches = get_matches(app_main.service, app_main.match_versions, args.world, args.zones, args.include_live)
+    pending = []
+    for zone_id, version in matches:
+        done = progress.get("%s/%s" % (args.world, zone_id))
+        if done and done["version"] == version and not args.force:
+            print("world %s match %s: already precomputed, skipped" % (args.world, zone_id))
+        else:
+            pending.append((zone_id, version))
+
+    failed = 0
+    start = time.perf_counter()
+    # spawned rather than forked, so workers don't inherit the parent's pooled connections and cache handles
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(precompute_match, args.world, zone_id, version, args.output, args.formats): (zone_id, version)
+                   for zone_id, version in pending}
+
+        for future in concurrent.futures.as_completed(futures):
+            zone_id, version = futures[future]
+            try:
+                timings = future.result()
+            except Exception as e:
+                failed += 1
+                print("world %s match %s: failed: %s" % (args.world, zone_id, str(e)))
+                continue
+
+            print("world %s match %s: %.2fs (%s)" % (args.world, zone_id, timings["total"], format_timings(timings)))
+
+            # recorded as soon as a match is done, so an interrupted run resumes with the remaining matches
+            progress["%s/%s" % (args.world, zone_id)] = {"version": version, "timings": timings}
+            write_file(os.path.join(args.output, PROGRESS_FILE), json.dumps(progress, indent=2, sort_keys=True))
+
+    print("precomputed %d of %d matches in %.1fs" % (len(pending) - failed, len(pending), time.perf_counter() - start))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
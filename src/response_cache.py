@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import logging
+import time
+
+import flask
+
+import cache
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+class MatchVersions:
+    """Caches the data version of a match, which changes whenever new events are recorded for it.
+
+    The version is the last event timestamp and the number of events, so events loaded late for an earlier time change it too.
+    """
+
+    def __init__(self, service, finished_after, live_ttl, finished_ttl):
+        self.service = service
+        self.finished_after = finished_after
+        self.live_ttl = live_ttl
+        self.finished_ttl = finished_ttl
+        self.cache = cache.TTLCache(max_size=4096)
+
+    def get(self, world_id, zone_id):
+        """(last timestamp, whether the match is finished)"""
+
+        last_timestamp, num_events, finished = self._get(world_id, zone_id)
+        return last_timestamp, finished
+
+    def get_version(self, world_id, zone_id):
+        """What cached results of the match are keyed by."""
+
+        last_timestamp, num_events, finished = self._get(world_id, zone_id)
+        return last_timestamp, num_events
+
+    def _get(self, world_id, zone_id):
+        key = (str(world_id), str(zone_id))
+        version = self.cache.get(key)
+        if version is None:
+            row = self.service.get_match_version(world_id, zone_id)
+            last_timestamp = row["last_timestamp"] or 0
+            finished = last_timestamp < time.time() - self.finished_after
+            version = (last_timestamp, row["num_events"] or 0, finished)
+            self.cache.set(key, version, ttl=self.finished_ttl if finished else self.live_ttl)
+
+        return version
+
+
+class CachedResponse:
+    def __init__(self, etag, body):
+        self.etag = etag
+        self.body = body
+        self.gzip_body = gzip.compress(body)
+
+
+def normalize_value(value):
+    # character_id filters are order independent
+    if isinstance(value, list):
+        return sorted(value, key=str)
+    elif isinstance(value, dict):
+        return {k: normalize_value(v) for k, v in value.items()}
+    else:
+        return value
+
+
+def get_request_inputs(body):
+    inputs = {}
+    for item in body.get("inputs", []) + body.get("state", []):
+        if isinstance(item, dict) and "id" in item:
+            inputs["%s.%s" % (item["id"], item["property"])] = normalize_value(item.get("value"))
+
+    return inputs
+
+
+def init_app(server, outputs, get_version, max_size=512):
+    """Serves repeat panel callbacks from a cache of rendered (and compressed) responses.
+
+    outputs are the callback outputs that can be cached, get_version maps the callback inputs to the data version of
+    the match they show, or None if they should not be cached.
+    """
+
+    responses = cache.TTLCache(max_size=max_size)
+
+    @server.before_request
+    def serve_cached_response():
+        if flask.request.method != "POST" or not flask.request.path.endswith("_dash-update-component"):
+            return None
+
+        body = flask.request.get_json(silent=True) or {}
+        output = body.get("output")
+        if output not in outputs:
+            return None
+
+        inputs = get_request_inputs(body)
+        try:
+            version = get_version(inputs)
+        except Exception:
+            # the callback runs uncached and fails on its own if the database really is down
+            logger.exception("could not get the version of %s" % output)
+            metrics.inc("response_cache_errors_total", labels={"output": output})
+            return None
+
+        if version is None:
+            return None
+
+        etag = hashlib.sha1(json.dumps([output, inputs, version], sort_keys=True, default=str).encode("utf8")).hexdigest()
+        flask.g.response_cache_etag = etag
+
+        if flask.request.if_none_match.contains(etag):
+            metrics.inc("response_cache_not_modified_total", labels={"output": output})
+            response = flask.Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        cached = responses.get(etag)
+        if not cached:
+            metrics.inc("response_cache_misses_total", labels={"output": output})
+            return None
+
+        metrics.inc("response_cache_hits_total", labels={"output": output})
+        flask.g.response_cache_hit = True
+        return build_response(cached)
+
+    @server.after_request
+    def store_response(response):
+        etag = flask.g.get("response_cache_etag")
+        if not etag or flask.g.get("response_cache_hit") or response.status_code != 200:
+            return response
+
+        cached = CachedResponse(etag, response.get_data())
+        responses.set(etag, cached)
+
+        return build_response(cached, response)
+
+    return responses
+
+
+def skip():
+    """Keeps the response of the current request out of the cache, for callbacks showing data that is still being filled in."""
+
+    flask.g.response_cache_etag = None
+
+
+def build_response(cached, response=None):
+    if response is None:
+        response = flask.Response(mimetype="application/json")
+
+    if "gzip" in flask.request.headers.get("Accept-Encoding", ""):
+        response.set_data(cached.gzip_body)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.set_data(cached.body)
+
+    response.set_etag(cached.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    # the ETag changes with the match data, so clients have to revalidate instead of assuming freshness
+    response.headers["Cache-Control"] = "no-cache"
+
+    return response
@@ -0,0 +1,370 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# one row per match, maintained incrementally by the ingester like the rollups below and backfilled for matches it didn't load, see backfill_aggregates
+MATCH_CATALOG = """
+    CREATE TABLE IF NOT EXISTS match_catalog (
+        world_id INTEGER NOT NULL,
+        zone_id BIGINT NOT NULL,
+        first_timestamp BIGINT NOT NULL,
+        last_timestamp BIGINT NOT NULL,
+        num_deaths BIGINT NOT NULL DEFAULT 0,
+        num_vehicle_destroys BIGINT NOT NULL DEFAULT 0,
+        num_experience_events BIGINT NOT NULL DEFAULT 0,
+        num_facility_control_events BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (world_id, zone_id)
+    )
+"""
+
+# per match totals of every character and outfit, merged across matches for the season view instead of scanning events
+MATCH_CHARACTER_ROLLUP = """
+    CREATE TABLE IF NOT EXISTS match_character_rollup (
+        world_id INTEGER NOT NULL,
+        zone_id BIGINT NOT NULL,
+        character_id BIGINT NOT NULL,
+        kills BIGINT NOT NULL DEFAULT 0,
+        deaths BIGINT NOT NULL DEFAULT 0,
+        vehicle_kills BIGINT NOT NULL DEFAULT 0,
+        vehicles_lost BIGINT NOT NULL DEFAULT 0,
+        experience_actions BIGINT NOT NULL DEFAULT 0,
+        headshots BIGINT NOT NULL DEFAULT 0,
+        revives BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (world_id, zone_id, character_id)
+    )
+"""
+
+# counters added after the table was first created, existing rows are filled in by ingest.py --rebuild-aggregates
+MATCH_CHARACTER_ROLLUP_COLUMNS = [
+    "ALTER TABLE match_character_rollup ADD COLUMN IF NOT EXISTS headshots BIGINT NOT NULL DEFAULT 0",
+    "ALTER TABLE match_character_rollup ADD COLUMN IF NOT EXISTS revives BIGINT NOT NULL DEFAULT 0",
+]
+
+MATCH_OUTFIT_ROLLUP = """
+    CREATE TABLE IF NOT EXISTS match_outfit_rollup (
+        world_id INTEGER NOT NULL,
+        zone_id BIGINT NOT NULL,
+        outfit_id BIGINT NOT NULL,
+        captures BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (world_id, zone_id, outfit_id)
+    )
+"""
+
+# every player's character info as of the match, captured by the ingester when they are first seen in it
+MATCH_ROSTER = """
+    CREATE TABLE IF NOT EXISTS match_roster (
+        world_id INTEGER NOT NULL,
+        zone_id BIGINT NOT NULL,
+        character_id BIGINT NOT NULL,
+        outfit_id BIGINT,
+        battle_rank INTEGER,
+        is_prestige INTEGER,
+        minutes_played BIGINT,
+        created_at BIGINT,
+        member_since BIGINT,
+        -- timestamp of the player's first event in the match, ages are relative to it
+        captured_at BIGINT NOT NULL,
+        -- false for players added after the match from the character info of the day, captured_at is then that day
+        point_in_time BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (world_id, zone_id, character_id)
+    )
+"""
+
+# rows captured before the column was added can't be told apart and are treated as added after the match
+MATCH_ROSTER_COLUMNS = [
+    "ALTER TABLE match_roster ADD COLUMN IF NOT EXISTS point_in_time BOOLEAN NOT NULL DEFAULT FALSE",
+]
+
+MATCH_CHARACTER_ROLLUP_INDEX = "CREATE INDEX IF NOT EXISTS match_character_rollup_character_idx ON match_character_rollup (character_id)"
+
+# match_character_rollup columns a match leaderboard can be sorted by
+LEADERBOARD_METRICS = ["kills", "deaths", "headshots", "vehicle_kills", "revives"]
+
+# the top players of a match by any metric are read off the front of an index
+LEADERBOARD_INDEXES = ["CREATE INDEX IF NOT EXISTS match_character_rollup_%s_idx ON match_character_rollup (world_id, zone_id, %s DESC)" % (metric, metric)
+                       for metric in LEADERBOARD_METRICS]
+
+# character page lookups start from the player, so they only touch that player's events
+CHARACTER_INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS death_event_attacker_character_idx ON death_event (attacker_character_id, world_id, zone_id, timestamp)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS death_event_character_idx ON death_event (character_id, world_id, zone_id, timestamp)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS vehicle_destroy_event_character_idx ON vehicle_destroy_event (character_id, world_id, zone_id, timestamp)",
+]
+
+# the columns an event is looked up by, when loading it (see ingest.Ingester) and by the event log. They don't identify it,
+# a player can get the same experience several times in a second, so the event tables get no unique index
+EVENT_KEYS = {
+    "death_event": ["world_id", "zone_id", "timestamp", "character_id", "attacker_character_id"],
+    "vehicle_destroy_event": ["world_id", "zone_id", "timestamp", "character_id", "attacker_character_id", "character_vehicle_id"],
+    "gain_experience_event": ["world_id", "zone_id", "timestamp", "character_id", "experience_id"],
+    "facility_control_event": ["world_id", "zone_id", "timestamp", "facility_id"],
+}
+
+EVENT_KEY_INDEXES = ["CREATE INDEX CONCURRENTLY IF NOT EXISTS %s_lookup_idx ON %s (%s)" % (table, table, ", ".join(columns))
+                     for table, columns in EVENT_KEYS.items()]
+
+# unique indexes an earlier version built on the event tables, which reject the external loader's repeated events
+DROPPED_INDEXES = ["DROP INDEX CONCURRENTLY IF EXISTS %s_key_idx" % table for table in EVENT_KEYS]
+
+STATEMENTS = [
+    MATCH_CATALOG,
+    MATCH_CHARACTER_ROLLUP,
+    MATCH_OUTFIT_ROLLUP,
+    MATCH_ROSTER,
+] + MATCH_CHARACTER_ROLLUP_COLUMNS + MATCH_ROSTER_COLUMNS + [
+    MATCH_CHARACTER_ROLLUP_INDEX,
+] + LEADERBOARD_INDEXES + CHARACTER_INDEXES + DROPPED_INDEXES + EVENT_KEY_INDEXES
+
+# same actions as the infantry stats panel, see Service.get_infantry_stats
+EXPERIENCE_ACTION_IDS = (1, 2, 3, 4, 5, 6, 7, 37, 51, 53, 56, 30, 142, 201, 233, 277, 335, 355, 592)
+
+# revive and squad revive
+REVIVE_EXPERIENCE_IDS = (7, 53)
+
+# event table -> match_catalog counter column
+CATALOG_COUNTERS = {
+    "death_event": "num_deaths",
+    "vehicle_destroy_event": "num_vehicle_destroys",
+    "gain_experience_event": "num_experience_events",
+    "facility_control_event": "num_facility_control_events",
+}
+
+
+def create_schema(db, timeout=None):
+    """Creates the tables this app maintains itself and the indexes its queries need, the event tables are managed outside of it."""
+
+    for sql in STATEMENTS:
+        db.exec(sql, timeout=timeout)
+
+
+class Rollup:
+    def __init__(self, table, key_column, counters):
+        self.table = table
+        self.key_column = key_column
+        # (event column counted for the key, rollup counter column, extra condition)
+        self.counters = counters
+
+    def get_upsert(self, events_sql):
+        # a single upsert per rollup table, since one statement can't update the same row from two upserts
+        selects = []
+        for index, (source_column, counter, condition) in enumerate(self.counters):
+            conditions = ["e.%s IS NOT NULL" % source_column, "e.%s != 0" % source_column,
+                          # only outfit wars matches, see Service.get_match_list
+                          "e.zone_id > 1000"]
+            if condition:
+                conditions.append(condition)
+
+            values = ", ".join("1" if i == index else "0" for i in range(len(self.counters)))
+            selects.append("SELECT e.world_id, e.zone_id, e.%s AS key, %s FROM (%s) e WHERE %s" % (source_column, values, events_sql, " AND ".join(conditions)))
+
+        columns = [counter for source_column, counter, condition in self.counters]
+        return """
+            INSERT INTO %(table)s (world_id, zone_id, %(key)s, %(columns)s)
+            SELECT
+                r.world_id,
+                r.zone_id,
+                r.key,
+                %(sums)s
+            FROM (%(selects)s) AS r (world_id, zone_id, key, %(columns)s)
+            GROUP BY
+                r.world_id,
+                r.zone_id,
+                r.key
+            ON CONFLICT (world_id, zone_id, %(key)s) DO UPDATE SET
+                %(updates)s
+        """ % {
+            "table": self.table,
+            "key": self.key_column,
+            "columns": ", ".join(columns),
+            "sums": ", ".join("SUM(r.%s)" % column for column in columns),
+            "selects": " UNION ALL ".join(selects),
+            "updates": ", ".join("%s = %s.%s + EXCLUDED.%s" % (column, self.table, column, column) for column in columns),
+        }
+
+
+# event table -> rollup maintained from its events
+ROLLUPS = {
+    "death_event": Rollup("match_character_rollup", "character_id", [
+        ("attacker_character_id", "kills", "e.attacker_character_id != e.character_id"),
+        ("character_id", "deaths", None),
+        ("attacker_character_id", "headshots", "e.attacker_character_id != e.character_id AND e.is_headshot = 1"),
+    ]),
+    "vehicle_destroy_event": Rollup("match_character_rollup", "character_id", [
+        ("attacker_character_id", "vehicle_kills", "e.attacker_character_id != e.character_id"),
+        ("character_id", "vehicles_lost", None),
+    ]),
+    "gain_experience_event": Rollup("match_character_rollup", "character_id", [
+        ("character_id", "experience_actions", "e.experience_id IN (%s)" % ", ".join(str(i) for i in EXPERIENCE_ACTION_IDS)),
+        ("character_id", "revives", "e.experience_id IN (%s)" % ", ".join(str(i) for i in REVIVE_EXPERIENCE_IDS)),
+    ]),
+    "facility_control_event": Rollup("match_outfit_rollup", "outfit_id", [
+        ("outfit_id", "captures", "e.new_faction_id != 4"),
+    ]),
+}
+
+
+# players of a match are those with experience events, like Service.get_character_list
+ROSTER_EVENT_TABLE = "gain_experience_event"
+
+
+def get_aggregate_upserts(table, events_sql, point_in_time=True):
+    """Statements that add the events selected by events_sql to the match catalog, the rollups and the roster.
+
+    point_in_time is False when the events are loaded after their match, so the character info isn't as of the match.
+    """
+
+    upserts = [get_catalog_upsert(CATALOG_COUNTERS[table], events_sql), ROLLUPS[table].get_upsert(events_sql)]
+    if table == ROSTER_EVENT_TABLE:
+        upserts.append(get_roster_upsert(events_sql, point_in_time))
+    return upserts
+
+
+def rebuild_aggregates(db):
+    """Recomputes the match catalog and rollups from the event tables, e.g. to backfill events that were not loaded by the ingester."""
+
+    with db.get_connection() as db_conn:
+        # the roster is kept, it can't be recaptured as of the match, only players missing from it are added
+        db.exec("TRUNCATE match_catalog, match_character_rollup, match_outfit_rollup", db_conn=db_conn)
+        for table in CATALOG_COUNTERS:
+            logger.info("rebuilding aggregates from %s" % table)
+            for sql in get_aggregate_upserts(table, "SELECT * FROM %s" % table, point_in_time=False):
+                db.exec(sql, db_conn=db_conn)
+
+
+def rebuild_match_aggregates(db, world_id, zone_id, timeout=None):
+    """Recomputes the catalog entry and rollups of one match from its events, returns False if another process already is."""
+
+    params = {"world_id": world_id, "zone_id": zone_id}
+    with db.get_connection() as db_conn:
+        # the connections are in autocommit mode, readers see either the old or the rebuilt aggregates
+        db.exec("BEGIN", db_conn=db_conn)
+        try:
+            sql = "SELECT pg_try_advisory_xact_lock(hashtextextended(CONCAT('match_aggregates:', CAST(:world_id AS BIGINT), ':', CAST(:zone_id AS BIGINT)), 0)) AS locked"
+            if not db.query_single(sql, params, db_conn=db_conn)["locked"]:
+                db.exec("ROLLBACK", db_conn=db_conn)
+                return False
+
+            for table in ["match_catalog", "match_character_rollup", "match_outfit_rollup"]:
+                db.exec("DELETE FROM %s WHERE world_id = :world_id AND zone_id = :zone_id" % table, params, db_conn=db_conn, timeout=timeout)
+            for table in CATALOG_COUNTERS:
+                events_sql = "SELECT * FROM %s WHERE world_id = :world_id AND zone_id = :zone_id" % table
+                for sql in get_aggregate_upserts(table, events_sql, point_in_time=False):
+                    db.exec(sql, params, db_conn=db_conn, timeout=timeout)
+
+            db.exec("COMMIT", db_conn=db_conn)
+        except Exception:
+            db.exec("ROLLBACK", db_conn=db_conn)
+            raise
+
+    return True
+
+
+def get_stale_matches(db, timeout=None):
+    # the matches of Service.get_match_list whose events are newer than their catalog entry, or that have none
+    sql = """
+        SELECT
+            e.world_id,
+            e.zone_id
+        FROM (
+            SELECT
+                e.world_id,
+                e.zone_id,
+                MAX(e.timestamp) AS last_timestamp
+            FROM death_event e
+            WHERE
+                e.zone_id > 1000
+            GROUP BY
+                e.world_id,
+                e.zone_id
+        ) e
+            LEFT JOIN match_catalog c ON e.world_id = c.world_id AND e.zone_id = c.zone_id
+        WHERE
+            c.last_timestamp IS NULL
+            OR c.last_timestamp < e.last_timestamp
+    """
+
+    return db.query(sql, timeout=timeout)
+
+
+def backfill_aggregates(db, timeout=None):
+    """Rebuilds the aggregates of the matches that were loaded by something else than the ingester, returns how many."""
+
+    rebuilt = 0
+    for match in get_stale_matches(db, timeout=timeout):
+        logger.info("backfilling aggregates of match %s/%s" % (match["world_id"], match["zone_id"]))
+        if rebuild_match_aggregates(db, match["world_id"], match["zone_id"], timeout=timeout):
+            rebuilt += 1
+
+    return rebuilt
+
+
+def get_catalog_upsert(column, events_sql):
+    return """
+        INSERT INTO match_catalog (world_id, zone_id, first_timestamp, last_timestamp, %(column)s)
+        SELECT
+            e.world_id,
+            e.zone_id,
+            MIN(e.timestamp),
+            MAX(e.timestamp),
+            COUNT(1)
+        FROM (%(events_sql)s) e
+        GROUP BY
+            e.world_id,
+            e.zone_id
+        ON CONFLICT (world_id, zone_id) DO UPDATE SET
+            first_timestamp = LEAST(match_catalog.first_timestamp, EXCLUDED.first_timestamp),
+            last_timestamp = GREATEST(match_catalog.last_timestamp, EXCLUDED.last_timestamp),
+            %(column)s = match_catalog.%(column)s + EXCLUDED.%(column)s
+    """ % {"column": column, "events_sql": events_sql}
+
+
+def get_roster_upsert(events_sql, point_in_time):
+    # players whose character info wasn't loaded yet when they were first seen are filled in once it is
+    return """
+        INSERT INTO match_roster (world_id, zone_id, character_id, outfit_id, battle_rank, is_prestige, minutes_played, created_at, member_since, captured_at, point_in_time)
+        SELECT
+            e.world_id,
+            e.zone_id,
+            e.character_id,
+            c.outfit_id,
+            c.battle_rank,
+            c.is_prestige,
+            c.minutes_played,
+            c.created_at,
+            c.member_since,
+            %(captured_at)s,
+            %(point_in_time)s
+        FROM (%(events_sql)s) e
+            LEFT JOIN character_info c ON e.character_id = c.character_id
+        WHERE
+            e.character_id IS NOT NULL
+            AND e.character_id != 0
+            AND e.zone_id > 1000
+        GROUP BY
+            e.world_id,
+            e.zone_id,
+            e.character_id,
+            c.outfit_id,
+            c.battle_rank,
+            c.is_prestige,
+            c.minutes_played,
+            c.created_at,
+            c.member_since
+        ON CONFLICT (world_id, zone_id, character_id) DO UPDATE SET
+            outfit_id = EXCLUDED.outfit_id,
+            battle_rank = EXCLUDED.battle_rank,
+            is_prestige = EXCLUDED.is_prestige,
+            minutes_played = EXCLUDED.minutes_played,
+            created_at = EXCLUDED.created_at,
+            member_since = EXCLUDED.member_since,
+            captured_at = CASE WHEN EXCLUDED.point_in_time AND match_roster.point_in_time THEN match_roster.captured_at ELSE EXCLUDED.captured_at END,
+            point_in_time = EXCLUDED.point_in_time
+        WHERE
+            match_roster.battle_rank IS NULL
+    """ % {
+        "events_sql": events_sql,
+        "captured_at": "MIN(e.timestamp)" if point_in_time else "CAST(EXTRACT(EPOCH FROM now()) AS BIGINT)",
+        "point_in_time": "TRUE" if point_in_time else "FALSE",
+    }
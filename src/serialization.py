@@ -0,0 +1,61 @@
+import decimal
+import logging
+
+import dash._callback
+from dash import _utils
+
+
+logger = logging.getLogger(__name__)
+
+_plotly_to_json = _utils.to_json
+
+
+def _default(obj):
+    # dash components and plotly figures
+    if hasattr(obj, "to_plotly_json"):
+        return obj.to_plotly_json()
+
+    # numeric columns from postgres, e.g. ROUND(AVG(...))
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+
+    # numpy arrays orjson can't serialize natively, e.g. object dtype
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+
+    raise TypeError("Type is not JSON serializable: %s" % type(obj).__name__)
+
+
+def to_json_orjson(value):
+    import orjson
+
+    try:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode("utf8")
+    except TypeError:
+        # let the plotly encoder deal with anything unusual (pandas NA, PIL images, ...)
+        return _plotly_to_json(value)
+
+
+ENGINES = {
+    "plotly": _plotly_to_json,
+    "orjson": to_json_orjson,
+}
+
+
+def install(engine):
+    """Replaces the encoder dash uses for callback responses."""
+
+    if engine == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            logger.warning("orjson is not installed, falling back to the plotly json encoder")
+            engine = "plotly"
+
+    dash._callback.to_json = ENGINES[engine]
+
+
+def to_json(value):
+    """Encodes like a callback response, with the encoder selected by install()."""
+
+    return dash._callback.to_json(value)
@@ -1,3 +1,6 @@
+import schema
+
+
 class Service:
     def __init__(self, db):
         self.db = db
@@ -39,11 +42,12 @@ class Service:
 
         return self.db.query(sql, {"world_id": world_id, "zone_id": zone_id})
 
-    def get_vehicle_kills(self, world_id, zone_id, character_ids):
+    def get_vehicle_kills(self, world_id, zone_id, character_ids, by_minute=False):
         params = {"world_id": world_id, "zone_id": zone_id}
 
         sql = """
             SELECT
+                %s
                 COUNT(1) AS num,
                 COALESCE(attacker_outfit.alias, attacker.outfit_id::varchar) AS attacker_outfit,
                 COALESCE(defender_outfit.alias, defender.outfit_id::varchar) AS defender_outfit,
@@ -60,7 +64,7 @@ class Service:
             WHERE
                 e.world_id = :world_id
                 AND e.zone_id = :zone_id
-        """
+        """ % get_minute_column(by_minute)
 
         if character_ids:
             sql += " AND ("
@@ -71,6 +75,7 @@ class Service:
 
         sql += """
             GROUP BY
+                %s
                 attacker.outfit_id,
                 defender.outfit_id,
                 attacker_outfit.alias,
@@ -81,15 +86,16 @@ class Service:
                 is_suicide
             ORDER BY
                 vehicle_name DESC
-        """
+        """ % get_minute_group(by_minute)
 
         return self.db.query(sql, params)
 
-    def get_infantry_stats(self, world_id, zone_id, character_ids):
+    def get_infantry_stats(self, world_id, zone_id, character_ids, by_minute=False):
         params = {"world_id": world_id, "zone_id": zone_id}
 
         sql = """
             SELECT
+                %s
                 COUNT(1) AS num,
                 COALESCE(outfit.alias, c.outfit_id::varchar) AS outfit,
                 e.experience_id,
@@ -102,7 +108,7 @@ class Service:
                 e.world_id = :world_id
                 AND e.zone_id = :zone_id
                 AND e.experience_id IN (1, 2, 3, 4, 5, 6, 7, 37, 51, 53, 56, 30, 142, 201, 233, 277, 335, 355, 592)
-        """
+        """ % get_minute_column(by_minute)
 
         if character_ids:
             sql += " AND ( "
@@ -113,17 +119,159 @@ class Service:
 
         sql += """
             GROUP BY
+                %s
                 c.outfit_id,
                 outfit.alias,
                 e.experience_id,
                 xp.description
-        """
+        """ % get_minute_group(by_minute)
 
         return self.db.query(sql, params)
 
+    def get_match_aggregates(self, world_id, zone_id, character_ids):
+        """The rows of get_vehicle_kills, get_vehicle_deaths_by_weapon and get_kills_by_weapon, reading each event table once."""
+
+        params = {"world_id": world_id, "zone_id": zone_id}
+
+        # both vehicle groupings come out of a single scan and join of vehicle_destroy_event,
+        # GROUPING(e.attacker_weapon_id) tells them apart since only the weapon grouping includes it
+        sql = """
+            SELECT
+                GROUPING(e.attacker_weapon_id) AS is_vehicle_kills,
+                COUNT(1) AS num,
+                COALESCE(attacker_outfit.alias, attacker.outfit_id::varchar) AS attacker_outfit,
+                COALESCE(defender_outfit.alias, defender.outfit_id::varchar) AS defender_outfit,
+                defender_vehicle_info.name AS vehicle_name,
+                e.character_vehicle_id AS vehicle_id,
+                defender_vehicle_info.category AS vehicle_category,
+                e.character_id = e.attacker_character_id AS is_suicide,
+                COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
+                SUM(CASE WHEN defender_outfit.alias = attacker_outfit.alias THEN 1 ELSE 0 END) AS team_deaths,
+                SUM(CASE WHEN e.character_id = e.attacker_character_id THEN 1 ELSE 0 END) AS suicides
+            FROM vehicle_destroy_event e
+                LEFT JOIN weapon_info w ON e.attacker_weapon_id = w.item_id
+                LEFT JOIN character_info defender ON e.character_id = defender.character_id
+                LEFT JOIN outfit_info defender_outfit ON defender.outfit_id = defender_outfit.outfit_id
+                LEFT JOIN character_info attacker ON e.attacker_character_id = attacker.character_id
+                LEFT JOIN outfit_info attacker_outfit ON attacker.outfit_id = attacker_outfit.outfit_id
+                JOIN vehicle_info defender_vehicle_info ON e.character_vehicle_id = defender_vehicle_info.vehicle_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+        """
+
+        if character_ids:
+            sql += " AND ("
+            sql += " OR ".join([f"e.character_id = :character_id{idx} OR e.attacker_character_id = :character_id{idx}" for idx, q in enumerate(character_ids)])
+            sql += ")"
+            for idx, q in enumerate(character_ids):
+                params[f"character_id{idx}"] = q
+
+        sql += """
+            GROUP BY GROUPING SETS (
+                (
+                    attacker.outfit_id,
+                    defender.outfit_id,
+                    attacker_outfit.alias,
+                    defender_outfit.alias,
+                    defender_vehicle_info.name,
+                    e.character_vehicle_id,
+                    defender_vehicle_info.category,
+                    e.character_id = e.attacker_character_id
+                ),
+                (
+                    defender.outfit_id,
+                    e.attacker_weapon_id,
+                    defender_outfit.alias,
+                    defender_vehicle_info.name,
+                    w.name
+                )
+            )
+            ORDER BY
+                is_vehicle_kills,
+                vehicle_name DESC
+        """
+
+        vehicle_kills = []
+        vehicle_deaths_by_weapon = []
+        for row in self.db.query(sql, params):
+            # split into the columns (and column order) of the single grouping queries
+            if row["is_vehicle_kills"]:
+                vehicle_kills.append({k: row[k] for k in ["num", "attacker_outfit", "defender_outfit", "vehicle_name", "vehicle_id", "vehicle_category", "is_suicide"]})
+            else:
+                vehicle_deaths_by_weapon.append({
+                    "weapon": row["weapon"],
+                    "vehicle_name": row["vehicle_name"],
+                    "defender_outfit": row["defender_outfit"],
+                    "deaths": row["num"],
+                    "team_deaths": row["team_deaths"],
+                    "suicides": row["suicides"],
+                })
+
+        return {
+            "get_vehicle_kills": vehicle_kills,
+            "get_vehicle_deaths_by_weapon": vehicle_deaths_by_weapon,
+            # the only grouping over death_event, already a single scan
+            "get_kills_by_weapon": self.get_kills_by_weapon(world_id, zone_id, character_ids),
+        }
+
     def get_outfit_stats(self, world_id, zone_id, character_ids):
         params = {"world_id": world_id, "zone_id": zone_id}
 
+        # read from the roster as of the match, see schema.MATCH_ROSTER, so the result only changes while players join
+        sql = """
+            SELECT
+                COALESCE(o.alias, r.outfit_id::varchar) AS outfit,
+                f.alias AS faction,
+                COUNT(1) as num_players,
+                ROUND(AVG(r.battle_rank * (1 + r.is_prestige))) AS avg_battle_rank,
+                ROUND(AVG(r.minutes_played) / 60) AS avg_hours_played,
+                ROUND(AVG(r.captured_at - r.created_at) / 86400) AS avg_player_age_days,
+                ROUND(AVG(r.captured_at - r.member_since) / 86400) AS avg_member_age_days
+            FROM match_roster r
+                LEFT JOIN outfit_info o ON r.outfit_id = o.outfit_id
+                LEFT JOIN faction_info f ON o.faction_id = f.faction_id
+            WHERE
+                r.world_id = :world_id
+                AND r.zone_id = :zone_id
+                AND r.point_in_time
+        """
+
+        if character_ids:
+            sql += " AND ("
+            sql += " OR ".join([f"r.character_id = :character_id{idx}" for idx, q in enumerate(character_ids)])
+            sql += ")"
+            for idx, q in enumerate(character_ids):
+                params[f"character_id{idx}"] = q
+
+        sql += """
+            GROUP BY
+                o.alias,
+                r.outfit_id,
+                faction
+        """
+
+        return self.db.query(sql, params)
+
+    def has_match_roster(self, world_id, zone_id):
+        sql = """
+            SELECT EXISTS (
+                SELECT 1
+                FROM match_roster r
+                WHERE
+                    r.world_id = :world_id
+                    AND r.zone_id = :zone_id
+                    AND r.point_in_time
+            ) AS has_roster
+        """
+
+        return bool(self.db.query_single(sql, {"world_id": world_id, "zone_id": zone_id})["has_roster"])
+
+    def get_current_outfit_stats(self, world_id, zone_id, character_ids):
+        """Outfit stats from today's character info, for matches whose roster wasn't captured during the match."""
+
+        params = {"world_id": world_id, "zone_id": zone_id}
+
         sql = """
             SELECT
                 COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
@@ -163,11 +311,12 @@ class Service:
 
         return self.db.query(sql, params)
 
-    def get_kills_by_weapon(self, world_id, zone_id, character_ids):
+    def get_kills_by_weapon(self, world_id, zone_id, character_ids, by_minute=False):
         params = {"world_id": world_id, "zone_id": zone_id}
 
         sql = """
             SELECT
+                %s
                 COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
                 attacker_vehicle_info.name AS vehicle_name,
                 COALESCE(attacker_outfit.alias, attacker.outfit_id::varchar) AS attacker_outfit,
@@ -185,7 +334,7 @@ class Service:
             WHERE
                 e.world_id = :world_id
                 AND e.zone_id = :zone_id
-        """
+        """ % get_minute_column(by_minute)
 
         if character_ids:
             sql += " AND ("
@@ -196,20 +345,22 @@ class Service:
 
         sql += """
             GROUP BY
+                %s
                 attacker.outfit_id,
                 e.attacker_weapon_id,
                 attacker_outfit.alias,
                 attacker_vehicle_info.name,
                 w.name
-        """
+        """ % get_minute_group(by_minute)
 
         return self.db.query(sql, params)
 
-    def get_vehicle_deaths_by_weapon(self, world_id, zone_id, character_ids):
+    def get_vehicle_deaths_by_weapon(self, world_id, zone_id, character_ids, by_minute=False):
         params = {"world_id": world_id, "zone_id": zone_id}
 
         sql = """
             SELECT
+                %s
                 COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
                 defender_vehicle_info.name AS vehicle_name,
                 COALESCE(defender_outfit.alias, defender.outfit_id::varchar) AS defender_outfit,
@@ -226,7 +377,7 @@ class Service:
             WHERE
                 e.world_id = :world_id
                 AND e.zone_id = :zone_id
-        """
+        """ % get_minute_column(by_minute)
 
         if character_ids:
             sql += " AND ("
@@ -237,38 +388,70 @@ class Service:
 
         sql += """
             GROUP BY
+                %s
                 defender.outfit_id,
                 e.attacker_weapon_id,
                 defender_outfit.alias,
                 defender_vehicle_info.name,
                 w.name
-        """
+        """ % get_minute_group(by_minute)
 
         return self.db.query(sql, params)
 
-    def get_timeline(self, world_id, zone_id):
-        params = {"world_id": world_id, "zone_id": zone_id}
+    def get_facility_intervals(self, world_id, zone_id, open_seconds):
+        """Who held each facility from when to when, intervals still open at the end of the match last open_seconds past its last capture."""
+
+        params = {"world_id": world_id, "zone_id": zone_id, "open_seconds": open_seconds}
 
         sql = """
+            WITH %s
             SELECT
                 f.name AS facility,
-                e.facility_id,
-                e.new_faction_id,
-                COALESCE(o.alias, o.name, e.outfit_id::varchar) AS outfit,
-                CASE WHEN e.new_faction_id = 2 THEN 'Omega (Blue)' WHEN e.new_faction_id = 3 THEN 'Alpha (Red)' ELSE 'Unknown' END AS team,
-                e.timestamp
-            FROM
-                facility_control_event e
-                LEFT JOIN facility_info f on e.facility_id = f.facility_id
-                LEFT JOIN outfit_info o ON e.outfit_id = o.outfit_id
-            WHERE
-                e.world_id = :world_id
-                AND e.zone_id = :zone_id
-                AND e.new_faction_id != 4
+                i.facility_id,
+                i.new_faction_id,
+                COALESCE(o.alias, o.name, i.outfit_id::varchar) AS outfit,
+                CASE WHEN i.new_faction_id = 2 THEN 'Omega (Blue)' WHEN i.new_faction_id = 3 THEN 'Alpha (Red)' ELSE 'Unknown' END AS team,
+                i.start_timestamp,
+                i.finish_timestamp,
+                i.is_open
+            FROM intervals i
+                LEFT JOIN facility_info f on i.facility_id = f.facility_id
+                LEFT JOIN outfit_info o ON i.outfit_id = o.outfit_id
             ORDER BY
-                e.facility_id ASC,
-                e.timestamp ASC
-        """
+                i.facility_id ASC,
+                i.start_timestamp ASC
+        """ % get_facility_intervals_cte()
+
+        return self.db.query(sql, params)
+
+    def get_facility_hold_totals(self, world_id, zone_id, open_seconds):
+        """Seconds each outfit held each facility and how often it captured it, from the intervals of get_facility_intervals."""
+
+        params = {"world_id": world_id, "zone_id": zone_id, "open_seconds": open_seconds}
+
+        sql = """
+            WITH %s
+            SELECT
+                f.name AS facility,
+                i.facility_id,
+                COALESCE(o.alias, o.name, i.outfit_id::varchar) AS outfit,
+                CASE WHEN i.new_faction_id = 2 THEN 'Omega (Blue)' WHEN i.new_faction_id = 3 THEN 'Alpha (Red)' ELSE 'Unknown' END AS team,
+                SUM(i.finish_timestamp - i.start_timestamp) AS hold_seconds,
+                COUNT(1) AS captures
+            FROM intervals i
+                LEFT JOIN facility_info f on i.facility_id = f.facility_id
+                LEFT JOIN outfit_info o ON i.outfit_id = o.outfit_id
+            GROUP BY
+                f.name,
+                i.facility_id,
+                i.outfit_id,
+                o.alias,
+                o.name,
+                i.new_faction_id
+            ORDER BY
+                i.facility_id ASC,
+                hold_seconds DESC
+        """ % get_facility_intervals_cte()
 
         return self.db.query(sql, params)
 
@@ -358,3 +541,770 @@ class Service:
         """
 
         return self.db.query(sql, params)
+
+    def get_live_deltas(self, world_id, zone_id, since, until):
+        params = {"world_id": world_id, "zone_id": zone_id, "since": since, "until": until}
+
+        sql = """
+            SELECT
+                'kills' AS series,
+                COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM death_event e
+                LEFT JOIN character_info c ON e.attacker_character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.timestamp > :since
+                AND e.timestamp <= :until
+                AND e.character_id != e.attacker_character_id
+            GROUP BY
+                c.outfit_id,
+                o.alias
+            UNION ALL
+            SELECT
+                'vehicles_lost' AS series,
+                COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM vehicle_destroy_event e
+                LEFT JOIN character_info c ON e.character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.timestamp > :since
+                AND e.timestamp <= :until
+            GROUP BY
+                c.outfit_id,
+                o.alias
+            UNION ALL
+            SELECT
+                'captures' AS series,
+                COALESCE(o.alias, o.name, e.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM facility_control_event e
+                LEFT JOIN outfit_info o ON e.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.timestamp > :since
+                AND e.timestamp <= :until
+                AND e.new_faction_id != 4
+            GROUP BY
+                e.outfit_id,
+                o.alias,
+                o.name
+        """
+
+        return self.db.query(sql, params)
+
+    def get_match_version(self, world_id, zone_id):
+        params = {"world_id": world_id, "zone_id": zone_id}
+
+        sql = """
+            SELECT
+                GREATEST(
+                    (SELECT MAX(e.timestamp) FROM death_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM vehicle_destroy_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM gain_experience_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM facility_control_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                ) AS last_timestamp,
+                -- events loaded late for an earlier time don't move the last timestamp
+                (SELECT COUNT(1) FROM death_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                + (SELECT COUNT(1) FROM vehicle_destroy_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                + (SELECT COUNT(1) FROM gain_experience_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                + (SELECT COUNT(1) FROM facility_control_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id) AS num_events
+        """
+
+        return self.db.query_single(sql, params)
+
+    def get_match_catalog(self, world_id, zone_id):
+        sql = """
+            SELECT
+                c.first_timestamp,
+                c.last_timestamp
+            FROM match_catalog c
+            WHERE
+                c.world_id = :world_id
+                AND c.zone_id = :zone_id
+        """
+
+        return self.db.query_single(sql, {"world_id": world_id, "zone_id": zone_id})
+
+    def get_activity(self, world_id, zone_id, character_ids, bucket_seconds):
+        params = {"world_id": world_id, "zone_id": zone_id, "bucket_seconds": bucket_seconds}
+        for idx, q in enumerate(character_ids or []):
+            params[f"character_id{idx}"] = q
+
+        def character_filter(column):
+            # the selected players' own kills, lost vehicles and revives
+            if not character_ids:
+                return ""
+            return "AND (%s)" % " OR ".join([f"e.{column} = :character_id{idx}" for idx, q in enumerate(character_ids)])
+
+        # bucketed here, so only (bucket x series x outfit) counts leave the database
+        sql = """
+            SELECT
+                e.timestamp / :bucket_seconds * :bucket_seconds AS bucket,
+                'Kills' AS series,
+                COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM death_event e
+                LEFT JOIN character_info c ON e.attacker_character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.character_id != e.attacker_character_id
+                %(kills_filter)s
+            GROUP BY
+                bucket,
+                c.outfit_id,
+                o.alias
+            UNION ALL
+            SELECT
+                e.timestamp / :bucket_seconds * :bucket_seconds AS bucket,
+                'Vehicles Lost' AS series,
+                COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM vehicle_destroy_event e
+                LEFT JOIN character_info c ON e.character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                %(vehicles_lost_filter)s
+            GROUP BY
+                bucket,
+                c.outfit_id,
+                o.alias
+            UNION ALL
+            SELECT
+                e.timestamp / :bucket_seconds * :bucket_seconds AS bucket,
+                'Revives & Heals' AS series,
+                COALESCE(o.alias, c.outfit_id::varchar) AS outfit,
+                COUNT(1) AS num
+            FROM gain_experience_event e
+                LEFT JOIN character_info c ON e.character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                -- heal player, revive, squad heal, squad revive
+                AND e.experience_id IN (4, 7, 51, 53)
+                %(revives_filter)s
+            GROUP BY
+                bucket,
+                c.outfit_id,
+                o.alias
+        """ % {
+            "kills_filter": character_filter("attacker_character_id"),
+            "vehicles_lost_filter": character_filter("character_id"),
+            "revives_filter": character_filter("character_id"),
+        }
+
+        return self.db.query(sql, params)
+
+    def get_match_range(self, world_id, zone_id):
+        params = {"world_id": world_id, "zone_id": zone_id}
+
+        sql = """
+            SELECT
+                LEAST(
+                    (SELECT MIN(e.timestamp) FROM death_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MIN(e.timestamp) FROM vehicle_destroy_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MIN(e.timestamp) FROM gain_experience_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MIN(e.timestamp) FROM facility_control_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                ) AS first_timestamp,
+                GREATEST(
+                    (SELECT MAX(e.timestamp) FROM death_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM vehicle_destroy_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM gain_experience_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id),
+                    (SELECT MAX(e.timestamp) FROM facility_control_event e WHERE e.world_id = :world_id AND e.zone_id = :zone_id)
+                ) AS last_timestamp
+        """
+
+        return self.db.query_single(sql, params)
+
+    def get_season_outfit_stats(self, world_id):
+        params = {"world_id": world_id}
+
+        # merges the per match rollups, see schema.ROLLUPS, players count for the outfit they were in during each match
+        sql = """
+            WITH players AS (
+                SELECT
+                    COALESCE(m.outfit_id, c.outfit_id) AS outfit_id,
+                    COUNT(DISTINCT r.zone_id) AS matches,
+                    COUNT(DISTINCT r.character_id) AS players,
+                    SUM(r.kills) AS kills,
+                    SUM(r.deaths) AS deaths,
+                    SUM(r.vehicle_kills) AS vehicle_kills,
+                    SUM(r.vehicles_lost) AS vehicles_lost,
+                    SUM(r.experience_actions) AS experience_actions
+                FROM match_character_rollup r
+                    LEFT JOIN match_roster m ON r.world_id = m.world_id AND r.zone_id = m.zone_id AND r.character_id = m.character_id
+                    LEFT JOIN character_info c ON r.character_id = c.character_id
+                WHERE
+                    r.world_id = :world_id
+                GROUP BY
+                    COALESCE(m.outfit_id, c.outfit_id)
+            ), captures AS (
+                SELECT
+                    r.outfit_id,
+                    SUM(r.captures) AS captures
+                FROM match_outfit_rollup r
+                WHERE
+                    r.world_id = :world_id
+                GROUP BY
+                    r.outfit_id
+            )
+            SELECT
+                COALESCE(o.alias, o.name, p.outfit_id::varchar) AS outfit,
+                p.matches,
+                p.players,
+                p.kills,
+                p.deaths,
+                p.vehicle_kills,
+                p.vehicles_lost,
+                p.experience_actions,
+                COALESCE(cap.captures, 0) AS captures
+            FROM players p
+                LEFT JOIN captures cap ON p.outfit_id = cap.outfit_id
+                LEFT JOIN outfit_info o ON p.outfit_id = o.outfit_id
+            WHERE
+                p.outfit_id IS NOT NULL
+            ORDER BY
+                p.kills DESC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_season_character_stats(self, world_id):
+        params = {"world_id": world_id}
+
+        sql = """
+            SELECT
+                COALESCE(o.alias, o.name, c.outfit_id::varchar) AS outfit,
+                COALESCE(c.name, r.character_id::varchar) AS name,
+                COUNT(1) AS matches,
+                SUM(r.kills) AS kills,
+                SUM(r.deaths) AS deaths,
+                SUM(r.vehicle_kills) AS vehicle_kills,
+                SUM(r.vehicles_lost) AS vehicles_lost,
+                SUM(r.experience_actions) AS experience_actions
+            FROM match_character_rollup r
+                LEFT JOIN character_info c ON r.character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                r.world_id = :world_id
+            GROUP BY
+                r.character_id,
+                c.name,
+                c.outfit_id,
+                o.alias,
+                o.name
+            ORDER BY
+                kills DESC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_leaderboard(self, world_id, zone_id, metric, limit):
+        """The top players of a match by one of schema.LEADERBOARD_METRICS."""
+
+        if metric not in schema.LEADERBOARD_METRICS:
+            raise ValueError("unknown leaderboard metric %s" % metric)
+
+        params = {"world_id": world_id, "zone_id": zone_id, "limit": limit}
+
+        # read from the front of the metric's index, see schema.LEADERBOARD_INDEXES, names are only joined for those rows
+        sql = """
+            SELECT
+                r.character_id,
+                COALESCE(c.name, r.character_id::varchar) AS name,
+                COALESCE(o.alias, o.name, c.outfit_id::varchar) AS outfit,
+                r.kills,
+                r.deaths,
+                r.headshots,
+                r.vehicle_kills,
+                r.revives
+            FROM (
+                SELECT *
+                FROM match_character_rollup r
+                WHERE
+                    r.world_id = :world_id
+                    AND r.zone_id = :zone_id
+                ORDER BY
+                    r.%(metric)s DESC
+                LIMIT :limit
+            ) r
+                LEFT JOIN character_info c ON r.character_id = c.character_id
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            ORDER BY
+                r.%(metric)s DESC
+        """ % {"metric": metric}
+
+        return self.db.query(sql, params)
+
+    def get_outfit_engagements(self, world_id, zone_id, start=None, end=None):
+        """Kills and vehicle kills of every attacker outfit against every victim outfit, 0 for players without one.
+
+        Players count for the outfit they were in during the match, see schema.MATCH_ROSTER, or their current one if they aren't on its roster.
+        start and end limit it to the events of [start, end).
+        """
+
+        params = {"world_id": world_id, "zone_id": zone_id}
+        time_filter = get_time_filter(params, start, end)
+
+        # pairs are counted by id and only then labeled
+        sql = """
+            WITH pairs AS (
+                SELECT
+                    COALESCE(attacker_roster.outfit_id, attacker.outfit_id, 0) AS attacker_id,
+                    COALESCE(victim_roster.outfit_id, victim.outfit_id, 0) AS victim_id,
+                    COUNT(1) AS kills,
+                    0 AS vehicle_kills
+                FROM death_event e
+                    LEFT JOIN match_roster attacker_roster ON e.world_id = attacker_roster.world_id AND e.zone_id = attacker_roster.zone_id
+                        AND e.attacker_character_id = attacker_roster.character_id
+                    LEFT JOIN match_roster victim_roster ON e.world_id = victim_roster.world_id AND e.zone_id = victim_roster.zone_id
+                        AND e.character_id = victim_roster.character_id
+                    LEFT JOIN character_info attacker ON e.attacker_character_id = attacker.character_id
+                    LEFT JOIN character_info victim ON e.character_id = victim.character_id
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND e.character_id != e.attacker_character_id
+                    %(time_filter)s
+                GROUP BY
+                    1, 2
+                UNION ALL
+                SELECT
+                    COALESCE(attacker_roster.outfit_id, attacker.outfit_id, 0) AS attacker_id,
+                    COALESCE(victim_roster.outfit_id, victim.outfit_id, 0) AS victim_id,
+                    0 AS kills,
+                    COUNT(1) AS vehicle_kills
+                FROM vehicle_destroy_event e
+                    LEFT JOIN match_roster attacker_roster ON e.world_id = attacker_roster.world_id AND e.zone_id = attacker_roster.zone_id
+                        AND e.attacker_character_id = attacker_roster.character_id
+                    LEFT JOIN match_roster victim_roster ON e.world_id = victim_roster.world_id AND e.zone_id = victim_roster.zone_id
+                        AND e.character_id = victim_roster.character_id
+                    LEFT JOIN character_info attacker ON e.attacker_character_id = attacker.character_id
+                    LEFT JOIN character_info victim ON e.character_id = victim.character_id
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND e.character_id != e.attacker_character_id
+                    %(time_filter)s
+                GROUP BY
+                    1, 2
+            )
+            SELECT
+                p.attacker_id,
+                COALESCE(attacker.alias, attacker.name, p.attacker_id::varchar) AS attacker,
+                p.victim_id,
+                COALESCE(victim.alias, victim.name, p.victim_id::varchar) AS victim,
+                SUM(p.kills) AS kills,
+                SUM(p.vehicle_kills) AS vehicle_kills
+            FROM pairs p
+                LEFT JOIN outfit_info attacker ON p.attacker_id = attacker.outfit_id
+                LEFT JOIN outfit_info victim ON p.victim_id = victim.outfit_id
+            GROUP BY
+                p.attacker_id,
+                attacker.alias,
+                attacker.name,
+                p.victim_id,
+                victim.alias,
+                victim.name
+        """ % {"time_filter": time_filter}
+
+        return self.db.query(sql, params)
+
+    def get_character_engagements(self, world_id, zone_id, character_ids, start=None, end=None):
+        """Kills and vehicle kills between players, for every pair involving one of character_ids, limited to [start, end) if given."""
+
+        if not character_ids:
+            return []
+
+        params = {"world_id": world_id, "zone_id": zone_id}
+        time_filter = get_time_filter(params, start, end)
+
+        character_filter = " OR ".join([f"e.character_id = :character_id{idx} OR e.attacker_character_id = :character_id{idx}" for idx, q in enumerate(character_ids)])
+        for idx, q in enumerate(character_ids):
+            params[f"character_id{idx}"] = q
+
+        sql = """
+            WITH pairs AS (
+                SELECT
+                    e.attacker_character_id AS attacker_id,
+                    e.character_id AS victim_id,
+                    COUNT(1) AS kills,
+                    0 AS vehicle_kills
+                FROM death_event e
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND e.character_id != e.attacker_character_id
+                    AND (%(character_filter)s)
+                    %(time_filter)s
+                GROUP BY
+                    1, 2
+                UNION ALL
+                SELECT
+                    e.attacker_character_id AS attacker_id,
+                    e.character_id AS victim_id,
+                    0 AS kills,
+                    COUNT(1) AS vehicle_kills
+                FROM vehicle_destroy_event e
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND e.character_id != e.attacker_character_id
+                    AND (%(character_filter)s)
+                    %(time_filter)s
+                GROUP BY
+                    1, 2
+            )
+            SELECT
+                p.attacker_id,
+                COALESCE(attacker.name, p.attacker_id::varchar) AS attacker,
+                p.victim_id,
+                COALESCE(victim.name, p.victim_id::varchar) AS victim,
+                SUM(p.kills) AS kills,
+                SUM(p.vehicle_kills) AS vehicle_kills
+            FROM pairs p
+                LEFT JOIN character_info attacker ON p.attacker_id = attacker.character_id
+                LEFT JOIN character_info victim ON p.victim_id = victim.character_id
+            GROUP BY
+                p.attacker_id,
+                attacker.name,
+                p.victim_id,
+                victim.name
+        """ % {"character_filter": character_filter, "time_filter": time_filter}
+
+        return self.db.query(sql, params)
+
+    def get_character(self, character_id):
+        sql = """
+            SELECT
+                c.character_id,
+                COALESCE(c.name, c.character_id::varchar) AS name,
+                COALESCE(o.alias, o.name, c.outfit_id::varchar) AS outfit
+            FROM character_info c
+                LEFT JOIN outfit_info o ON c.outfit_id = o.outfit_id
+            WHERE
+                c.character_id = :character_id
+        """
+
+        return self.db.query_single(sql, {"character_id": character_id})
+
+    def get_character_matches(self, character_id):
+        # served by the character_id index on the rollup, see schema.MATCH_CHARACTER_ROLLUP_INDEX
+        sql = """
+            SELECT
+                r.world_id,
+                r.zone_id,
+                r.kills,
+                r.deaths,
+                r.vehicle_kills,
+                r.vehicles_lost,
+                r.experience_actions
+            FROM match_character_rollup r
+            WHERE
+                r.character_id = :character_id
+            ORDER BY
+                r.zone_id DESC
+        """
+
+        return self.db.query(sql, {"character_id": character_id})
+
+    def get_character_kills_by_weapon(self, character_id, world_id, zone_id):
+        params = {"character_id": character_id}
+
+        # attacker_character_id leads the filter so only this player's rows are read
+        sql = """
+            SELECT
+                COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
+                attacker_vehicle_info.name AS vehicle_name,
+                COUNT(1) AS kills,
+                SUM(e.is_headshot) AS num_headshot
+            FROM death_event e
+                LEFT JOIN weapon_info w ON e.attacker_weapon_id = w.item_id
+                LEFT JOIN vehicle_info attacker_vehicle_info ON e.attacker_vehicle_id = attacker_vehicle_info.vehicle_id
+            WHERE
+                e.attacker_character_id = :character_id
+                AND e.character_id != e.attacker_character_id
+        """
+
+        sql += get_character_match_filter(world_id, zone_id, params)
+        sql += """
+            GROUP BY
+                e.attacker_weapon_id,
+                w.name,
+                attacker_vehicle_info.name
+            ORDER BY
+                kills DESC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_character_deaths_by_weapon(self, character_id, world_id, zone_id):
+        params = {"character_id": character_id}
+
+        sql = """
+            SELECT
+                COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
+                COALESCE(attacker_outfit.alias, attacker.outfit_id::varchar) AS attacker_outfit,
+                COUNT(1) AS deaths
+            FROM death_event e
+                LEFT JOIN weapon_info w ON e.attacker_weapon_id = w.item_id
+                LEFT JOIN character_info attacker ON e.attacker_character_id = attacker.character_id
+                LEFT JOIN outfit_info attacker_outfit ON attacker.outfit_id = attacker_outfit.outfit_id
+            WHERE
+                e.character_id = :character_id
+        """
+
+        sql += get_character_match_filter(world_id, zone_id, params)
+        sql += """
+            GROUP BY
+                e.attacker_weapon_id,
+                w.name,
+                attacker.outfit_id,
+                attacker_outfit.alias
+            ORDER BY
+                deaths DESC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_character_vehicles_lost(self, character_id, world_id, zone_id):
+        params = {"character_id": character_id}
+
+        sql = """
+            SELECT
+                vehicle_info.name AS vehicle_name,
+                COALESCE(w.name, e.attacker_weapon_id::varchar) AS weapon,
+                COUNT(1) AS lost
+            FROM vehicle_destroy_event e
+                LEFT JOIN vehicle_info ON e.character_vehicle_id = vehicle_info.vehicle_id
+                LEFT JOIN weapon_info w ON e.attacker_weapon_id = w.item_id
+            WHERE
+                e.character_id = :character_id
+        """
+
+        sql += get_character_match_filter(world_id, zone_id, params)
+        sql += """
+            GROUP BY
+                vehicle_info.name,
+                e.attacker_weapon_id,
+                w.name
+            ORDER BY
+                lost DESC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_character_loadouts(self, character_id, world_id, zone_id):
+        params = {"character_id": character_id, "world_id": world_id, "zone_id": zone_id}
+
+        # the loadout a player had whenever they killed or died, in both cases read through a character index
+        sql = """
+            SELECT
+                e.timestamp,
+                'kill' AS event,
+                COALESCE(l.profile_type, e.attacker_loadout_id::varchar) AS loadout,
+                v.name AS vehicle_name
+            FROM death_event e
+                LEFT JOIN loadout_info l ON e.attacker_loadout_id = l.loadout_id
+                LEFT JOIN vehicle_info v ON e.attacker_vehicle_id = v.vehicle_id
+            WHERE
+                e.attacker_character_id = :character_id
+                AND e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.character_id != e.attacker_character_id
+            UNION ALL
+            SELECT
+                e.timestamp,
+                'death' AS event,
+                COALESCE(l.profile_type, e.character_loadout_id::varchar) AS loadout,
+                NULL AS vehicle_name
+            FROM death_event e
+                LEFT JOIN loadout_info l ON e.character_loadout_id = l.loadout_id
+            WHERE
+                e.character_id = :character_id
+                AND e.world_id = :world_id
+                AND e.zone_id = :zone_id
+            ORDER BY
+                timestamp ASC
+        """
+
+        return self.db.query(sql, params)
+
+    def get_event_log(self, world_id, zone_id, after_timestamp, after_kind, after_id1, after_id2, after_id3, after_row_id, limit):
+        """Kills, vehicle destroys and captures in order, the page after the key (timestamp, kind, id1, id2, id3, row_id).
+
+        The ids of each kind are the rest of its table's key, see schema.EVENT_KEYS, which doesn't identify an event,
+        so the row's ctid (as text) breaks the ties. The event tables are insert only, so it is stable while paging.
+        """
+
+        params = {"world_id": world_id, "zone_id": zone_id, "limit": limit}
+        after = (after_timestamp, after_kind, after_id1, after_id2, after_id3, after_row_id)
+        for kind, name in enumerate(["deaths", "vehicles", "captures"]):
+            names = ["%s_%s" % (name, column) for column in ["timestamp", "id1", "id2", "id3", "row_id"]]
+            params.update(zip(names, get_event_log_bound(kind, after)))
+
+        # every table is sought to the key with its key index and only a page is read from each,
+        # names are only joined for the rows of the merged page
+        sql = """
+            WITH deaths AS (
+                SELECT
+                    e.timestamp, 0 AS kind, e.character_id AS id1, e.attacker_character_id AS id2, 0 AS id3, e.ctid AS row_id,
+                    e.attacker_character_id, e.character_id, e.attacker_weapon_id, e.attacker_vehicle_id,
+                    NULL::bigint AS vehicle_id, NULL::bigint AS facility_id, NULL::bigint AS outfit_id
+                FROM death_event e
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND (e.timestamp, e.character_id, e.attacker_character_id, e.ctid) > (:deaths_timestamp, :deaths_id1, :deaths_id2, CAST(:deaths_row_id AS tid))
+                ORDER BY
+                    e.timestamp, e.character_id, e.attacker_character_id, e.ctid
+                LIMIT :limit
+            ), vehicles AS (
+                SELECT
+                    e.timestamp, 1 AS kind, e.character_id AS id1, e.attacker_character_id AS id2, e.character_vehicle_id AS id3, e.ctid AS row_id,
+                    e.attacker_character_id, e.character_id, e.attacker_weapon_id, e.attacker_vehicle_id,
+                    e.character_vehicle_id AS vehicle_id, NULL::bigint AS facility_id, NULL::bigint AS outfit_id
+                FROM vehicle_destroy_event e
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND (e.timestamp, e.character_id, e.attacker_character_id, e.character_vehicle_id, e.ctid)
+                        > (:vehicles_timestamp, :vehicles_id1, :vehicles_id2, :vehicles_id3, CAST(:vehicles_row_id AS tid))
+                ORDER BY
+                    e.timestamp, e.character_id, e.attacker_character_id, e.character_vehicle_id, e.ctid
+                LIMIT :limit
+            ), captures AS (
+                SELECT
+                    e.timestamp, 2 AS kind, e.facility_id AS id1, 0 AS id2, 0 AS id3, e.ctid AS row_id,
+                    NULL::bigint AS attacker_character_id, NULL::bigint AS character_id, NULL::bigint AS attacker_weapon_id, NULL::bigint AS attacker_vehicle_id,
+                    NULL::bigint AS vehicle_id, e.facility_id, e.outfit_id
+                FROM facility_control_event e
+                WHERE
+                    e.world_id = :world_id
+                    AND e.zone_id = :zone_id
+                    AND e.new_faction_id != 4
+                    AND (e.timestamp, e.facility_id, e.ctid) > (:captures_timestamp, :captures_id1, CAST(:captures_row_id AS tid))
+                ORDER BY
+                    e.timestamp, e.facility_id, e.ctid
+                LIMIT :limit
+            ), page AS (
+                SELECT * FROM deaths
+                UNION ALL
+                SELECT * FROM vehicles
+                UNION ALL
+                SELECT * FROM captures
+                ORDER BY
+                    timestamp, kind, id1, id2, id3, row_id
+                LIMIT :limit
+            )
+            SELECT
+                p.timestamp,
+                p.kind,
+                p.id1,
+                p.id2,
+                p.id3,
+                p.row_id::text AS row_id,
+                CASE p.kind WHEN 0 THEN 'Kill' WHEN 1 THEN 'Vehicle Destroyed' ELSE 'Capture' END AS event,
+                COALESCE(attacker.name, p.attacker_character_id::varchar) AS attacker,
+                COALESCE(attacker_outfit.alias, attacker.outfit_id::varchar) AS attacker_outfit,
+                COALESCE(victim.name, p.character_id::varchar) AS victim,
+                COALESCE(victim_outfit.alias, victim.outfit_id::varchar) AS victim_outfit,
+                COALESCE(w.name, p.attacker_weapon_id::varchar) AS weapon,
+                attacker_vehicle.name AS attacker_vehicle,
+                vehicle.name AS vehicle,
+                f.name AS facility,
+                COALESCE(o.alias, o.name, p.outfit_id::varchar) AS outfit
+            FROM page p
+                LEFT JOIN character_info attacker ON p.attacker_character_id = attacker.character_id
+                LEFT JOIN outfit_info attacker_outfit ON attacker.outfit_id = attacker_outfit.outfit_id
+                LEFT JOIN character_info victim ON p.character_id = victim.character_id
+                LEFT JOIN outfit_info victim_outfit ON victim.outfit_id = victim_outfit.outfit_id
+                LEFT JOIN weapon_info w ON p.attacker_weapon_id = w.item_id
+                LEFT JOIN vehicle_info attacker_vehicle ON p.attacker_vehicle_id = attacker_vehicle.vehicle_id
+                LEFT JOIN vehicle_info vehicle ON p.vehicle_id = vehicle.vehicle_id
+                LEFT JOIN facility_info f ON p.facility_id = f.facility_id
+                LEFT JOIN outfit_info o ON p.outfit_id = o.outfit_id
+            ORDER BY
+                p.timestamp, p.kind, p.id1, p.id2, p.id3, p.row_id
+        """
+
+        return self.db.query(sql, params)
+
+
+# sorts before the ctid of every row, whose offsets start at 1
+FIRST_ROW_ID = "(0,0)"
+
+
+def get_event_log_bound(kind, after):
+    # the key of an event log kind is sought with a row comparison on its table's key columns, the kind itself isn't a column,
+    # so kinds sorting before the cursor's kind start at the next second and those after it at the start of the same second
+    timestamp, after_kind, id1, id2, id3, row_id = after
+    if kind < after_kind:
+        return timestamp + 1, -1, -1, -1, FIRST_ROW_ID
+    elif kind == after_kind:
+        return timestamp, id1, id2, id3, row_id
+    else:
+        return timestamp, -1, -1, -1, FIRST_ROW_ID
+
+
+def get_character_match_filter(world_id, zone_id, params):
+    # a single match, or every outfit wars match when none is selected
+    if not zone_id:
+        return " AND e.zone_id > 1000"
+
+    params["world_id"] = world_id
+    params["zone_id"] = zone_id
+    return " AND e.world_id = :world_id AND e.zone_id = :zone_id"
+
+
+def get_time_filter(params, start, end):
+    # the whole match without bounds, otherwise the events of [start, end)
+    if start is None:
+        return ""
+
+    params["start"] = start
+    params["end"] = end
+    return "AND e.timestamp >= :start AND e.timestamp < :end"
+
+
+def get_facility_intervals_cte():
+    # every capture lasts until the next capture of the same facility, LEAD() pairs them up in the scan of the match's events
+    return """
+        intervals AS (
+            SELECT
+                e.facility_id,
+                e.new_faction_id,
+                e.outfit_id,
+                e.timestamp AS start_timestamp,
+                COALESCE(
+                    LEAD(e.timestamp) OVER (PARTITION BY e.facility_id ORDER BY e.timestamp),
+                    MAX(e.timestamp) OVER () + :open_seconds
+                ) AS finish_timestamp,
+                LEAD(e.timestamp) OVER (PARTITION BY e.facility_id ORDER BY e.timestamp) IS NULL AS is_open
+            FROM facility_control_event e
+            WHERE
+                e.world_id = :world_id
+                AND e.zone_id = :zone_id
+                AND e.new_faction_id != 4
+        )
+    """
+
+
+def get_minute_column(by_minute):
+    # per minute groups are the basis of the time window prefix sums, see windows.PrefixSums
+    return "e.timestamp / 60 AS minute," if by_minute else ""
+
+
+def get_minute_group(by_minute):
+    return "minute," if by_minute else ""
@@ -0,0 +1,129 @@
+import cProfile
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+
+import config
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.callback = None
+        self.phases = defaultdict(float)
+        self.profiler = None
+
+
+def _current():
+    if flask.has_request_context():
+        return flask.g.get("timings")
+    return None
+
+
+def record(phase_name, seconds):
+    timings = _current()
+    if timings:
+        timings.phases[phase_name] += seconds
+
+
+@contextmanager
+def phase(phase_name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase_name, time.perf_counter() - start)
+
+
+def instrument(callback_name):
+    """Records the time spent in a Dash callback, broken down into the phases recorded while it runs."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            metrics.inc("callback_invocations_total", labels={"callback": callback_name})
+
+            timings = _current()
+            if timings:
+                timings.callback = callback_name
+
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record("callback", time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_phases(timings, total):
+    phases = dict(timings.phases)
+    callback = phases.pop("callback", 0.0)
+    sql = phases.get("sql", 0.0)
+    figure = phases.get("figure", 0.0)
+
+    # python work in the callback that is neither SQL nor figure construction is DataFrame and row handling
+    phases["dataframe"] = max(callback - sql - figure, 0.0)
+    # dash serializes the response after the callback returns
+    phases["serialize"] = max(total - callback, 0.0)
+    phases["total"] = total
+
+    return phases
+
+
+def init_app(server):
+    sample_rate = config.PROFILE_SAMPLE_RATE()
+    profile_dir = config.PROFILE_DIR()
+
+    @server.before_request
+    def start_timings():
+        if not flask.request.path.endswith("_dash-update-component"):
+            return
+
+        timings = flask.g.timings = RequestTimings()
+        if sample_rate and random.random() < sample_rate:
+            timings.profiler = cProfile.Profile()
+            timings.profiler.enable()
+
+    @server.after_request
+    def finish_timings(response):
+        timings = _current()
+        if not timings:
+            return response
+
+        phases = get_phases(timings, time.perf_counter() - timings.start)
+        callback = timings.callback or "unknown"
+
+        response.headers["Server-Timing"] = ", ".join("%s;dur=%.1f" % (name, seconds * 1000) for name, seconds in phases.items())
+        for name, seconds in phases.items():
+            metrics.observe("callback_phase_seconds", seconds, labels={"callback": callback, "phase": name})
+
+        return response
+
+    # after_request is skipped when the callback raises, teardown always runs so the profiler is never left enabled
+    @server.teardown_request
+    def finish_profile(exception):
+        timings = _current()
+        if not timings or not timings.profiler:
+            return
+
+        timings.profiler.disable()
+
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, "%s-%d-%d.prof" % (timings.callback or "unknown", int(time.time() * 1000), os.getpid()))
+        try:
+            timings.profiler.dump_stats(path)
+        except OSError:
+            logger.exception("could not write profile to %s" % path)
@@ -1,3 +1,7 @@
+import importlib
+import threading
+
+
 def show_name(x):
     return x["name"]
 
@@ -28,3 +32,20 @@ def get_single_value(coll, default):
 
 def format_for_dropdown(label_key, value_key, data):
     return list(map(lambda x: {"label": x[label_key], "value": x[value_key]}, data))
+
+
+class LazyModule:
+    """Stands in for a module that is only imported when one of its attributes is first used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attr)
@@ -0,0 +1,95 @@
+import decimal
+
+import cache
+import util
+
+
+np = util.LazyModule("numpy")
+
+
+# service method -> columns that are summed, every other column (except minute) identifies a group
+VALUE_COLUMNS = {
+    "get_vehicle_kills": ["num"],
+    "get_infantry_stats": ["num"],
+    "get_kills_by_weapon": ["kills", "num_headshot", "team_kills", "suicides"],
+    "get_vehicle_deaths_by_weapon": ["deaths", "team_deaths", "suicides"],
+}
+
+
+class PrefixSums:
+    """Cumulative per-minute counts of each group, so the totals of any time window are two lookups away."""
+
+    def __init__(self, rows, value_columns):
+        self.value_columns = value_columns
+        self.groups = {}
+        self.first_minute = min((row["minute"] for row in rows), default=0)
+        num_minutes = max((row["minute"] for row in rows), default=self.first_minute) - self.first_minute + 1
+
+        columns = None
+        key_columns = None
+        counts = []
+        for row in rows:
+            if columns is None:
+                columns = [column for column in row.keys() if column != "minute"]
+                key_columns = [column for column in columns if column not in value_columns]
+
+            key = tuple(row[column] for column in key_columns)
+            index = self.groups.get(key)
+            if index is None:
+                index = self.groups[key] = len(counts)
+                counts.append(np.zeros((num_minutes, len(value_columns)), dtype=np.int64))
+
+            counts[index][row["minute"] - self.first_minute] += [to_int(row[column]) for column in value_columns]
+
+        self.columns = columns or []
+        self.key_columns = key_columns or []
+        # leading zero row, so the sum of minutes [a, b) is cumulative[b] - cumulative[a]
+        self.cumulative = np.zeros((len(counts), num_minutes + 1, len(value_columns)), dtype=np.int64)
+        if counts:
+            np.cumsum(np.stack(counts), axis=1, out=self.cumulative[:, 1:])
+
+    def window(self, start_minute, end_minute):
+        """Rows shaped like the service's whole match rows, with the totals of the minutes [start_minute, end_minute)."""
+
+        num_minutes = self.cumulative.shape[1] - 1
+        start = min(max(start_minute - self.first_minute, 0), num_minutes)
+        end = min(max(end_minute - self.first_minute, start), num_minutes)
+        totals = self.cumulative[:, end] - self.cumulative[:, start]
+
+        rows = []
+        for key, index in self.groups.items():
+            if not totals[index].any():
+                continue
+
+            values = dict(zip(self.key_columns, key))
+            values.update(zip(self.value_columns, totals[index].tolist()))
+            # same column order as the service rows
+            rows.append({column: values[column] for column in self.columns})
+
+        return rows
+
+
+def to_int(value):
+    # SUM() of integers is numeric in postgres
+    if isinstance(value, decimal.Decimal):
+        return int(value)
+    return value or 0
+
+
+class MatchWindows:
+    """Per match prefix sums of the aggregate panel queries, rebuilt whenever the match receives new events."""
+
+    def __init__(self, service, match_versions, max_size):
+        self.service = service
+        self.match_versions = match_versions
+        self.cache = cache.TTLCache(max_size=max_size)
+
+    def get(self, method, world_id, zone_id, character_ids, start_minute, end_minute):
+        version = self.match_versions.get_version(world_id, zone_id)
+        key = (method, str(world_id), str(zone_id), tuple(sorted(character_ids or [])), version)
+
+        def build():
+            rows = getattr(self.service, method)(world_id, zone_id, character_ids, by_minute=True)
+            return PrefixSums(rows, VALUE_COLUMNS[method])
+
+        return self.cache.get_or_compute(key, build).window(start_minute, end_minute)
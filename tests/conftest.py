@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import config
+from db import DB
+
+
+# required by the app so a deployment without it fails fast, the tests only connect to local databases
+os.environ.setdefault("DB_IP_TYPE", "PUBLIC")
+
+
+def connect(database=None, **kwargs):
+    db = DB()
+    db.connect(
+        config.DB_DRIVERNAME(),
+        config.DB_USERNAME(),
+        config.DB_PASSWORD(),
+        database or config.DB_NAME(),
+        config.DB_HOST(),
+        config.DB_IP_TYPE(),
+        **kwargs)
+    return db
+
+
+@pytest.fixture(scope="session")
+def db():
+    """The local Postgres configured with the DB_* variables, the tests using it are skipped without one."""
+
+    if not config.DB_HOST():
+        pytest.skip("DB_HOST is not set")
+
+    db = connect()
+    try:
+        db.verify_connection()
+    except Exception as e:
+        pytest.skip("no local Postgres: %s" % e)
+
+    return db
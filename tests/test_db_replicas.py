@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import config
+from db import SqlException
+
+from conftest import connect
+
+
+# a port nothing listens on, standing in for a replica that went down
+DOWN_HOST = "127.0.0.1:1"
+
+PORT_SQL = "SELECT current_setting('port') AS port"
+
+
+@pytest.fixture
+def replica_db(db):
+    if not config.DB_REPLICA_HOSTS():
+        pytest.skip("DB_REPLICA_HOSTS is not set")
+
+    return connect(replica_hosts=config.DB_REPLICA_HOSTS(), health_check_interval=0.1)
+
+
+def port_of(host):
+    return host.rsplit(":", 1)[1] if ":" in host else "5432"
+
+
+def take_down(db, replica):
+    drivername, username, password, database, host, ip_type, replica_hosts, health_check_interval = db.connect_args
+    engine = replica.engine
+    replica.engine = db._create_engine(drivername, username, password, database, DOWN_HOST, ip_type)
+    return engine
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_reads_go_to_the_replica_with_the_least_outstanding_requests(replica_db):
+    if len(replica_db.replicas) < 2:
+        pytest.skip("needs two replicas")
+
+    busy, idle = replica_db.replicas[:2]
+    busy.outstanding += 1
+    try:
+        assert replica_db.query_single(PORT_SQL)["port"] == port_of(idle.host)
+    finally:
+        busy.outstanding -= 1
+
+    assert busy.outstanding == 0 and idle.outstanding == 0
+
+
+def test_health_check_drops_and_readds_a_replica(replica_db):
+    replica = replica_db.replicas[0]
+    engine = take_down(replica_db, replica)
+    assert wait_for(lambda: not replica.healthy)
+
+    replica.engine = engine
+    assert wait_for(lambda: replica.healthy)
+
+
+def test_connection_errors_fall_back_to_the_primary(replica_db):
+    engines = [take_down(replica_db, replica) for replica in replica_db.replicas]
+
+    try:
+        assert replica_db.query_single(PORT_SQL)["port"] == port_of(config.DB_HOST())
+        assert not all(replica.healthy for replica in replica_db.replicas)
+    finally:
+        for replica, engine in zip(replica_db.replicas, engines):
+            replica.engine = engine
+
+
+def test_query_errors_are_not_retried_on_the_primary(replica_db):
+    with pytest.raises(SqlException):
+        replica_db.query_single("SELECT 1 / 0 AS one")
+
+    assert all(replica.healthy for replica in replica_db.replicas)
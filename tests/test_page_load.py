@@ -0,0 +1,209 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+from collections import Counter
+
+import pytest
+from dash import no_update
+from dash.exceptions import PreventUpdate
+
+import main
+
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets")
+
+HYDRATED_URL = "http://localhost/?world_id=10&match_id=1001&character_ids=5428010618015189713"
+
+# loads the assets like the browser does and calls one clientside function with json arguments
+CLIENTSIDE_RUNNER = """
+global.window = {dash_clientside: {no_update: {"__no_update__": true}}};
+for (const path of %s) {
+    require(path);
+}
+const call = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const result = window.dash_clientside[call.namespace][call.function](...call.args);
+process.stdout.write(JSON.stringify(result === undefined ? null : result));
+"""
+
+
+class EmptyRow(dict):
+    # the aggregates of an empty match, e.g. MAX(timestamp)
+    def __missing__(self, key):
+        return None
+
+
+class FakeDB:
+    def query(self, sql, params=None, db_conn=None, timeout=None):
+        return []
+
+    def query_single(self, sql, params=None, db_conn=None, timeout=None):
+        return EmptyRow()
+
+
+class CountingService:
+    def __init__(self, service):
+        self.service = service
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.service, name)
+        if not name.startswith("get_"):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+def walk(component):
+    yield component
+    children = getattr(component, "children", None)
+    if children is None:
+        return
+    for child in children if isinstance(children, (list, tuple)) else [children]:
+        if hasattr(child, "to_plotly_json"):
+            yield from walk(child)
+
+
+def get_layout_props(layout):
+    props = {}
+    for component in walk(layout):
+        id = getattr(component, "id", None)
+        if not id:
+            continue
+        # the renderer calls callbacks with None for the properties the layout leaves unset
+        for prop in component.available_properties:
+            props[(id, prop)] = getattr(component, prop, None)
+    return props
+
+
+def dependency_ids(dependencies):
+    return [(d["id"], d["property"]) for d in dependencies]
+
+
+class Callback:
+    def __init__(self, spec, function=None):
+        self.outputs = [(o.split(".")[0], o.split(".")[1]) for o in spec["output"].strip(".").split("...")]
+        self.inputs = dependency_ids(spec["inputs"])
+        self.state = dependency_ids(spec["state"])
+        self.prevent_initial_call = spec.get("prevent_initial_call")
+        self.clientside_function = spec.get("clientside_function")
+        self.background = bool(spec.get("long"))
+        self.function = function
+        self.name = function.__name__ if function else "%(namespace)s.%(function_name)s" % self.clientside_function
+
+
+def get_callbacks():
+    callbacks = []
+    for spec in main.app._callback_list:
+        if spec.get("clientside_function"):
+            callbacks.append(Callback(spec))
+        else:
+            function = main.app.callback_map[spec["output"]]["callback"].__wrapped__
+            callbacks.append(Callback(spec, function))
+
+    # clientside callbacks only matter here when the server callbacks depend on what they output,
+    # the others use browser apis (EventSource, IntersectionObserver) that aren't there outside of a browser
+    relevant = {output for callback in callbacks if callback.function for output in callback.inputs}
+    changed = True
+    while changed:
+        changed = False
+        for callback in callbacks:
+            if not callback.function and callback.name not in relevant and set(callback.outputs) & relevant:
+                relevant.add(callback.name)
+                relevant.update(callback.inputs)
+                changed = True
+
+    return [callback for callback in callbacks if callback.function or callback.name in relevant]
+
+
+def run_clientside(callback, args):
+    paths = sorted(glob.glob(os.path.join(ASSETS_DIR, "*.js")))
+    call = {"namespace": callback.clientside_function["namespace"], "function": callback.clientside_function["function_name"], "args": args}
+    result = subprocess.run(["node", "-e", CLIENTSIDE_RUNNER % json.dumps(paths)], input=json.dumps(call),
+                            capture_output=True, text=True, check=True)
+    result = json.loads(result.stdout)
+    return no_update if result == {"__no_update__": True} else result
+
+
+def run(callback, props):
+    args = [props.get(dependency) for dependency in callback.inputs + callback.state]
+    if callback.clientside_function:
+        return run_clientside(callback, args)
+
+    if callback.background:
+        args.insert(0, lambda message: None)
+    return callback.function(*args)
+
+
+def load_page(props, callbacks):
+    """Replays the renderer's initial load: every callback whose inputs are in the layout is requested at once, except for those
+    waiting on the outputs of another pending callback, and every output that changes requests the callbacks taking it as an input."""
+
+    def is_upstream(other, callback):
+        return other is not callback and set(other.outputs) & set(callback.inputs)
+
+    invocations = Counter()
+    pending = [callback for callback in callbacks
+               if not callback.prevent_initial_call and all(dependency in props for dependency in callback.inputs)]
+
+    while pending:
+        # requested together, like the renderer does, so none of them sees the outputs of the others
+        ready = [callback for callback in pending if not any(is_upstream(other, callback) for other in pending)] or pending[:1]
+        pending = [callback for callback in pending if callback not in ready]
+
+        for callback in ready:
+            invocations[callback.name] += 1
+            try:
+                result = run(callback, props)
+            except PreventUpdate:
+                continue
+
+            results = result if len(callback.outputs) > 1 else [result]
+            for output, value in zip(callback.outputs, results):
+                if value is no_update:
+                    continue
+                props[output] = value
+                for dependent in callbacks:
+                    if output in dependent.inputs and dependent not in pending:
+                        pending.append(dependent)
+
+    return invocations
+
+
+@pytest.fixture
+def service(monkeypatch):
+    counting = CountingService(main.service.service.__class__(FakeDB()))
+    monkeypatch.setattr(main.service, "service", counting)
+    for cache in (main.world_list_cache, main.match_aggregates_cache, main.match_versions.cache):
+        cache.clear()
+    return counting
+
+
+def test_each_data_query_runs_once_per_page_load(service):
+    if not shutil.which("node"):
+        pytest.skip("the clientside callbacks need node")
+
+    callbacks = get_callbacks()
+    with main.app.server.test_request_context("/_dash-layout", headers={"Referer": HYDRATED_URL}):
+        props = get_layout_props(main.serve_layout())
+        assert props[("match_state", "data")]["zone_id"] == 1001
+
+        invocations = load_page(props, callbacks)
+
+    # every panel callback driven by match_state ran exactly once
+    panels = [callback.name for callback in callbacks if ("match_state", "data") in callback.inputs]
+    assert panels
+    assert {name: invocations[name] for name in panels} == {name: 1 for name in panels}
+
+    # the dropdowns filling in never rewrote match_state
+    assert all(count == 1 for count in invocations.values()), invocations
+
+    # and no query ran twice
+    assert service.calls["get_match_aggregates"] == 1
+    assert service.calls["get_outfit_stats"] == 1
+    assert all(count == 1 for count in service.calls.values()), service.calls
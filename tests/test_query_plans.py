@@ -0,0 +1,334 @@
+import json
+import random
+from collections import defaultdict
+
+import pytest
+
+import config
+import ingest
+import schema
+from conftest import connect
+from service import Service
+
+
+EVENT_TABLE_NAMES = {table.name for table in ingest.EVENT_TABLES.values()}
+
+# joined by the queries, filled by the census importer and not by the ingester, with the columns the queries read
+INFO_TABLES = {
+    "world_info": "world_id INTEGER PRIMARY KEY, name TEXT",
+    "character_info": "character_id BIGINT PRIMARY KEY, name TEXT, outfit_id BIGINT, battle_rank INTEGER, is_prestige INTEGER, "
+                      "minutes_played BIGINT, created_at BIGINT, member_since BIGINT",
+    "outfit_info": "outfit_id BIGINT PRIMARY KEY, name TEXT, alias TEXT, faction_id INTEGER",
+    "faction_info": "faction_id INTEGER PRIMARY KEY, alias TEXT",
+    "weapon_info": "item_id BIGINT PRIMARY KEY, name TEXT",
+    "vehicle_info": "vehicle_id BIGINT PRIMARY KEY, name TEXT, category TEXT",
+    "facility_info": "facility_id BIGINT PRIMARY KEY, name TEXT",
+}
+
+CHARACTER_ID_COUNTS = [0, 1, 10, 50]
+
+# largest accepted ratio between the estimated and actual rows of an event table scan
+MAX_MISESTIMATE = 100
+
+# (service method, arguments for the sample match, indexes the plan has to use), "character_ids" is expanded to every count above
+CHECKS = [
+    ("get_match_list", lambda s: [s.world_id], []),
+    ("get_character_list", lambda s: [s.world_id, s.zone_id], []),
+    ("get_match_aggregates", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_vehicle_kills", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_infantry_stats", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_kills_by_weapon", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_vehicle_deaths_by_weapon", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_outfit_stats", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("has_match_roster", lambda s: [s.world_id, s.zone_id], []),
+    ("get_current_outfit_stats", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_loadouts", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_outfit_engagements", lambda s: [s.world_id, s.zone_id], []),
+    ("get_character_engagements", lambda s: [s.world_id, s.zone_id, "character_ids"], []),
+    ("get_facility_intervals", lambda s: [s.world_id, s.zone_id, config.TIMELINE_OPEN_SECONDS()], []),
+    ("get_facility_hold_totals", lambda s: [s.world_id, s.zone_id, config.TIMELINE_OPEN_SECONDS()], []),
+    ("get_live_deltas", lambda s: [s.world_id, s.zone_id, s.last_timestamp - 60, s.last_timestamp], []),
+    ("get_match_version", lambda s: [s.world_id, s.zone_id], []),
+    ("get_match_catalog", lambda s: [s.world_id, s.zone_id], []),
+    ("get_match_range", lambda s: [s.world_id, s.zone_id], []),
+    ("get_activity", lambda s: [s.world_id, s.zone_id, "character_ids", config.ACTIVITY_BUCKET_SECONDS()], []),
+    ("get_season_outfit_stats", lambda s: [s.world_id], []),
+    ("get_season_character_stats", lambda s: [s.world_id], []),
+    ("get_leaderboard", lambda s: [s.world_id, s.zone_id, "revives", config.LEADERBOARD_SIZE()], ["match_character_rollup_revives_idx"]),
+    ("get_character_matches", lambda s: [s.character_id], ["match_character_rollup_character_idx"]),
+    ("get_character_kills_by_weapon", lambda s: [s.character_id, s.world_id, s.zone_id], ["death_event_attacker_character_idx"]),
+    ("get_character_deaths_by_weapon", lambda s: [s.character_id, s.world_id, s.zone_id], ["death_event_character_idx"]),
+    ("get_character_vehicles_lost", lambda s: [s.character_id, s.world_id, s.zone_id], ["vehicle_destroy_event_character_idx"]),
+    ("get_character_loadouts", lambda s: [s.character_id, s.world_id, s.zone_id], ["death_event_attacker_character_idx", "death_event_character_idx"]),
+    ("get_event_log", lambda s: [s.world_id, s.zone_id, s.first_timestamp, 0, 0, 0, 0, "(0,0)", 100],
+     ["death_event_lookup_idx", "vehicle_destroy_event_lookup_idx", "facility_control_event_lookup_idx"]),
+]
+
+# event tables a query may scan sequentially, because it reads a large share of them where that is the better plan,
+# e.g. the outfit wars matches of a world are a fifth of its deaths in the seed below
+SEQ_SCANS_ALLOWED = {
+    "get_match_list": {"death_event"},
+}
+
+# several worlds, with continent traffic next to their outfit wars matches, so a match is a small share of every event table,
+# with ids no census world uses in case the test database is ever pointed at a real one
+SEED_WORLD_IDS = [9001, 9002, 9003, 9004, 9005]
+SEED_CONTINENT_ZONE_IDS = [2, 4, 6, 8]
+SEED_MATCHES_PER_WORLD = 4
+SEED_EVENTS_PER_ZONE = 2000
+SEED_RANDOM_SEED = 0
+SEED_VEHICLE_IDS = [1, 2, 4, 5, 7, 15]
+SEED_NUM_WEAPONS = 200
+SEED_NUM_FACILITIES = 20
+
+
+class Placeholder:
+    """The sample's attributes before it is seeded, enough to tell which methods take character_ids."""
+
+    def __getattr__(self, name):
+        return 0
+
+
+def get_cases():
+    for method, get_args, expected_indexes in CHECKS:
+        counts = CHARACTER_ID_COUNTS if "character_ids" in get_args(Placeholder()) else [None]
+        for count in counts:
+            label = method if count is None else "%s-%d" % (method, count)
+            yield pytest.param(method, get_args, expected_indexes, count, id=label)
+
+
+class ExplainDB:
+    """Stands in for DB in a Service, explaining every query instead of returning its rows."""
+
+    def __init__(self, db):
+        self.db = db
+        self.plans = []
+
+    def query(self, sql, params=None, db_conn=None, timeout=None):
+        self._explain(sql, params)
+        return []
+
+    def query_single(self, sql, params=None, db_conn=None, timeout=None):
+        self._explain(sql, params)
+        return defaultdict(lambda: None)
+
+    def _explain(self, sql, params):
+        # ANALYZE, since the estimates are checked against the actual row counts
+        row = self.db.query_single("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        plan = next(iter(row.values()))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.plans.append(plan[0]["Plan"])
+
+
+class Sample:
+    """The largest seeded match (and its players) the queries are explained for."""
+
+    def __init__(self, db, world_id):
+        sql = """
+            SELECT
+                c.world_id,
+                c.zone_id,
+                c.first_timestamp,
+                c.last_timestamp
+            FROM match_catalog c
+            WHERE
+                c.world_id = :world_id
+            ORDER BY
+                c.num_deaths DESC
+            LIMIT 1
+        """
+        match = db.query_single(sql, {"world_id": world_id})
+
+        self.world_id = match["world_id"]
+        self.zone_id = match["zone_id"]
+        self.first_timestamp = match["first_timestamp"]
+        self.last_timestamp = match["last_timestamp"]
+
+        sql = """
+            SELECT r.character_id
+            FROM match_character_rollup r
+            WHERE
+                r.world_id = :world_id
+                AND r.zone_id = :zone_id
+            ORDER BY
+                r.kills + r.deaths DESC,
+                r.character_id
+            LIMIT :limit
+        """
+        params = {"world_id": self.world_id, "zone_id": self.zone_id, "limit": max(CHARACTER_ID_COUNTS)}
+        self.all_character_ids = [row["character_id"] for row in db.query(sql, params)]
+        self.character_id = self.all_character_ids[0]
+
+    def character_ids(self, count):
+        return self.all_character_ids[:count]
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def check_plans(plans, expected_indexes, seq_scans_allowed):
+    problems = []
+    used_indexes = set()
+    for plan in plans:
+        for node in walk(plan):
+            if "Index Name" in node:
+                used_indexes.add(node["Index Name"])
+
+            relation = node.get("Relation Name")
+            if relation not in EVENT_TABLE_NAMES:
+                continue
+
+            if node["Node Type"] == "Seq Scan" and relation not in seq_scans_allowed:
+                problems.append("sequential scan on %s" % relation)
+
+            # actual rows are per loop, like the estimate
+            estimated = max(node.get("Plan Rows", 0), 1)
+            actual = max(node.get("Actual Rows", 0), 1)
+            if max(estimated, actual) / min(estimated, actual) > MAX_MISESTIMATE:
+                problems.append("%s on %s estimated %d rows, got %d" % (node["Node Type"], relation, estimated, actual))
+
+    for index in expected_indexes:
+        if index not in used_indexes:
+            problems.append("%s is not used" % index)
+
+    return problems
+
+
+def generate_events(rng, world_id, zone_id, start, character_ids, outfit_ids, num_events):
+    for i in range(num_events):
+        timestamp = start + i * 3600 // num_events
+        character_id, attacker_character_id = rng.sample(character_ids, 2)
+        kind = rng.random()
+        payload = {"world_id": world_id, "zone_id": zone_id, "timestamp": timestamp, "character_id": character_id,
+                   "attacker_character_id": attacker_character_id, "attacker_loadout_id": rng.randint(1, 32),
+                   "attacker_vehicle_id": rng.choice([0, 0, 0, 1, 2, 4, 15]), "attacker_weapon_id": rng.randint(1, SEED_NUM_WEAPONS)}
+
+        if kind < 0.4:
+            payload.update(event_name="Death", character_loadout_id=rng.randint(1, 32), is_headshot=rng.randint(0, 1))
+        elif kind < 0.55:
+            payload.update(event_name="VehicleDestroy", vehicle_id=rng.choice(SEED_VEHICLE_IDS))
+        elif kind < 0.99:
+            payload = {"event_name": "GainExperience", "world_id": world_id, "zone_id": zone_id, "timestamp": timestamp,
+                       "character_id": character_id, "experience_id": rng.choice(schema.EXPERIENCE_ACTION_IDS + (36, 54))}
+        else:
+            payload = {"event_name": "FacilityControl", "world_id": world_id, "zone_id": zone_id, "timestamp": timestamp,
+                       "facility_id": rng.randint(1, SEED_NUM_FACILITIES), "new_faction_id": rng.randint(1, 3), "outfit_id": rng.choice(outfit_ids)}
+
+        yield {"payload": payload}
+
+
+def generate_info(rng, world_id, base_timestamp, continent_outfits, match_outfits):
+    """The info table rows of a seeded world, continent_outfits and match_outfits map each outfit to its members."""
+
+    yield "world_info", (world_id, "World %d" % world_id)
+
+    for outfit_id, character_ids in list(continent_outfits.items()) + list(match_outfits.items()):
+        yield "outfit_info", (outfit_id, "Outfit %d" % outfit_id, "O%d" % (outfit_id % 100000), rng.randint(1, 3))
+        for character_id in character_ids:
+            created_at = base_timestamp - rng.randint(30, 3000) * 86400
+            yield "character_info", (character_id, "Character%d" % character_id, outfit_id, rng.randint(1, 120), rng.randint(0, 1),
+                                     rng.randint(60, 200000), created_at, rng.randint(created_at, base_timestamp))
+
+
+def seed(db):
+    """Loads a fixed synthetic set of worlds through the ingester, loading it again adds nothing since events are deduplicated."""
+
+    rng = random.Random(SEED_RANDOM_SEED)
+    base_timestamp = 1700000000
+
+    info = defaultdict(list)
+    info["faction_info"] = [(1, "VS"), (2, "NC"), (3, "TR"), (4, "NSO")]
+    info["weapon_info"] = [(item_id, "Weapon %d" % item_id) for item_id in range(1, SEED_NUM_WEAPONS + 1)]
+    info["vehicle_info"] = [(vehicle_id, "Vehicle %d" % vehicle_id, rng.choice(["Ground", "Air"])) for vehicle_id in SEED_VEHICLE_IDS]
+    info["facility_info"] = [(facility_id, "Facility %d" % facility_id) for facility_id in range(1, SEED_NUM_FACILITIES + 1)]
+
+    worlds = []
+    for world_index, world_id in enumerate(SEED_WORLD_IDS):
+        base_character_id = 5428000000000000000 + world_index * 10000000
+        base_outfit_id = 37500000000000000 + world_index * 1000
+
+        # continents are open around the clock with the whole population of the world
+        population = [base_character_id + i for i in range(2000)]
+        continent_outfits = {base_outfit_id + i: population[i::100] for i in range(100)}
+
+        # two outfits of 50 players each per match
+        match_outfits = {}
+        for match in range(SEED_MATCHES_PER_WORLD):
+            character_ids = [base_character_id + 1000000 + match * 1000 + i for i in range(100)]
+            match_outfits[base_outfit_id + 500 + match * 10] = character_ids[:50]
+            match_outfits[base_outfit_id + 500 + match * 10 + 1] = character_ids[50:]
+
+        worlds.append((world_id, population, continent_outfits, match_outfits))
+        for table, row in generate_info(rng, world_id, base_timestamp, continent_outfits, match_outfits):
+            info[table].append(row)
+
+    # before the events, so the ingester captures the match rosters from the character info
+    with db.get_connection() as db_conn:
+        db.exec("TRUNCATE %s" % ", ".join(INFO_TABLES), db_conn=db_conn)
+        for table, rows in info.items():
+            db.copy_rows(db_conn, table, [column.split()[0] for column in INFO_TABLES[table].split(", ")], rows)
+
+    ingester = ingest.Ingester(db, config.INGEST_FLUSH_SIZE(), config.INGEST_FLUSH_INTERVAL())
+    for world_id, population, continent_outfits, match_outfits in worlds:
+        for zone_id in SEED_CONTINENT_ZONE_IDS:
+            for event in generate_events(rng, world_id, zone_id, base_timestamp, population, list(continent_outfits),
+                                         SEED_EVENTS_PER_ZONE * SEED_MATCHES_PER_WORLD):
+                ingester.add(event)
+
+        match_outfit_ids = list(match_outfits)
+        for match in range(SEED_MATCHES_PER_WORLD):
+            outfit_ids = match_outfit_ids[match * 2:match * 2 + 2]
+            character_ids = match_outfits[outfit_ids[0]] + match_outfits[outfit_ids[1]]
+            for event in generate_events(rng, world_id, 1001 + match, base_timestamp + match * 7200, character_ids, outfit_ids,
+                                         SEED_EVENTS_PER_ZONE):
+                ingester.add(event)
+
+    ingester.flush()
+    if ingester.db_conn:
+        ingester.db_conn.close()
+
+
+@pytest.fixture(scope="module")
+def plan_db(db):
+    """A database of its own for the seeded worlds, created with the event and info tables on first use."""
+
+    name = "%s_query_plans" % config.DB_NAME()
+    if not db.query_single("SELECT EXISTS (SELECT FROM pg_database WHERE datname = :name) AS found", {"name": name})["found"]:
+        db.exec('CREATE DATABASE "%s"' % name)
+
+    plan_db = connect(database=name)
+    for table in ingest.EVENT_TABLES.values():
+        columns = ", ".join("%s BIGINT" % column for column in table.column_names())
+        plan_db.exec("CREATE TABLE IF NOT EXISTS %s (%s)" % (table.name, columns))
+    for table, columns in INFO_TABLES.items():
+        plan_db.exec("CREATE TABLE IF NOT EXISTS %s (%s)" % (table, columns))
+
+    return plan_db
+
+
+@pytest.fixture(scope="module")
+def sample(plan_db):
+    schema.create_schema(plan_db)
+
+    sql = "SELECT COUNT(1) AS num FROM match_catalog c WHERE c.world_id IN (%s)" % ", ".join(str(world_id) for world_id in SEED_WORLD_IDS)
+    if plan_db.query_single(sql)["num"] < len(SEED_WORLD_IDS) * SEED_MATCHES_PER_WORLD:
+        seed(plan_db)
+
+    # fresh statistics, otherwise the estimates are those of the tables before seeding
+    for table in sorted(EVENT_TABLE_NAMES) + list(INFO_TABLES) + ["match_catalog", "match_character_rollup", "match_outfit_rollup", "match_roster"]:
+        plan_db.exec("ANALYZE %s" % table)
+
+    return Sample(plan_db, SEED_WORLD_IDS[0])
+
+
+@pytest.mark.parametrize("method, get_args, expected_indexes, count", list(get_cases()))
+def test_query_plan(plan_db, sample, method, get_args, expected_indexes, count):
+    args = [sample.character_ids(count) if arg == "character_ids" else arg for arg in get_args(sample)]
+    explain_db = ExplainDB(plan_db)
+    getattr(Service(explain_db), method)(*args)
+
+    assert check_plans(explain_db.plans, expected_indexes, SEQ_SCANS_ALLOWED.get(method, set())) == []